@@ -0,0 +1,16 @@
+// Initiates replica set rs0 for docker-compose (run by the mongo-init service).
+// The primary gets a higher priority so it stays "mongo" after restarts.
+try {
+  rs.status();
+  print("Replica set rs0 already initiated.");
+} catch (e) {
+  rs.initiate({
+    _id: "rs0",
+    members: [
+      { _id: 0, host: "mongo:27017", priority: 2 },
+      { _id: 1, host: "mongo-secondary-1:27017", priority: 1 },
+      { _id: 2, host: "mongo-secondary-2:27017", priority: 1 },
+    ],
+  });
+  print("Replica set rs0 initiated.");
+}
@@ -0,0 +1,214 @@
+"""
+Admission control: per-route-class concurrency limits that adapt to latency, with bounded queues.
+
+Every /products request is put in a route class (see classify). A class admits requests up to
+its current limit; beyond that they wait in a FIFO queue for at most the class' queue timeout
+(503) and are refused right away when the queue is full (429), both with Retry-After. When a
+dependency slows down, completions exceed the class' latency target, its limit shrinks and the
+excess is refused within milliseconds instead of piling up on the event loop until everything
+times out.
+
+Cache-hit reads keep flowing because classes are isolated, and because the shed_first classes
+(list scans, writes, bulk) are also refused once the process as a whole is busy (see
+ADMISSION_SHED_FIRST_SHARE), keeping the remaining headroom for reads and stock reservations.
+/health, /metrics and the docs are never limited.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from .config import (
+    ADMISSION_ENABLED, ADMISSION_CLASSES, ADMISSION_BACKOFF_RATIO, ADMISSION_RETRY_AFTER_SECONDS,
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_SHED_FIRST_SHARE,
+)
+from .metrics import ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+
+# Rejection reason -> (status, detail)
+_REJECTIONS = {
+    "queue_full": (429, b'{"detail":"Too many concurrent requests, retry later"}'),
+    "queue_timeout": (503, b'{"detail":"Server overloaded, retry later"}'),
+    "shed": (503, b'{"detail":"Server overloaded, retry later"}'),
+}
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit for one route class, adjusted by AIMD on completion latency:
+    +1/limit per completion within the target while the limit is in use, and a single
+    multiplicative decrease per target interval when completions are slow or fail.
+    Not thread-safe; it is only touched from the event loop.
+    """
+
+    def __init__(
+        self, name: str, initial_limit: int, min_limit: int, max_limit: int,
+        target_latency_seconds: float, max_queue: int, queue_timeout_seconds: float, shed_first: bool,
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency_seconds = target_latency_seconds
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.shed_first = shed_first
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_backoff = 0.0
+        self._rejections = {reason: ADMISSION_REJECTIONS.labels(name, reason) for reason in _REJECTIONS}
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> Optional[str]:
+        """ Takes a slot, waiting in the queue if needed. Returns None when admitted, else the rejection reason. """
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            return "queue_full"
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.queue_timeout_seconds)
+            return None
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                return None # The slot was handed over just as the deadline passed
+            self._forget(future)
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release() # Admitted, but the client went away
+            else:
+                self._forget(future)
+            raise
+
+    def _forget(self, future: asyncio.Future):
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+    def release(self, service_seconds: Optional[float] = None, failed: bool = False):
+        """ Frees a slot; service_seconds (None when the request was cancelled) drives the limit. """
+        self.in_flight -= 1
+        if service_seconds is not None and self.target_latency_seconds > 0:
+            self._adapt(service_seconds, failed)
+        # Hand freed slots straight to the oldest waiters
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def _adapt(self, service_seconds: float, failed: bool):
+        if failed or service_seconds > self.target_latency_seconds:
+            now = time.monotonic()
+            # Concurrent slow completions are one signal, not one decrease each
+            if now - self._last_backoff >= self.target_latency_seconds:
+                self._last_backoff = now
+                self.limit = max(self.min_limit, self.limit * ADMISSION_BACKOFF_RATIO)
+        elif self.in_flight + 1 >= self.limit / 2: # Only grow a limit that is actually being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def reject(self, reason: str):
+        self._rejections[reason].inc()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": {reason: child.value for reason, child in self._rejections.items()},
+        }
+
+
+limiters: Dict[str, AdaptiveLimiter] = {name: AdaptiveLimiter(name, **settings) for name, settings in ADMISSION_CLASSES.items()}
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """ Route class of a request, or None for endpoints that are never limited. """
+    if not path.startswith("/products"):
+        return None
+    if path.startswith("/products:batch") or path == "/products/export":
+        return "bulk"
+    if method == "POST" and path.endswith(("/reserve", "/release")):
+        return "stock"
+    if method in ("GET", "HEAD"):
+        return "list" if path in ("/products", "/products/", "/products/search") else "read"
+    return "write"
+
+
+def _total_in_flight() -> int:
+    return sum(limiter.in_flight for limiter in limiters.values())
+
+
+def admission_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+async def _send_rejection(send, reason: str):
+    status_code, body = _REJECTIONS[reason]
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(ADMISSION_RETRY_AFTER_SECONDS).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionControlMiddleware:
+    """ Pure ASGI middleware; see the module docstring. """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        limiter = limiters.get(classify(scope["method"], scope["path"]))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        total = _total_in_flight()
+        if total >= ADMISSION_MAX_IN_FLIGHT or (
+            limiter.shed_first and total >= ADMISSION_MAX_IN_FLIGHT * ADMISSION_SHED_FIRST_SHARE
+        ):
+            reason = "shed"
+        else:
+            started = time.perf_counter()
+            reason = await limiter.acquire()
+            ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started)
+        if reason is not None:
+            limiter.reject(reason)
+            await _send_rejection(send, reason)
+            return
+
+        status_code = 500
+        admitted = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        service_seconds = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+            service_seconds = time.perf_counter() - admitted
+        except asyncio.CancelledError:
+            raise # Client gone: says nothing about the dependency's latency
+        except Exception:
+            service_seconds = time.perf_counter() - admitted
+            raise
+        finally:
+            limiter.release(service_seconds, failed=status_code >= 500)
@@ -0,0 +1,83 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Generic, List, Optional, Set, TypeVar
+
+from .config import BATCH_LOADER_WINDOW_SECONDS, BATCH_LOADER_MAX_SIZE
+from .metrics import BATCH_SIZE
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class Batcher(Generic[T, R]):
+    """
+    DataLoader-style request coalescing.
+
+    Every load(item) issued in the same event-loop tick (or within `window_seconds`) is
+    collected into one `batch_fn(items)` call, which must return one result per item in
+    order. Each caller gets its own result back; an exception fails the whole batch.
+    Items are not de-duplicated, so it also suits commands (writes, lock acquisition).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable[[List[T]], Awaitable[List[R]]],
+        max_batch_size: int = BATCH_LOADER_MAX_SIZE,
+        window_seconds: float = BATCH_LOADER_WINDOW_SECONDS,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_seconds
+        self._batch_size = BATCH_SIZE.labels(name)
+        self._items: List[T] = []
+        self._futures: List[asyncio.Future] = []
+        self._handle: Optional[asyncio.Handle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def load(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._items.append(item)
+        self._futures.append(future)
+        if len(self._items) >= self.max_batch_size:
+            self._dispatch()
+        elif self._handle is None:
+            # call_soon runs after every task already scheduled for this tick has had its turn
+            if self.window_seconds > 0:
+                self._handle = loop.call_later(self.window_seconds, self._dispatch)
+            else:
+                self._handle = loop.call_soon(self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        items, futures = self._items, self._futures
+        self._items, self._futures = [], []
+        if not items:
+            return
+        self._batch_size.observe(len(items))
+        task = asyncio.get_running_loop().create_task(self._run(items, futures))
+        self._tasks.add(task) # Keep a reference until it finishes
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items: List[T], futures: List[asyncio.Future]):
+        try:
+            results = await self.batch_fn(items)
+        except Exception as e:
+            for future in futures:
+                if not future.done(): # The caller may have been cancelled
+                    future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def group_indexes(items: List[Any], key: Callable[[Any], Any]):
+    """ Groups item positions by key(item), preserving order: [(group_key, [index, ...]), ...]. """
+    groups = {}
+    for index, item in enumerate(items):
+        groups.setdefault(key(item), []).append(index)
+    return list(groups.items())
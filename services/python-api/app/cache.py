@@ -0,0 +1,658 @@
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import quote
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+import redis.asyncio as aioredis
+
+from .config import (
+    get_redis_client, create_redis_pubsub_client, report_redis_error,
+    LOCAL_CACHE_ENABLED, LOCAL_CACHE_MAX_ENTRIES, LOCAL_CACHE_TTL_SECONDS,
+    CACHE_INVALIDATION_CHANNEL, CACHE_INVALIDATION_RETRY_SECONDS,
+    PRODUCT_LIST_CACHE_PREFIX, PRODUCT_LIST_GENERATION_KEY, LIST_GENERATION_LOCAL_TTL_SECONDS,
+    CACHE_EXPIRATION_SECONDS, CACHE_STALE_SECONDS, CACHE_STALE_WHILE_REVALIDATE, CACHE_EARLY_REFRESH_BETA,
+    CACHE_LOCK_SUFFIX, CACHE_LOCK_TIMEOUT_MS, CACHE_LOCK_WAIT_SECONDS, CACHE_LOCK_POLL_INTERVAL_SECONDS,
+    PRODUCT_CACHE_PREFIX, MONGO_PRIMARY_READ_AFTER_WRITE_SECONDS,
+    CACHE_TOMBSTONE_SECONDS,
+    PRODUCT_SEARCH_CACHE_PREFIX, SEARCH_CACHE_TTL_SECONDS,
+)
+from .batching import Batcher, group_indexes
+from .metrics import REDIS_GET_SECONDS, REDIS_SET_SECONDS, REDIS_LOCK_SECONDS, REDIS_INVALIDATE_SECONDS, record_cache_result
+
+logger = logging.getLogger(__name__)
+
+# Message published on CACHE_INVALIDATION_CHANNEL when every local entry should be dropped
+INVALIDATE_ALL = "*"
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache with a per-entry TTL.
+    Not thread-safe; it is only touched from the event loop.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key) # Mark as most recently used
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False) # Evict least recently used
+
+    def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+local_product_cache = LocalCache(LOCAL_CACHE_MAX_ENTRIES, LOCAL_CACHE_TTL_SECONDS)
+
+# Keys written (in this process or, via the invalidation channel, elsewhere) in the last
+# MONGO_PRIMARY_READ_AFTER_WRITE_SECONDS. Their cache misses are loaded from the primary.
+RECENT_WRITES_MAX_ENTRIES = 10000
+_recent_writes = LocalCache(RECENT_WRITES_MAX_ENTRIES, MONGO_PRIMARY_READ_AFTER_WRITE_SECONDS)
+
+# Only trust local entries while we are subscribed to the invalidation channel,
+# otherwise another pod could change a product without us hearing about it.
+_invalidation_subscribed = False
+
+
+def local_cache_active() -> bool:
+    return LOCAL_CACHE_ENABLED and _invalidation_subscribed
+
+
+def get_local(key: str) -> Optional[Any]:
+    if not local_cache_active():
+        return None
+    return local_product_cache.get(key)
+
+
+def set_local(key: str, value: Any, ttl_seconds: Optional[float] = None):
+    if local_cache_active():
+        local_product_cache.set(key, value, ttl_seconds)
+
+
+def _mark_written(keys):
+    for key in keys:
+        _recent_writes.set(key, True)
+
+
+def written_recently(key: str) -> bool:
+    """ True if key was invalidated by a write recently enough that a secondary may not have it yet. """
+    return _recent_writes.get(key) is not None or _recent_writes.get(INVALIDATE_ALL) is not None
+
+
+async def invalidate_keys(redis: Optional[aioredis.Redis], *keys: str, bump_list_generation: bool = True):
+    """
+    Deletes keys from Redis and from the local cache of every worker/replica,
+    and (by default) bumps the list generation so every cached page goes stale.
+    The DEL, INCR and PUBLISH go out in a single pipelined round trip.
+    Writes that know the new state of a product use write_through instead.
+    """
+    local_keys = list(keys)
+    if bump_list_generation:
+        local_keys.append(PRODUCT_LIST_GENERATION_KEY)
+    local_product_cache.delete(*local_keys)
+    _mark_written(local_keys)
+    if redis is None or not local_keys:
+        return
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            if keys:
+                pipe.delete(*keys)
+            if bump_list_generation:
+                pipe.incr(PRODUCT_LIST_GENERATION_KEY)
+            pipe.publish(CACHE_INVALIDATION_CHANNEL, ",".join(local_keys))
+            with REDIS_INVALIDATE_SECONDS.time():
+                await pipe.execute()
+    except Exception as e:
+        report_redis_error(e)
+        raise
+
+
+async def get_list_generation(redis: aioredis.Redis) -> int:
+    """ Current list cache generation, reused locally for a short time to save a round trip. """
+    generation = get_local(PRODUCT_LIST_GENERATION_KEY)
+    if generation is None:
+        raw_generation = await redis.get(PRODUCT_LIST_GENERATION_KEY)
+        generation = int(raw_generation) if raw_generation else 0
+        set_local(PRODUCT_LIST_GENERATION_KEY, generation, LIST_GENERATION_LOCAL_TTL_SECONDS)
+    return generation
+
+
+def get_product_list_cache_key(generation: int, **query) -> str:
+    """
+    Key for one page of the product list. Every query parameter that changes the
+    result is part of the key, so ?limit=10 and ?skip=500&limit=100 never collide.
+    """
+    shape = "&".join(f"{name}={query[name]}" for name in sorted(query))
+    return f"{PRODUCT_LIST_CACHE_PREFIX}{generation}:{shape}"
+
+
+def get_product_search_cache_key(generation: int, **query) -> str:
+    """ Like get_product_list_cache_key, for GET /products/search; string values are url-quoted. """
+    shape = "&".join(
+        f"{name}={quote(value, safe='') if isinstance(value, str) else value}"
+        for name, value in sorted(query.items())
+    )
+    return f"{PRODUCT_SEARCH_CACHE_PREFIX}{generation}:{shape}"
+
+
+def get_cache_family(key: str) -> str:
+    """ Key family used to split cache hit/miss metrics. """
+    if key.startswith(PRODUCT_LIST_CACHE_PREFIX):
+        return "list"
+    if key.startswith(PRODUCT_SEARCH_CACHE_PREFIX):
+        return "search"
+    if key.startswith(PRODUCT_CACHE_PREFIX):
+        return "product"
+    return "other"
+
+
+def get_cache_ttl(key: str) -> int:
+    """ Soft expiry for a key; search pages get a short one, everything else CACHE_EXPIRATION_SECONDS. """
+    if key.startswith(PRODUCT_SEARCH_CACHE_PREFIX):
+        return SEARCH_CACHE_TTL_SECONDS
+    return CACHE_EXPIRATION_SECONDS
+
+
+# A loader returns the serialized value for a key, or None if there is nothing to cache (e.g. 404)
+Loader = Callable[[], Awaitable[Optional[bytes]]]
+
+
+def make_etag(payload: bytes) -> str:
+    """ Strong ETag for a serialized payload, computed once when the entry is written. """
+    return f'"{hashlib.blake2b(payload, digest_size=16).hexdigest()}"'
+
+
+class CacheEntry(NamedTuple):
+    """
+    A cached payload plus the metadata needed for stale-while-revalidate and conditional GETs.
+    Stored in Redis as a hash: v (payload), exp (soft expiry, unix time), d (load time in seconds),
+    e (ETag of v).
+    """
+    payload: bytes
+    expires_at: float
+    delta: float
+    etag: str
+
+    def is_stale(self, now: float) -> bool:
+        return now >= self.expires_at
+
+    def should_refresh_early(self, now: float) -> bool:
+        # XFetch: refresh ahead of expiry with a probability that grows as expiry approaches
+        # and with how long the value takes to recompute, so refreshes are spread out.
+        if CACHE_EARLY_REFRESH_BETA <= 0:
+            return False
+        return now - self.delta * CACHE_EARLY_REFRESH_BETA * math.log(1.0 - random.random()) >= self.expires_at
+
+
+async def run_pipelined(
+    items: List[Tuple[Any, ...]],
+    queue_commands: Callable[[Any, Tuple[Any, ...]], None],
+    commands_per_item: int,
+    timer,
+) -> List[List[Any]]:
+    """
+    Queues the commands for every item (whose first element is its Redis client) and sends
+    them in one pipeline per client. Returns each item's replies, in item order.
+    """
+    replies_per_item: List[List[Any]] = [[] for _ in items]
+    for _client_id, indexes in group_indexes(items, lambda item: id(item[0])):
+        async with items[indexes[0]][0].pipeline(transaction=False) as pipe:
+            for index in indexes:
+                queue_commands(pipe, items[index])
+            with timer.time():
+                replies = await pipe.execute()
+        for position, index in enumerate(indexes):
+            replies_per_item[index] = replies[position * commands_per_item:(position + 1) * commands_per_item]
+    return replies_per_item
+
+
+async def _read_entries(items: List[Tuple[aioredis.Redis, str]]) -> List[Optional[CacheEntry]]:
+    def queue(pipe, item):
+        pipe.hmget(item[1], "v", "exp", "d", "e")
+
+    entries = []
+    for (row,) in await run_pipelined(items, queue, 1, REDIS_GET_SECONDS):
+        payload, expires_at, delta, etag = row
+        if payload is None:
+            entries.append(None)
+            continue
+        # Entries written before ETags were stored get one computed here, once per read
+        etag = etag.decode() if etag is not None else make_etag(payload)
+        entries.append(CacheEntry(payload, float(expires_at or 0), float(delta or 0), etag))
+    return entries
+
+
+def uncached_entry(payload: bytes, delta: float = 0.0) -> CacheEntry:
+    """ Entry for a payload that could not be cached, so callers still get an ETag. """
+    return CacheEntry(payload, time.time() + CACHE_EXPIRATION_SECONDS, delta, make_etag(payload))
+
+
+# Request-path fill. A "ver" means the entry was written from a known product version (a write
+# or an event): a tombstone (no "v", no "x") always wins, and so does a versioned payload until
+# its soft expiry, so a loader that read the product just before a write can't put the old state
+# back. An evicted entry ("x", see _APPLY_CHANGE_SCRIPT) takes the fill. Returns 1 if written.
+_WRITE_ENTRY_SCRIPT = """
+if redis.call('hexists', KEYS[1], 'ver') == 1 then
+    if redis.call('hexists', KEYS[1], 'v') == 0 then
+        if redis.call('hexists', KEYS[1], 'x') == 0 then
+            return 0
+        end
+    elseif tonumber(redis.call('hget', KEYS[1], 'exp') or 0) > tonumber(ARGV[6]) then
+        return 0
+    end
+end
+redis.call('hdel', KEYS[1], 'x')
+redis.call('hset', KEYS[1], 'v', ARGV[1], 'exp', ARGV[2], 'd', ARGV[3], 'e', ARGV[5])
+redis.call('expire', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+async def _write_entries(items: List[Tuple[aioredis.Redis, str, CacheEntry]]) -> List[bool]:
+    def queue(pipe, item):
+        _redis, key, entry = item
+        # Keep the entry around past its soft expiry so it can be served stale while refreshing
+        pipe.eval(
+            _WRITE_ENTRY_SCRIPT, 1, key,
+            entry.payload, entry.expires_at, entry.delta, get_cache_ttl(key) + CACHE_STALE_SECONDS, entry.etag,
+            time.time(),
+        )
+
+    return [bool(reply) for (reply,) in await run_pipelined(items, queue, 1, REDIS_SET_SECONDS)]
+
+
+# Concurrent cache reads/writes in a tick share one pipelined round trip
+_entry_reads = Batcher("redis_read", _read_entries)
+_entry_writes = Batcher("redis_write", _write_entries)
+
+
+async def read_entry(redis: aioredis.Redis, key: str) -> Optional[CacheEntry]:
+    return await _entry_reads.load((redis, key))
+
+
+async def write_entry(redis: aioredis.Redis, key: str, payload: bytes, delta: float) -> Tuple[CacheEntry, bool]:
+    """ Fills a key from the request path. Returns the entry and whether Redis took it (see _WRITE_ENTRY_SCRIPT). """
+    entry = CacheEntry(payload, time.time() + get_cache_ttl(key), delta, make_etag(payload))
+    return entry, await _entry_writes.load((redis, key, entry))
+
+
+# Entries maintained from product events. "ver" is the product's updated_at in microseconds;
+# an event older than what is stored is ignored, so redelivered or reordered events can't
+# overwrite newer data. A delete keeps only "ver" (a tombstone) until CACHE_TOMBSTONE_SECONDS.
+# An eviction (ARGV[6] = 1: stock_changed, or an event without a version) drops the payload
+# but keeps "ver" and marks the entry "x", so the next fill is taken while older events and
+# deletes still compare against the stored version; a tombstone stays a tombstone.
+_APPLY_CHANGE_SCRIPT = """
+local current = tonumber(redis.call('hget', KEYS[1], 'ver'))
+if ARGV[1] ~= '' and current and current > tonumber(ARGV[1]) then
+    return 0
+end
+if ARGV[6] == '1' then
+    if not current then
+        redis.call('del', KEYS[1])
+    elseif redis.call('hexists', KEYS[1], 'v') == 1 or redis.call('hexists', KEYS[1], 'x') == 1 then
+        redis.call('hdel', KEYS[1], 'v', 'exp', 'd', 'e')
+        redis.call('hset', KEYS[1], 'x', 1)
+        if ARGV[1] ~= '' then
+            redis.call('hset', KEYS[1], 'ver', ARGV[1])
+        end
+        redis.call('expire', KEYS[1], ARGV[4])
+    end
+    return 1
+end
+redis.call('del', KEYS[1])
+if ARGV[2] == '' then
+    redis.call('hset', KEYS[1], 'ver', ARGV[1])
+else
+    redis.call('hset', KEYS[1], 'v', ARGV[2], 'exp', ARGV[3], 'd', 0, 'ver', ARGV[1], 'e', ARGV[5])
+end
+redis.call('expire', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+class ProductChange(NamedTuple):
+    """
+    New state of a cached key from an event: payload None means deleted, version None means unknown.
+    evict drops the cached payload without recording a delete (the event doesn't carry the full product).
+    """
+    key: str
+    version: Optional[int]
+    payload: Optional[bytes]
+    evict: bool = False
+
+
+async def _apply_changes(items: List[Tuple[aioredis.Redis, ProductChange]]) -> List[bool]:
+    expires_at = time.time() + CACHE_EXPIRATION_SECONDS
+
+    def queue(pipe, item):
+        _redis, change = item
+        if change.payload is None:
+            ttl = CACHE_TOMBSTONE_SECONDS
+        else:
+            ttl = CACHE_EXPIRATION_SECONDS + CACHE_STALE_SECONDS
+        pipe.eval(
+            _APPLY_CHANGE_SCRIPT, 1, change.key,
+            "" if change.version is None else change.version, change.payload or "", expires_at, ttl,
+            make_etag(change.payload) if change.payload is not None else "",
+            1 if change.evict or change.version is None else 0, # Without a version, all we can do is evict
+        )
+
+    applied = [bool(reply) for (reply,) in await run_pipelined(items, queue, 1, REDIS_SET_SECONDS)]
+    # Any applied change can move a product in or out of a list page: bump the generation once
+    # for the whole batch, and drop the changed keys from every process' local cache
+    for _client_id, indexes in group_indexes(items, lambda item: id(item[0])):
+        changed_keys = [items[index][1].key for index in indexes if applied[index]]
+        if not changed_keys:
+            continue
+        changed_keys.append(PRODUCT_LIST_GENERATION_KEY)
+        local_product_cache.delete(*changed_keys)
+        async with items[indexes[0]][0].pipeline(transaction=False) as pipe:
+            pipe.incr(PRODUCT_LIST_GENERATION_KEY)
+            pipe.publish(CACHE_INVALIDATION_CHANNEL, ",".join(changed_keys))
+            with REDIS_INVALIDATE_SECONDS.time():
+                await pipe.execute()
+    return applied
+
+
+# Events handled concurrently by the consumer share one pipeline and one generation bump
+_change_writes = Batcher("redis_event_write", _apply_changes)
+
+
+async def apply_product_change(redis: aioredis.Redis, change: ProductChange) -> bool:
+    """ Writes an event's product state to Redis. False if a newer version was already there. """
+    try:
+        return await _change_writes.load((redis, change))
+    except Exception as e:
+        report_redis_error(e)
+        raise
+
+
+async def write_through(redis: Optional[aioredis.Redis], changes: List[ProductChange]):
+    """
+    Puts the outcome of an HTTP write into Redis before the handler returns: the new payload,
+    or a tombstone for a delete, through the same version check as events, plus the list
+    generation bump and the local-cache fan-out. The consumer applying the matching event
+    later finds the version already there; it only matters to processes that missed this.
+    """
+    local_keys = [change.key for change in changes] + [PRODUCT_LIST_GENERATION_KEY]
+    local_product_cache.delete(*local_keys)
+    _mark_written(local_keys)
+    if redis is None or not changes:
+        return
+    await asyncio.gather(*[apply_product_change(redis, change) for change in changes])
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key inside this process: the first
+    caller runs the function, everyone else awaits the same task.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        # Shield so a cancelled caller (client went away) doesn't cancel the load for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+
+_loads = SingleFlight()
+# Background refreshes in flight in this process, one per key
+_refresh_tasks: Dict[str, asyncio.Task] = {}
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+async def _acquire_locks(items: List[Tuple[aioredis.Redis, str, str]]) -> List[bool]:
+    def queue(pipe, item):
+        _redis, key, token = item
+        pipe.set(f"{key}{CACHE_LOCK_SUFFIX}", token, nx=True, px=CACHE_LOCK_TIMEOUT_MS)
+
+    return [bool(acquired) for (acquired,) in await run_pipelined(items, queue, 1, REDIS_LOCK_SECONDS)]
+
+
+async def _release_locks(items: List[Tuple[aioredis.Redis, str, str]]) -> List[None]:
+    def queue(pipe, item):
+        _redis, key, token = item
+        # Only delete the lock if we still own it (it may have expired and been re-taken)
+        pipe.eval(_RELEASE_LOCK_SCRIPT, 1, f"{key}{CACHE_LOCK_SUFFIX}", token)
+
+    await run_pipelined(items, queue, 1, REDIS_LOCK_SECONDS)
+    return [None] * len(items)
+
+
+_lock_acquires = Batcher("redis_lock", _acquire_locks)
+_lock_releases = Batcher("redis_unlock", _release_locks)
+
+
+async def _acquire_lock(redis: aioredis.Redis, key: str) -> Optional[str]:
+    token = uuid.uuid4().hex
+    return token if await _lock_acquires.load((redis, key, token)) else None
+
+
+async def _release_lock(redis: aioredis.Redis, key: str, token: str):
+    try:
+        await _lock_releases.load((redis, key, token))
+    except Exception as e:
+        report_redis_error(e)
+        logger.warning("Redis lock release error for %s: %s", key, e)
+
+
+async def _run_loader(redis: Optional[aioredis.Redis], key: str, loader: Loader, use_local: bool) -> Optional[CacheEntry]:
+    started = time.monotonic()
+    payload = await loader()
+    if payload is None:
+        return None
+    delta = time.monotonic() - started
+    if redis is not None:
+        try:
+            entry, written = await write_entry(redis, key, payload, delta)
+            # A refused fill lost to a newer write: don't keep it locally either
+            if use_local and written:
+                set_local(key, entry)
+            return entry
+        except Exception as e:
+            report_redis_error(e)
+            logger.warning("Redis cache write error for %s: %s", key, e)
+    return uncached_entry(payload, delta)
+
+
+async def _load(redis: Optional[aioredis.Redis], key: str, loader: Loader, use_local: bool) -> Optional[CacheEntry]:
+    """ Loads a missing key, letting only one process in the cluster hit the database for it. """
+    token = None
+    if redis is not None:
+        try:
+            token = await _acquire_lock(redis, key)
+            if token is None:
+                # Someone else is loading this key; wait for their result instead of piling on Mongo
+                deadline = time.monotonic() + CACHE_LOCK_WAIT_SECONDS
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(CACHE_LOCK_POLL_INTERVAL_SECONDS)
+                    entry = await read_entry(redis, key)
+                    if entry is not None:
+                        if use_local:
+                            set_local(key, entry)
+                        return entry
+                logger.warning("Timed out waiting for cache lock on %s, loading directly.", key)
+        except Exception as e:
+            report_redis_error(e)
+            logger.warning("Redis cache lock error for %s: %s", key, e)
+    try:
+        return await _run_loader(redis, key, loader, use_local)
+    finally:
+        if token is not None:
+            await _release_lock(redis, key, token)
+
+
+async def _refresh(redis: aioredis.Redis, key: str, loader: Loader, use_local: bool):
+    """ Background refresh of a stale (or soon-to-be-stale) entry. """
+    try:
+        token = await _acquire_lock(redis, key)
+        if token is None:
+            return # Another process is already refreshing it
+        try:
+            started = time.monotonic()
+            payload = await loader()
+            if payload is None:
+                # The underlying record is gone; stop serving the stale copy
+                await invalidate_keys(redis, key, bump_list_generation=False)
+                return
+            entry, written = await write_entry(redis, key, payload, time.monotonic() - started)
+            if use_local and written:
+                set_local(key, entry)
+        finally:
+            await _release_lock(redis, key, token)
+    except Exception as e:
+        report_redis_error(e)
+        logger.warning("Background cache refresh error for %s: %s", key, e)
+
+
+def _schedule_refresh(redis: Optional[aioredis.Redis], key: str, loader: Loader, use_local: bool):
+    if redis is None or key in _refresh_tasks:
+        return
+    task = asyncio.create_task(_refresh(redis, key, loader, use_local))
+    _refresh_tasks[key] = task
+    task.add_done_callback(lambda _t: _refresh_tasks.pop(key, None))
+
+
+async def get_or_load_entry(
+    redis: Optional[aioredis.Redis],
+    key: str,
+    loader: Loader,
+    use_local: bool = True,
+) -> Optional[CacheEntry]:
+    """
+    Returns the cache entry (payload and ETag) for key, loading it with `loader` on a miss.
+
+    - Concurrent misses inside a process share one loader call (single-flight),
+      and a Redis lease keeps other processes from loading the same key at once.
+    - Expired entries are served stale while one background task refreshes them
+      (CACHE_STALE_WHILE_REVALIDATE), and fresh entries are occasionally refreshed
+      early (CACHE_EARLY_REFRESH_BETA) so expiries don't line up.
+    """
+    now = time.time()
+    family = get_cache_family(key)
+    entry = get_local(key) if use_local else None
+    if entry is not None and entry.is_stale(now):
+        entry = None # Another pod may already have refreshed it; look in Redis
+    local_hit = entry is not None
+
+    if entry is None and redis is not None:
+        try:
+            entry = await read_entry(redis, key)
+            if entry is not None and use_local:
+                set_local(key, entry)
+        except Exception as e:
+            report_redis_error(e)
+            logger.warning("Redis cache read error for %s: %s", key, e)
+
+    if entry is not None:
+        if not entry.is_stale(now):
+            record_cache_result(family, "local_hit" if local_hit else "hit")
+            if entry.should_refresh_early(now):
+                _schedule_refresh(redis, key, loader, use_local)
+            return entry
+        if CACHE_STALE_WHILE_REVALIDATE and redis is not None:
+            record_cache_result(family, "stale_hit")
+            _schedule_refresh(redis, key, loader, use_local)
+            return entry
+
+    record_cache_result(family, "miss")
+    return await _loads.do(key, lambda: _load(redis, key, loader, use_local))
+
+
+def _apply_invalidation(data: Any):
+    if isinstance(data, bytes):
+        data = data.decode()
+    if data == INVALIDATE_ALL:
+        local_product_cache.clear()
+        _mark_written([INVALIDATE_ALL])
+        return
+    keys = [key for key in data.split(",") if key]
+    local_product_cache.delete(*keys)
+    _mark_written(keys)
+
+
+async def run_invalidation_listener():
+    """
+    Long-running task that evicts local entries named on CACHE_INVALIDATION_CHANNEL.
+    Reconnects on failure and starts from an empty local cache every time it
+    (re)subscribes, since messages sent while disconnected are lost.
+    """
+    global _invalidation_subscribed
+    if not LOCAL_CACHE_ENABLED:
+        return
+
+    while True:
+        if await get_redis_client() is None: # Breaker open, Redis is down
+            await asyncio.sleep(CACHE_INVALIDATION_RETRY_SECONDS)
+            continue
+
+        pubsub_client = create_redis_pubsub_client()
+        pubsub = pubsub_client.pubsub()
+        try:
+            await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+            local_product_cache.clear()
+            _invalidation_subscribed = True
+            logger.info("Subscribed to cache invalidation channel %s", CACHE_INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _apply_invalidation(message.get("data"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Cache invalidation listener error: %s", e)
+        finally:
+            _invalidation_subscribed = False
+            local_product_cache.clear()
+            try:
+                await pubsub.reset()
+                await pubsub_client.close(close_connection_pool=True)
+            except Exception: # nosec
+                pass # Ignore errors on close
+        await asyncio.sleep(CACHE_INVALIDATION_RETRY_SECONDS)
@@ -0,0 +1,50 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Minimal circuit breaker for an optional dependency.
+
+    closed    -> calls go through; consecutive failures are counted
+    open      -> calls are skipped immediately, after `failure_threshold` consecutive failures
+    half_open -> after `reset_timeout_seconds`, calls are let through again; the next
+                 success closes the breaker and the next failure re-opens it
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+
+    def allow_request(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_seconds:
+            self.state = self.HALF_OPEN
+        return self.state != self.OPEN
+
+    def record_success(self):
+        self._consecutive_failures = 0
+        if self.state != self.CLOSED:
+            logger.info("Circuit breaker '%s' closed.", self.name)
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        self._consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Circuit breaker '%s' opened after %d failures.", self.name, self._consecutive_failures)
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
@@ -0,0 +1,138 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+br is used when the optional `brotli` package is installed and the client accepts it,
+otherwise gzip. Only single-chunk responses of at least COMPRESSION_MIN_SIZE bytes with a
+JSON/text body are compressed; streamed responses (the NDJSON export compresses itself)
+pass through untouched. Responses with an ETag (cached products and list pages) are
+compressed once per ETag and encoding and then served from a small in-process LRU. They and
+their 304s always get Vary: Accept-Encoding, and a weak ETag when the client accepts an
+encoding, whether or not the body is big enough to compress.
+"""
+import gzip
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .cache import LocalCache
+from .config import (
+    CACHE_EXPIRATION_SECONDS,
+    COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_CACHE_MAX_ENTRIES,
+)
+from .metrics import COMPRESSION_SECONDS
+
+try:
+    import brotli
+except ImportError: # Optional; gzip only without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/problem+json", "text/")
+
+# "<encoding>:<etag>" -> compressed body. ETags are content hashes, so entries never go stale.
+_compressed_bodies = LocalCache(COMPRESSION_CACHE_MAX_ENTRIES, CACHE_EXPIRATION_SECONDS)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """ Preferred supported encoding the client accepts (q > 0), or None. """
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(coding.strip().lower())
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    with COMPRESSION_SECONDS.time():
+        if encoding == "br":
+            return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+        return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def _compress_cached(body: bytes, encoding: str, etag: Optional[str]) -> bytes:
+    if etag is None:
+        return compress(body, encoding)
+    key = f"{encoding}:{etag}"
+    compressed = _compressed_bodies.get(key)
+    if compressed is None:
+        compressed = compress(body, encoding)
+        _compressed_bodies.set(key, compressed)
+    return compressed
+
+
+class CompressionMiddleware:
+    """ Pure ASGI middleware; see the module docstring. """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message # Held back until the body shows whether to compress
+                return
+            if start_message is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(scope=start)
+            etag = headers.get("etag")
+            encoding = None
+            if etag is not None and self._negotiates(start, headers):
+                # Negotiated whatever the body size, so a 200 and the 304 revalidating it carry the
+                # same Vary and ETag (the 304 has no body to decide on)
+                headers.add_vary_header("Accept-Encoding")
+                encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+                if encoding is not None and not etag.startswith("W/"):
+                    # May be byte-for-byte different from the identity body; the handler compares weakly
+                    headers["ETag"] = f"W/{etag}"
+            # Cheapest checks first: most responses (single products, 304s) are below the threshold
+            if len(body) < self.minimum_size or message.get("more_body", False):
+                await send(start)
+                await send(message)
+                return
+            if etag is None:
+                if not self._negotiates(start, headers):
+                    await send(start)
+                    await send(message)
+                    return
+                headers.add_vary_header("Accept-Encoding")
+                encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+            if encoding is None:
+                await send(start)
+                await send(message)
+                return
+            body = _compress_cached(body, encoding, etag)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _negotiates(start, headers: MutableHeaders) -> bool:
+        """ Whether the representation depends on Accept-Encoding: JSON/text not already encoded, and 304s. """
+        if "content-encoding" in headers:
+            return False
+        return start["status"] == 304 or headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
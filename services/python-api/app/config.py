@@ -1,9 +1,17 @@
 import os
+import asyncio
 from dotenv import load_dotenv
 import motor.motor_asyncio
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from pymongo.write_concern import WriteConcern
 import redis.asyncio as aioredis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
 import aio_pika
-from typing import Optional, Tuple
+import logging
+from typing import Optional, Tuple, Union
+from .circuit_breaker import CircuitBreaker
 
 # Load environment variables from .env file
 # __file__ is app/config.py. dirname(__file__) is app. os.path.join(..., '..') is the root of the app WORKDIR
@@ -11,17 +19,52 @@ CONFIG_PY_DIR = os.path.dirname(__file__)
 PROJECT_ROOT_FROM_CONFIG = os.path.abspath(os.path.join(CONFIG_PY_DIR, '..'))
 ENV_PATH = os.path.join(PROJECT_ROOT_FROM_CONFIG, '.env')
 load_dotenv(ENV_PATH)
-print(f"Loading .env from: {ENV_PATH}")
+
+logger = logging.getLogger(__name__)
+
+# Logging Configuration (see logging_config.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of per-request lines (access log, cache invalidations, processed events) that are kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.1))
+# Records waiting for the background writer; beyond this new records are dropped, never blocking a request
+LOG_QUEUE_MAX_SIZE = int(os.getenv("LOG_QUEUE_MAX_SIZE", 10000))
 
 
 # MongoDB Configuration
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/pythondb")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "pythondb")
+# Write concern for product writes: "1" (primary ack, lowest latency) or "majority" (survives failover)
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "1")
+MONGO_WRITE_TIMEOUT_MS = int(os.getenv("MONGO_WRITE_TIMEOUT_MS", 0)) # 0 = wait indefinitely (driver default)
+# Connection pool and timeouts (per process; every worker has its own pool)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000)) # Waiting for a free pooled connection
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 10000)) # 0 = no timeout
+# Read routing for list scans and cache-miss lookups: "primary" or "secondaryPreferred".
+# Writes and read-after-write always use the primary.
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "secondaryPreferred")
+# Skip secondaries lagging more than this (MongoDB requires at least 90); 0 = no bound
+MONGO_MAX_STALENESS_SECONDS = int(os.getenv("MONGO_MAX_STALENESS_SECONDS", 90))
+# After a product (or the list) is written, cache misses for it read from the primary for this long,
+# so a lagging secondary can't put the pre-write version back into the cache
+MONGO_PRIMARY_READ_AFTER_WRITE_SECONDS = float(os.getenv("MONGO_PRIMARY_READ_AFTER_WRITE_SECONDS", 5))
 
 # Redis Configuration
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 # REDIS_PASSWORD = os.getenv("REDIS_PASSWORD") # Add if needed
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 100))
+REDIS_SOCKET_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", 0.5))
+REDIS_CONNECT_TIMEOUT_SECONDS = float(os.getenv("REDIS_CONNECT_TIMEOUT_SECONDS", 0.5))
+REDIS_RETRY_ATTEMPTS = int(os.getenv("REDIS_RETRY_ATTEMPTS", 1))
+REDIS_HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("REDIS_HEALTH_CHECK_INTERVAL_SECONDS", 2))
+# After this many consecutive failures requests skip Redis until a health check succeeds
+REDIS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("REDIS_BREAKER_FAILURE_THRESHOLD", 3))
+REDIS_BREAKER_RESET_SECONDS = float(os.getenv("REDIS_BREAKER_RESET_SECONDS", 10))
 
 # RabbitMQ Configuration
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
@@ -46,51 +89,98 @@ db: Optional[motor.motor_asyncio.AsyncIOMotorDatabase] = None
 async def get_mongo_db() -> motor.motor_asyncio.AsyncIOMotorDatabase:
     global mongo_client, db
     if db is None:
-        mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
+        mongo_client = motor.motor_asyncio.AsyncIOMotorClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS or None,
+        )
         db = mongo_client[MONGO_DB_NAME]
-        print(f"MongoDB connected to database: {MONGO_DB_NAME}")
+        logger.info("MongoDB connected to database: %s", MONGO_DB_NAME)
     return db
 
+def get_mongo_write_concern() -> WriteConcern:
+    w = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+    return WriteConcern(w=w, wtimeout=MONGO_WRITE_TIMEOUT_MS or None)
+
+def get_mongo_read_preference(allow_secondary: bool) -> Union[Primary, SecondaryPreferred]:
+    """ Read preference for a query; secondaries only when the caller can tolerate replication lag. """
+    if allow_secondary and MONGO_READ_PREFERENCE == "secondaryPreferred":
+        return SecondaryPreferred(max_staleness=MONGO_MAX_STALENESS_SECONDS or -1)
+    return Primary()
+
 async def close_mongo_db():
-    global mongo_client
     if mongo_client:
         mongo_client.close()
-        print("MongoDB connection closed.")
+        logger.info("MongoDB connection closed.")
 
 # Redis Client
+# One pooled client per process. Requests never ping: a background monitor tracks health
+# and a circuit breaker makes get_redis_client() return None while Redis is down,
+# so callers skip the cache immediately instead of waiting on connect timeouts.
 redis_client: Optional[aioredis.Redis] = None
+redis_breaker = CircuitBreaker("redis", REDIS_BREAKER_FAILURE_THRESHOLD, REDIS_BREAKER_RESET_SECONDS)
+
+def _create_redis_client(**overrides) -> aioredis.Redis:
+    options = dict(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT_SECONDS,
+        socket_keepalive=True,
+        retry=Retry(ExponentialBackoff(cap=0.05, base=0.005), REDIS_RETRY_ATTEMPTS),
+        retry_on_error=[RedisConnectionError, RedisTimeoutError],
+    )
+    options.update(overrides)
+    return aioredis.Redis(connection_pool=aioredis.ConnectionPool(**options))
 
 async def get_redis_client() -> Optional[aioredis.Redis]:
     global redis_client
-    # Attempt to connect or reconnect if client is None or seems disconnected
-    if redis_client is None: # Simplified check, rely on try/except for connection status
-        try:
-            redis_client = aioredis.from_url(f"redis://{REDIS_HOST}:{REDIS_PORT}")
-            await redis_client.ping() # Verify connection
-            print("Redis connected.")
-        except Exception as e:
-            print(f"Redis connection error: {e}")
-            redis_client = None # Ensure client is None if connection fails
-    elif not await redis_client.ping(): # Check if existing client is still connected
-        print("Redis client found, but ping failed. Attempting to reconnect.")
-        try:
-            await redis_client.close() # Close existing broken client
-        except: # nosec
-            pass # Ignore errors on close
+    if not redis_breaker.allow_request():
+        return None
+    if redis_client is None:
+        redis_client = _create_redis_client() # Connections are opened lazily by the pool
+    return redis_client
+
+def create_redis_pubsub_client() -> aioredis.Redis:
+    """ Separate client for long-lived subscriptions; blocking reads must not hit socket_timeout. """
+    return _create_redis_client(max_connections=1, socket_timeout=None)
+
+def report_redis_error(error: Exception):
+    """ Feeds connection-level failures seen on the request path into the breaker. """
+    if isinstance(error, (RedisConnectionError, RedisTimeoutError, OSError)):
+        redis_breaker.record_failure()
+
+async def run_redis_health_monitor():
+    """ Pings Redis every REDIS_HEALTH_CHECK_INTERVAL_SECONDS and opens/closes the breaker. """
+    global redis_client
+    while True:
+        if redis_client is None:
+            redis_client = _create_redis_client()
         try:
-            redis_client = aioredis.from_url(f"redis://{REDIS_HOST}:{REDIS_PORT}")
             await redis_client.ping()
-            print("Redis reconnected.")
+            if redis_breaker.state != redis_breaker.CLOSED:
+                logger.info("Redis is reachable again.")
+            redis_breaker.record_success()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print(f"Redis reconnection error: {e}")
-            redis_client = None
-    return redis_client
+            if not redis_breaker.is_open:
+                logger.warning("Redis health check failed: %s", e)
+            redis_breaker.record_failure()
+        await asyncio.sleep(REDIS_HEALTH_CHECK_INTERVAL_SECONDS)
 
 async def close_redis_client():
     global redis_client
     if redis_client:
-        await redis_client.close()
-        print("Redis connection closed.")
+        await redis_client.close(close_connection_pool=True)
+        redis_client = None
+        logger.info("Redis connection closed.")
 
 # RabbitMQ Client
 rabbitmq_connection: Optional[aio_pika.RobustConnection] = None
@@ -102,27 +192,205 @@ async def get_rabbitmq_channel() -> Tuple[Optional[aio_pika.RobustConnection], O
         try:
             rabbitmq_connection = await aio_pika.connect_robust(RABBITMQ_URL)
             rabbitmq_channel = await rabbitmq_connection.channel()
-            print("RabbitMQ connected and channel opened.")
+            logger.info("RabbitMQ connected and channel opened.")
         except Exception as e:
-            print(f"RabbitMQ connection error: {e}")
+            logger.error("RabbitMQ connection error: %s", e)
             rabbitmq_connection = None # Ensure they are None if connection fails
             rabbitmq_channel = None
     return rabbitmq_connection, rabbitmq_channel
 
 async def close_rabbitmq_connection():
-    global rabbitmq_connection, rabbitmq_channel
     if rabbitmq_channel and not rabbitmq_channel.is_closed:
         await rabbitmq_channel.close()
-        print("RabbitMQ channel closed.")
+        logger.info("RabbitMQ channel closed.")
     if rabbitmq_connection and not rabbitmq_connection.is_closed:
         await rabbitmq_connection.close()
-        print("RabbitMQ connection closed.")
+        logger.info("RabbitMQ connection closed.")
 
 # Cache settings
 CACHE_EXPIRATION_SECONDS = 300  # 5 minutes
 PRODUCT_CACHE_PREFIX = "py_product_"
-ALL_PRODUCTS_CACHE_KEY = "py_products_all"
+
+# List pages are cached per query shape under the current list generation.
+# Writes bump the generation (O(1)); pages from older generations simply expire.
+LIST_CACHE_ENABLED = os.getenv("LIST_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PRODUCT_LIST_CACHE_PREFIX = "py_products_page_"
+PRODUCT_LIST_GENERATION_KEY = "py_products_gen"
+# How long a worker may reuse the generation it last read before asking Redis again
+LIST_GENERATION_LOCAL_TTL_SECONDS = float(os.getenv("LIST_GENERATION_LOCAL_TTL_SECONDS", 1))
+
+# Stampede protection. Entries carry a soft expiry of CACHE_EXPIRATION_SECONDS and are
+# kept in Redis for CACHE_STALE_SECONDS longer so they can be served while one task refreshes them.
+CACHE_STALE_WHILE_REVALIDATE = os.getenv("CACHE_STALE_WHILE_REVALIDATE", "true").lower() in ("1", "true", "yes")
+CACHE_STALE_SECONDS = int(os.getenv("CACHE_STALE_SECONDS", 60))
+# Probabilistic early expiration (XFetch) aggressiveness; 0 disables early refreshes
+CACHE_EARLY_REFRESH_BETA = float(os.getenv("CACHE_EARLY_REFRESH_BETA", 1.0))
+# Cross-process lease taken by whoever reloads a key from Mongo
+CACHE_LOCK_SUFFIX = ":lock"
+CACHE_LOCK_TIMEOUT_MS = int(os.getenv("CACHE_LOCK_TIMEOUT_MS", 5000))
+CACHE_LOCK_WAIT_SECONDS = float(os.getenv("CACHE_LOCK_WAIT_SECONDS", 2))
+CACHE_LOCK_POLL_INTERVAL_SECONDS = float(os.getenv("CACHE_LOCK_POLL_INTERVAL_SECONDS", 0.05))
+
+# Event-driven cache maintenance. The event consumer writes product entries from
+# product.created/updated/deleted payloads (newest updated_at wins, deletes leave a tombstone)
+# and bumps the list generation. Write handlers write their own result through first
+# (cache.write_through); the events keep entries current for writes made elsewhere.
+CACHE_EVENT_UPDATES_ENABLED = os.getenv("CACHE_EVENT_UPDATES_ENABLED", "true").lower() in ("1", "true", "yes")
+# Must outlast the longest delay an older event can have (consumer retries, outbox backlog)
+CACHE_TOMBSTONE_SECONDS = int(os.getenv("CACHE_TOMBSTONE_SECONDS", 600))
+
+# In-process (L1) cache in front of the Redis product keys
+LOCAL_CACHE_ENABLED = os.getenv("LOCAL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", 1024))
+LOCAL_CACHE_TTL_SECONDS = float(os.getenv("LOCAL_CACHE_TTL_SECONDS", 30))
+# Pub/sub channel used to tell every worker/replica to drop its local copies
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "py_cache_invalidation")
+CACHE_INVALIDATION_RETRY_SECONDS = float(os.getenv("CACHE_INVALIDATION_RETRY_SECONDS", 5))
+
+# Startup warm-up: preload the hottest products and the first list pages before reporting ready.
+# Hot ids are tracked in a Redis sorted set fed by every replica's cache hits.
+CACHE_WARMUP_ENABLED = os.getenv("CACHE_WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_WARMUP_TOP_PRODUCTS = int(os.getenv("CACHE_WARMUP_TOP_PRODUCTS", 500))
+CACHE_WARMUP_LIST_PAGES = int(os.getenv("CACHE_WARMUP_LIST_PAGES", 3))
+CACHE_WARMUP_CONCURRENCY = int(os.getenv("CACHE_WARMUP_CONCURRENCY", 50))
+# /health reports ready after this long even if warm-up has not finished
+CACHE_WARMUP_TIMEOUT_SECONDS = float(os.getenv("CACHE_WARMUP_TIMEOUT_SECONDS", 15))
+HOT_PRODUCTS_KEY = "py_products_hot"
+HOT_PRODUCTS_MAX_TRACKED = int(os.getenv("HOT_PRODUCTS_MAX_TRACKED", 5000))
+HOT_PRODUCTS_FLUSH_SECONDS = float(os.getenv("HOT_PRODUCTS_FLUSH_SECONDS", 5))
+HOT_PRODUCTS_TTL_SECONDS = int(os.getenv("HOT_PRODUCTS_TTL_SECONDS", 86400))
+
+# Product search (GET /products/search). Pages are cached under the list generation like
+# GET /products, but with a short TTL since every distinct query string is its own key.
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PRODUCT_SEARCH_CACHE_PREFIX = "py_products_search_"
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", 30))
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", 100))
+# Text matches are ranked by relevance and paged by offset, so deep pages are capped
+SEARCH_TEXT_MAX_RESULTS = int(os.getenv("SEARCH_TEXT_MAX_RESULTS", 1000))
+# In-process name prefix index for GET /products/autocomplete, built from Mongo at startup and
+# kept current from the product event stream. Off by default: every worker holds every name.
+SEARCH_PREFIX_INDEX_ENABLED = os.getenv("SEARCH_PREFIX_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+# Full rebuild interval; repairs anything missed while the event subscription was down
+SEARCH_PREFIX_INDEX_REBUILD_SECONDS = float(os.getenv("SEARCH_PREFIX_INDEX_REBUILD_SECONDS", 600))
+AUTOCOMPLETE_MAX_LIMIT = int(os.getenv("AUTOCOMPLETE_MAX_LIMIT", 20))
+
+# Stock reservations (POST /products/{id}/reserve|release, see app/stock.py). Available stock is
+# counted in Redis; the net change per product is applied to Mongo with $inc by one flusher
+# every STOCK_FLUSH_INTERVAL_SECONDS, which also emits one product.stock_changed event per product.
+STOCK_COUNTER_PREFIX = "py_stock_"
+STOCK_PENDING_KEY = "py_stock_pending"
+STOCK_FLUSHING_KEY = "py_stock_flushing"
+STOCK_FLUSH_SEQUENCE_KEY = "py_stock_flush_seq"
+STOCK_FLUSH_LEASE_KEY = "py_stock_flush_lease"
+STOCK_FLUSH_INTERVAL_SECONDS = float(os.getenv("STOCK_FLUSH_INTERVAL_SECONDS", 0.5))
+STOCK_FLUSH_LEASE_SECONDS = float(os.getenv("STOCK_FLUSH_LEASE_SECONDS", 10))
+# Direct stock writes (product update/delete) hold back reservations of the product while they run;
+# the fence expires on its own after this long if the writing process dies
+STOCK_FENCE_PREFIX = "py_stock_fence_"
+STOCK_FENCE_SECONDS = float(os.getenv("STOCK_FENCE_SECONDS", 10))
+
+# Response compression (compression.CompressionMiddleware): br when the optional brotli
+# package is installed, else gzip, for single-chunk responses of at least COMPRESSION_MIN_SIZE bytes
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 5))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+# Compressed bodies kept per ETag and encoding, so hot cached pages are compressed once
+COMPRESSION_CACHE_MAX_ENTRIES = int(os.getenv("COMPRESSION_CACHE_MAX_ENTRIES", 256))
+
+# Admission control (admission.AdmissionControlMiddleware). Requests are grouped into route
+# classes, each with its own concurrency limit that adapts to latency (AIMD: +1/limit per fast
+# completion, x ADMISSION_BACKOFF_RATIO when a completion is slower than the target or fails).
+# Requests over the limit wait up to the queue timeout, then get a 503; a full queue gets a 429.
+# All limits are per worker process.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_BACKOFF_RATIO = float(os.getenv("ADMISSION_BACKOFF_RATIO", 0.9))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 1))
+# Cap on in-flight requests across all classes; shed_first classes (list, write, bulk) are
+# refused once ADMISSION_SHED_FIRST_SHARE of it is in use, leaving the rest for reads
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 1000))
+ADMISSION_SHED_FIRST_SHARE = float(os.getenv("ADMISSION_SHED_FIRST_SHARE", 0.7))
+
+def _admission_class(
+    name: str, initial_limit: int, min_limit: int, max_limit: int,
+    target_latency_ms: float, max_queue: int, queue_timeout_ms: float, shed_first: bool,
+) -> dict:
+    """ Settings of one route class, each overridable as ADMISSION_<CLASS>_<SETTING>. """
+    prefix = f"ADMISSION_{name.upper()}_"
+    return {
+        "initial_limit": int(os.getenv(prefix + "INITIAL_LIMIT", initial_limit)),
+        "min_limit": int(os.getenv(prefix + "MIN_LIMIT", min_limit)),
+        "max_limit": int(os.getenv(prefix + "MAX_LIMIT", max_limit)),
+        # 0 keeps the limit fixed at initial_limit (e.g. long streams, where latency says nothing)
+        "target_latency_seconds": float(os.getenv(prefix + "TARGET_LATENCY_MS", target_latency_ms)) / 1000,
+        "max_queue": int(os.getenv(prefix + "MAX_QUEUE", max_queue)),
+        "queue_timeout_seconds": float(os.getenv(prefix + "QUEUE_TIMEOUT_MS", queue_timeout_ms)) / 1000,
+        "shed_first": shed_first,
+    }
+
+ADMISSION_CLASSES = {
+    # GET /products/{id}, /products/autocomplete: mostly cache hits
+    "read": _admission_class("read", 200, 20, 1000, 100, 200, 200, shed_first=False),
+    # Stock reserve/release: Redis only, on the checkout path
+    "stock": _admission_class("stock", 100, 10, 500, 100, 200, 200, shed_first=False),
+    # GET /products, /products/search: Mongo scans on a miss
+    "list": _admission_class("list", 50, 4, 200, 250, 50, 100, shed_first=True),
+    # Single-product create/update/delete
+    "write": _admission_class("write", 50, 4, 200, 250, 50, 200, shed_first=True),
+    # /products:batch and the NDJSON export
+    "bulk": _admission_class("bulk", 4, 1, 4, 0, 8, 500, shed_first=True),
+}
+
+# Batch endpoints (/products:batch)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 1000))
+
+# Request coalescing (batching.Batcher): cache reads/writes and product lookups issued in the
+# same event-loop tick go out as one Redis pipeline / one Mongo $in query.
+# A small window (e.g. 0.5 ms) batches more under load at the cost of that much latency.
+BATCH_LOADER_WINDOW_SECONDS = float(os.getenv("BATCH_LOADER_WINDOW_MS", 0)) / 1000
+BATCH_LOADER_MAX_SIZE = int(os.getenv("BATCH_LOADER_MAX_SIZE", 500))
+# GET /products?ids=a,b,c
+PRODUCT_MULTI_GET_MAX_IDS = int(os.getenv("PRODUCT_MULTI_GET_MAX_IDS", 200))
+
+# Catalog export (GET /products/export)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))
+EXPORT_MAX_BATCH_SIZE = int(os.getenv("EXPORT_MAX_BATCH_SIZE", 5000))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", 6))
 
 # RabbitMQ settings
 PRODUCT_EXCHANGE = "product_events"
 NOTIFICATION_QUEUE = "python_notifications" # Unique queue for this service
+NOTIFICATION_RETRY_QUEUE = f"{NOTIFICATION_QUEUE}.retry"
+NOTIFICATION_DLX = f"{NOTIFICATION_QUEUE}.dlx"
+NOTIFICATION_DLQ = f"{NOTIFICATION_QUEUE}.dlq"
+
+# Transactional outbox: product writes also insert their events into OUTBOX_COLLECTION
+# and a background relay publishes them, so writes never wait on (or lose events to) RabbitMQ.
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() in ("1", "true", "yes")
+OUTBOX_COLLECTION = "product_outbox"
+OUTBOX_LEASE_COLLECTION = "outbox_leases"
+# Write product + outbox entry in one transaction (needs a replica set; docker-compose turns it on).
+# Off, the entry is inserted right after the write and a crash in between loses the event.
+OUTBOX_USE_TRANSACTIONS = os.getenv("OUTBOX_USE_TRANSACTIONS", "false").lower() in ("1", "true", "yes")
+OUTBOX_RELAY_BATCH_SIZE = int(os.getenv("OUTBOX_RELAY_BATCH_SIZE", 200))
+OUTBOX_RELAY_POLL_SECONDS = float(os.getenv("OUTBOX_RELAY_POLL_SECONDS", 0.2))
+OUTBOX_RELAY_LEASE_SECONDS = float(os.getenv("OUTBOX_RELAY_LEASE_SECONDS", 15))
+
+# Event consumer
+# "embedded": run inside the API process (default), "external": run via `python -m app.consumer`
+CONSUMER_MODE = os.getenv("CONSUMER_MODE", "embedded")
+CONSUMER_PREFETCH_COUNT = int(os.getenv("CONSUMER_PREFETCH_COUNT", 50))
+CONSUMER_CONCURRENCY = int(os.getenv("CONSUMER_CONCURRENCY", 8))
+CONSUMER_MAX_RETRIES = int(os.getenv("CONSUMER_MAX_RETRIES", 3))
+CONSUMER_RETRY_DELAY_MS = int(os.getenv("CONSUMER_RETRY_DELAY_MS", 5000))
+CONSUMER_STATS_INTERVAL_SECONDS = float(os.getenv("CONSUMER_STATS_INTERVAL_SECONDS", 10))
+
+# Event publisher (background, publisher confirms)
+EVENT_PUBLISHER_CHANNELS = int(os.getenv("EVENT_PUBLISHER_CHANNELS", 2))
+EVENT_OUTBOX_MAX_SIZE = int(os.getenv("EVENT_OUTBOX_MAX_SIZE", 10000))
+EVENT_PUBLISH_BATCH_SIZE = int(os.getenv("EVENT_PUBLISH_BATCH_SIZE", 100))
+EVENT_CONFIRM_TIMEOUT_SECONDS = float(os.getenv("EVENT_CONFIRM_TIMEOUT_SECONDS", 5))
+EVENT_PUBLISH_MAX_ATTEMPTS = int(os.getenv("EVENT_PUBLISH_MAX_ATTEMPTS", 3))
+EVENT_PUBLISHER_RETRY_SECONDS = float(os.getenv("EVENT_PUBLISHER_RETRY_SECONDS", 1))
+EVENT_PUBLISHER_DRAIN_SECONDS = float(os.getenv("EVENT_PUBLISHER_DRAIN_SECONDS", 5))
@@ -0,0 +1,58 @@
+"""
+Standalone product event consumer.
+
+Runs the RabbitMQ consumer in its own process so consumer bursts don't compete with
+the HTTP workers for the event loop, and so consumers can be scaled independently:
+
+    python -m app.consumer
+
+Set CONSUMER_MODE=external on the API so it doesn't also start an embedded consumer.
+The consumer also keeps the product cache up to date from the events (CACHE_EVENT_UPDATES_ENABLED),
+so it needs the same Redis settings as the API.
+"""
+import asyncio
+import logging
+import signal
+
+from .config import get_rabbitmq_channel, close_rabbitmq_connection, close_redis_client, CONSUMER_STATS_INTERVAL_SECONDS
+from .logging_config import setup_logging
+from .rabbitmq_service import start_product_event_consumer, default_message_processor
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_START_RETRY_SECONDS = 5
+
+
+async def main():
+    setup_logging()
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    consumer = None
+    while consumer is None and not stop_event.is_set():
+        await get_rabbitmq_channel()
+        consumer = await start_product_event_consumer(default_message_processor)
+        if consumer is None:
+            logger.info("Retrying consumer start in %ss...", CONSUMER_START_RETRY_SECONDS)
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=CONSUMER_START_RETRY_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=CONSUMER_STATS_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            logger.info("Consumer stats", extra={"stats": consumer.stats()})
+
+    logger.info("Consumer shutting down...")
+    if consumer is not None:
+        await consumer.stop()
+    await close_rabbitmq_connection()
+    await close_redis_client() # Opened lazily when events update the product cache
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
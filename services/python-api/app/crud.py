@@ -1,92 +1,518 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCollection
 from bson import ObjectId
-from typing import List, Optional, Dict, Any
-from .models import ProductCreate, ProductUpdate, ProductResponse
-from .config import get_mongo_db
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import AsyncIterator, List, NamedTuple, Optional, Dict, Any, Tuple
+from .models import ProductCreate, ProductUpdate, ProductResponse, products_from_docs
+from .config import get_mongo_db, get_mongo_write_concern, get_mongo_read_preference, SEARCH_TEXT_MAX_RESULTS
+from .outbox import add_events, write_session
+from .rabbitmq_service import get_product_event_data, get_product_deleted_event_data
+from .metrics import (
+    MONGO_FIND_SECONDS, MONGO_INSERT_SECONDS, MONGO_UPDATE_SECONDS, MONGO_DELETE_SECONDS, VALIDATION_SECONDS,
+)
 from datetime import datetime
-import json # For converting Decimal to float for MongoDB
+import base64
+import binascii
+import json # Pagination and search cursors
+import logging
+import re
 from decimal import Decimal
 
+logger = logging.getLogger(__name__)
+
+# Public sort names for GET /products mapped to document fields.
+# Every sort is made unique by _id as a tie-breaker so keyset pagination is stable.
+PRODUCT_SORT_FIELDS = {"id": "_id", "updated_at": "updated_at", "price": "price"}
+
+# Only the fields ProductResponse needs, so reads/updates don't ship anything else back
+PRODUCT_PROJECTION = {"name": 1, "price": 1, "stock": 1, "created_at": 1, "updated_at": 1}
+
+class InvalidCursorError(ValueError):
+    pass
+
+class ItemWriteError(NamedTuple):
+    """ Why one item of a bulk write failed: the server's error code (e.g. 11000 duplicate key) and message. """
+    code: Optional[int]
+    message: str
+
+def _bulk_write_errors(e: BulkWriteError) -> Dict[int, ItemWriteError]:
+    """ writeErrors of a bulk write keyed by the index of the failed operation. """
+    return {
+        err["index"]: ItemWriteError(err.get("code"), err.get("errmsg", "Write failed"))
+        for err in e.details.get("writeErrors", [])
+    }
+
+def normalize_name(name: str) -> str:
+    """ Case-insensitive form of a product name, stored as name_lc for prefix search. """
+    return name.strip().lower()
+
 # Helper to convert Pydantic model to dict, handling Decimal for MongoDB
 def product_to_mongo_dict(product: ProductCreate | ProductUpdate) -> Dict[str, Any]:
     data = product.model_dump(exclude_unset=True) # Pydantic v2
     if 'price' in data and isinstance(data['price'], Decimal):
         data['price'] = float(data['price']) # Convert Decimal to float for MongoDB
+    if data.get('name') is not None:
+        data['name_lc'] = normalize_name(data['name']) # Indexed for GET /products/search prefix matches
     return data
 
-async def get_product_collection() -> AsyncIOMotorCollection:
+async def get_product_collection(allow_secondary: bool = False) -> AsyncIOMotorCollection:
+    """
+    Products collection. Writes and read-after-write use the default (primary); pass
+    allow_secondary=True for reads that tolerate replication lag (MONGO_READ_PREFERENCE).
+    """
     db = await get_mongo_db()
-    return db["products"]
+    return db.get_collection(
+        "products",
+        write_concern=get_mongo_write_concern(),
+        read_preference=get_mongo_read_preference(allow_secondary),
+    )
+
+def _utcnow() -> datetime:
+    """ UTC now truncated to milliseconds, the precision BSON dates keep, so products built
+    locally match the stored document and updated_at orders event versions correctly. """
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
 
 async def create_product(product_data: ProductCreate) -> ProductResponse:
     collection = await get_product_collection()
     product_dict = product_to_mongo_dict(product_data)
     
     # Add timestamps
-    now = datetime.utcnow()
+    now = _utcnow()
     product_dict["created_at"] = now
     product_dict["updated_at"] = now
     
-    result = await collection.insert_one(product_dict)
-    created_product_doc = await collection.find_one({"_id": result.inserted_id})
-    if created_product_doc:
-        return ProductResponse.model_validate(created_product_doc) # Pydantic v2
-    raise Exception("Failed to create product or retrieve after creation")
+    async with write_session() as session:
+        with MONGO_INSERT_SECONDS.time():
+            result = await collection.insert_one(product_dict, session=session)
+        # The stored document is exactly what we sent plus its _id, so build the response locally
+        # instead of reading it back (saves a round trip and a primary read per write)
+        product_dict["_id"] = result.inserted_id
+        with VALIDATION_SECONDS.time():
+            created_product = ProductResponse.model_validate(product_dict) # Pydantic v2
+        await add_events("product.created", [get_product_event_data(created_product)], session=session)
+    return created_product
 
 
-async def get_product_by_id(product_id: str) -> Optional[ProductResponse]:
-    collection = await get_product_collection()
-    if not ObjectId.is_valid(product_id):
-        return None
-    product_doc = await collection.find_one({"_id": ObjectId(product_id)})
-    if product_doc:
-        return ProductResponse.model_validate(product_doc) # Pydantic v2
-    return None
+async def get_products_by_ids(product_ids: List[str], allow_secondary: bool = False) -> Dict[str, ProductResponse]:
+    """ Looks up many products with one $in query. Returns the found products keyed by id. """
+    object_ids = [ObjectId(product_id) for product_id in product_ids if ObjectId.is_valid(product_id)]
+    if not object_ids:
+        return {}
+    collection = await get_product_collection(allow_secondary)
+    with MONGO_FIND_SECONDS.time():
+        product_docs = await collection.find({"_id": {"$in": object_ids}}, PRODUCT_PROJECTION).to_list(
+            length=len(object_ids)
+        )
+    with VALIDATION_SECONDS.time():
+        products = products_from_docs(product_docs)
+    return {product.id: product for product in products}
 
-async def get_all_products(skip: int = 0, limit: int = 100) -> List[ProductResponse]:
+async def ensure_indexes():
+    """ Creates the indexes backing list sorting/filtering. Safe to call on every startup. """
     collection = await get_product_collection()
-    products_cursor = collection.find().skip(skip).limit(limit)
-    products_list = []
+    await collection.create_indexes([
+        IndexModel([("updated_at", DESCENDING), ("_id", DESCENDING)], name="updated_at_id"),
+        IndexModel([("price", ASCENDING), ("_id", ASCENDING)], name="price_id"),
+        IndexModel([("stock", ASCENDING), ("_id", ASCENDING)], name="stock_id"),
+        # GET /products/search: anchored prefix ranges on the normalized name, and word matches
+        IndexModel([("name_lc", ASCENDING), ("_id", ASCENDING)], name="name_lc_id"),
+        IndexModel([("name", TEXT)], name="name_text"),
+    ])
+    # Products written before name_lc existed; a no-op once every document has it
+    result = await collection.update_many(
+        {"name_lc": {"$exists": False}, "name": {"$type": "string"}},
+        [{"$set": {"name_lc": {"$toLower": {"$trim": {"input": "$name"}}}}}],
+    )
+    if result.modified_count:
+        logger.info("Backfilled name_lc on %d products.", result.modified_count)
+    logger.info("MongoDB product indexes ensured.")
+
+def encode_cursor(sort: str, order: str, product_doc: Dict[str, Any]) -> str:
+    """ Opaque cursor pointing just past product_doc in the given sort order. """
+    value = None
+    if sort != "id":
+        value = product_doc.get(PRODUCT_SORT_FIELDS[sort])
+        if isinstance(value, datetime):
+            value = value.isoformat()
+    raw = json.dumps([sort, order, value, str(product_doc["_id"])], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str, Any, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort, order, value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if sort not in PRODUCT_SORT_FIELDS or order not in ("asc", "desc"):
+            raise InvalidCursorError("Invalid cursor")
+        if sort == "updated_at" and value is not None:
+            value = datetime.fromisoformat(value)
+        return sort, order, value, ObjectId(last_id)
+    except (ValueError, TypeError, binascii.Error, InvalidId) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+def build_product_filter(
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    in_stock: Optional[bool] = None,
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    price_range = {}
+    if min_price is not None:
+        price_range["$gte"] = float(min_price)
+    if max_price is not None:
+        price_range["$lte"] = float(max_price)
+    if price_range:
+        query["price"] = price_range
+    if in_stock is not None:
+        query["stock"] = {"$gt": 0} if in_stock else {"$lte": 0}
+    return query
+
+async def get_all_products(
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    order: str = "asc",
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    in_stock: Optional[bool] = None,
+    allow_secondary: bool = False,
+) -> Tuple[List[ProductResponse], Optional[str]]:
+    """
+    Keyset-paginated product listing. Returns the page and the cursor for the next
+    page (None on the last page). Each page is an index range scan starting right
+    after the cursor, so deep pages cost the same as the first one.
+    """
+    collection = await get_product_collection(allow_secondary)
+    field = PRODUCT_SORT_FIELDS[sort]
+    direction = ASCENDING if order == "asc" else DESCENDING
+    query = build_product_filter(min_price, max_price, in_stock)
+
+    if cursor:
+        cursor_sort, cursor_order, last_value, last_id = decode_cursor(cursor)
+        if (cursor_sort, cursor_order) != (sort, order):
+            raise InvalidCursorError("Cursor does not match the requested sort order")
+        op = "$gt" if direction == ASCENDING else "$lt"
+        if field == "_id":
+            after = {"_id": {op: last_id}}
+        else:
+            after = {"$or": [{field: {op: last_value}}, {field: last_value, "_id": {op: last_id}}]}
+        query = {"$and": [query, after]} if query else after
+
+    sort_spec = [("_id", direction)] if field == "_id" else [(field, direction), ("_id", direction)]
+    # Fetch one extra document to know whether there is a next page
+    products_cursor = collection.find(query, PRODUCT_PROJECTION).sort(sort_spec).limit(limit + 1)
+    with MONGO_FIND_SECONDS.time():
+        product_docs = await products_cursor.to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(product_docs) > limit:
+        product_docs = product_docs[:limit]
+        next_cursor = encode_cursor(sort, order, product_docs[-1])
+    with VALIDATION_SECONDS.time():
+        products = products_from_docs(product_docs)
+    return products, next_cursor
+
+def encode_search_cursor(match: str, value: Any, last_id: Optional[ObjectId] = None) -> str:
+    """ Search cursor: the last name_lc and _id for prefix pages, the next offset for text pages. """
+    raw = json.dumps([match, value, str(last_id) if last_id is not None else None], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_search_cursor(cursor: str) -> Tuple[str, Any, Optional[ObjectId]]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        match, value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if match == "prefix" and isinstance(value, str):
+            return match, value, ObjectId(last_id)
+        if match == "text" and isinstance(value, int) and value >= 0:
+            return match, value, None
+        raise InvalidCursorError("Invalid cursor")
+    except (ValueError, TypeError, binascii.Error, InvalidId) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+async def search_products(
+    q: str,
+    match: str = "prefix",
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    in_stock: Optional[bool] = None,
+    allow_secondary: bool = False,
+) -> Tuple[List[ProductResponse], Optional[str]]:
+    """
+    Products whose name starts with q (match="prefix", case-insensitive, in name order) or
+    contains q's words (match="text", most relevant first), with the list filters applied.
+    Prefix pages are keyset-paginated over the name_lc_id index; text pages are paged by
+    offset, up to SEARCH_TEXT_MAX_RESULTS results.
+    """
+    collection = await get_product_collection(allow_secondary)
+    filters = build_product_filter(min_price, max_price, in_stock)
+    cursor_value, last_id = None, None
+    if cursor:
+        cursor_match, cursor_value, last_id = decode_search_cursor(cursor)
+        if cursor_match != match:
+            raise InvalidCursorError("Cursor does not match the requested match mode")
+
+    if match == "prefix":
+        # Anchored and case-sensitive on the lowercased field, so Mongo scans only the matching index range
+        query: Dict[str, Any] = {"name_lc": {"$regex": "^" + re.escape(normalize_name(q))}, **filters}
+        if cursor:
+            after = {"$or": [{"name_lc": {"$gt": cursor_value}}, {"name_lc": cursor_value, "_id": {"$gt": last_id}}]}
+            query = {"$and": [query, after]}
+        projection = {**PRODUCT_PROJECTION, "name_lc": 1}
+        products_cursor = collection.find(query, projection).sort([("name_lc", ASCENDING), ("_id", ASCENDING)])
+    else:
+        offset = cursor_value or 0
+        limit = min(limit, SEARCH_TEXT_MAX_RESULTS - offset)
+        if limit <= 0:
+            return [], None
+        query = {"$text": {"$search": q}, **filters}
+        projection = {**PRODUCT_PROJECTION, "score": {"$meta": "textScore"}}
+        products_cursor = collection.find(query, projection).sort(
+            [("score", {"$meta": "textScore"}), ("_id", ASCENDING)]
+        ).skip(offset)
+    # Fetch one extra document to know whether there is a next page
+    with MONGO_FIND_SECONDS.time():
+        product_docs = await products_cursor.limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(product_docs) > limit:
+        product_docs = product_docs[:limit]
+        if match == "prefix":
+            next_cursor = encode_search_cursor(match, product_docs[-1]["name_lc"], product_docs[-1]["_id"])
+        elif offset + limit < SEARCH_TEXT_MAX_RESULTS:
+            next_cursor = encode_search_cursor(match, offset + limit)
+    with VALIDATION_SECONDS.time():
+        products = products_from_docs(product_docs)
+    return products, next_cursor
+
+async def iter_product_names(batch_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+    """ _id, name and updated_at of every product, for building the in-process prefix index. """
+    collection = await get_product_collection(allow_secondary=True)
+    async for product_doc in collection.find({}, {"name": 1, "updated_at": 1}).batch_size(batch_size):
+        yield product_doc
+
+async def iter_product_batches(
+    batch_size: int,
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    in_stock: Optional[bool] = None,
+) -> AsyncIterator[List[ProductResponse]]:
+    """
+    Yields the whole (optionally filtered) catalog in _id order, one Mongo batch at a time.
+    Only one batch is held in memory; the next getMore is issued when the consumer asks for it.
+    """
+    collection = await get_product_collection(allow_secondary=True) # A full export tolerates replication lag
+    query = build_product_filter(min_price, max_price, in_stock)
+    products_cursor = collection.find(query, PRODUCT_PROJECTION).sort("_id", ASCENDING).batch_size(batch_size)
+    batch: List[ProductResponse] = []
     async for product_doc in products_cursor:
-        products_list.append(ProductResponse.model_validate(product_doc)) # Pydantic v2
-    return products_list
+        batch.append(ProductResponse.model_validate(product_doc))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _stamp_stock_flush(update_data: Dict[str, Any], stock_flush: Optional[str]):
+    """ A write that sets stock carries the in-flight flush token, so that batch doesn't $inc on top of it. """
+    if stock_flush and "stock" in update_data:
+        update_data["stock_flush"] = stock_flush
 
-async def update_product_by_id(product_id: str, product_update_data: ProductUpdate) -> Optional[ProductResponse]:
+async def update_product_by_id(
+    product_id: str, product_update_data: ProductUpdate, stock_flush: Optional[str] = None
+) -> Tuple[Optional[ProductResponse], bool]:
+    """
+    Applies a partial update. Returns (product, written): (None, False) if the product doesn't
+    exist; an empty update returns the current document with written False and records no event.
+    """
     collection = await get_product_collection()
     if not ObjectId.is_valid(product_id):
-        return None
+        return None, False
         
     update_data = product_to_mongo_dict(product_update_data)
+    _stamp_stock_flush(update_data, stock_flush)
     
-    if not update_data: # No fields to update
-        # Optionally, fetch and return the existing product or return None/error
-        existing_product = await get_product_by_id(product_id)
-        return existing_product
+    async with write_session() as session:
+        if not update_data: # No fields to update, just return the current document
+            with MONGO_FIND_SECONDS.time():
+                result = await collection.find_one({"_id": ObjectId(product_id)}, PRODUCT_PROJECTION, session=session)
+        else:
+            update_data["updated_at"] = _utcnow()
+            with MONGO_UPDATE_SECONDS.time():
+                result = await collection.find_one_and_update(
+                    {"_id": ObjectId(product_id)},
+                    {"$set": update_data},
+                    projection=PRODUCT_PROJECTION,
+                    return_document=ReturnDocument.AFTER,
+                    session=session
+                )
+        if not result:
+            return None, False
+        with VALIDATION_SECONDS.time():
+            updated_product = ProductResponse.model_validate(result) # Pydantic v2
+        if update_data:
+            await add_events("product.updated", [get_product_event_data(updated_product)], session=session)
+    return updated_product, bool(update_data)
+
+async def create_products(
+    products_data: List[ProductCreate],
+) -> List[Tuple[Optional[ProductResponse], Optional[ItemWriteError]]]:
+    """
+    Inserts many products with one unordered insert_many.
+    Returns (product, None) or (None, error) for every input, in input order.
+    """
+    collection = await get_product_collection()
+    now = _utcnow()
+    product_dicts = []
+    for product_data in products_data:
+        product_dict = product_to_mongo_dict(product_data)
+        product_dict["created_at"] = now
+        product_dict["updated_at"] = now
+        product_dicts.append(product_dict)
+
+    errors: Dict[int, ItemWriteError] = {}
+    try:
+        # insert_many assigns _id to each dict, so responses can be built without reading back
+        with MONGO_INSERT_SECONDS.time():
+            await collection.insert_many(product_dicts, ordered=False)
+    except BulkWriteError as e:
+        errors = _bulk_write_errors(e)
 
-    update_data["updated_at"] = datetime.utcnow()
+    results = [
+        (None, errors[index]) if index in errors else (ProductResponse.model_validate(product_dict), None)
+        for index, product_dict in enumerate(product_dicts)
+    ]
+    # Batch writes allow partial failure, so they aren't wrapped in a transaction;
+    # the outbox entries for the inserted products follow in one insert_many.
+    await add_events("product.created", [get_product_event_data(p) for p, error in results if error is None])
+    return results
 
-    result = await collection.find_one_and_update(
-        {"_id": ObjectId(product_id)},
-        {"$set": update_data},
-        return_document=True # motor uses pymongo.ReturnDocument.AFTER implicitly
+async def update_products(
+    updates: List[Tuple[str, ProductUpdate]], stock_flush: Optional[str] = None,
+) -> List[Tuple[Optional[ProductResponse], Optional[ItemWriteError]]]:
+    """
+    Applies many partial updates with one unordered bulk_write, then reads the
+    touched documents back in a single $in query.
+    Returns (product, None), (None, error) for a failed write, or (None, None) for an
+    invalid or unknown id, for every input in input order. Empty updates return the
+    current document without writing it. Events are recorded for the written products only.
+    """
+    collection = await get_product_collection()
+    now = _utcnow()
+    operations = []
+    operation_indexes = [] # Input index of each operation
+    object_ids = []
+    for index, (product_id, product_update) in enumerate(updates):
+        if not ObjectId.is_valid(product_id):
+            continue
+        object_id = ObjectId(product_id)
+        object_ids.append(object_id)
+        update_data = product_to_mongo_dict(product_update)
+        if update_data: # Empty updates leave the document (and updated_at) untouched
+            update_data["updated_at"] = now
+            _stamp_stock_flush(update_data, stock_flush)
+            operations.append(UpdateOne({"_id": object_id}, {"$set": update_data}))
+            operation_indexes.append(index)
+
+    if not object_ids:
+        return [(None, None)] * len(updates)
+    errors: Dict[int, ItemWriteError] = {}
+    if operations:
+        try:
+            with MONGO_UPDATE_SECONDS.time():
+                await collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            errors = {operation_indexes[index]: error for index, error in _bulk_write_errors(e).items()}
+            logger.warning("Bulk update had %d write errors", len(errors))
+
+    products_by_id = {
+        str(product_doc["_id"]): ProductResponse.model_validate(product_doc)
+        async for product_doc in collection.find({"_id": {"$in": object_ids}}, PRODUCT_PROJECTION)
+    }
+    results = [
+        (None, errors[index]) if index in errors else (products_by_id.get(product_id), None)
+        for index, (product_id, _product_update) in enumerate(updates)
+    ]
+    # One event per product that at least one successful operation wrote
+    written_ids = dict.fromkeys(
+        updates[index][0] for index in operation_indexes if index not in errors and updates[index][0] in products_by_id
     )
-    if result:
-        return ProductResponse.model_validate(result) # Pydantic v2
-    return None
+    await add_events("product.updated", [get_product_event_data(products_by_id[pid]) for pid in written_ids])
+    return results
+
+async def delete_products(product_ids: List[str]) -> List[str]:
+    """ Deletes many products with one delete_many. Returns the ids that existed and were deleted. """
+    collection = await get_product_collection()
+    object_ids = list({ObjectId(product_id) for product_id in product_ids if ObjectId.is_valid(product_id)})
+    if not object_ids:
+        return []
+    existing_ids = [doc["_id"] async for doc in collection.find({"_id": {"$in": object_ids}}, {"_id": 1})]
+    if existing_ids:
+        with MONGO_DELETE_SECONDS.time():
+            await collection.delete_many({"_id": {"$in": existing_ids}})
+    deleted_ids = [str(object_id) for object_id in existing_ids]
+    await add_events("product.deleted", [get_product_deleted_event_data(product_id) for product_id in deleted_ids])
+    return deleted_ids
 
 async def delete_product_by_id(product_id: str) -> bool:
     collection = await get_product_collection()
     if not ObjectId.is_valid(product_id):
         return False
-    result = await collection.delete_one({"_id": ObjectId(product_id)})
-    return result.deleted_count > 0
+    async with write_session() as session:
+        with MONGO_DELETE_SECONDS.time():
+            result = await collection.delete_one({"_id": ObjectId(product_id)}, session=session)
+        if result.deleted_count == 0:
+            return False
+        await add_events("product.deleted", [get_product_deleted_event_data(product_id)], session=session)
+    return True
+
+async def get_stock_snapshot(product_id: str) -> Optional[Dict[str, Any]]:
+    """ stock and stock_flush (the last stock flush applied) of a product, from the primary. """
+    if not ObjectId.is_valid(product_id):
+        return None
+    collection = await get_product_collection()
+    with MONGO_FIND_SECONDS.time():
+        return await collection.find_one({"_id": ObjectId(product_id)}, {"stock": 1, "stock_flush": 1})
+
+async def apply_stock_deltas(deltas: Dict[str, int], token: str) -> List[Dict[str, Any]]:
+    """
+    Adds each delta to its product's stock with one unordered bulk_write of $inc.
+    Documents already stamped with `token` (stock_flush) got this batch on an earlier attempt
+    and are skipped, so a batch can be retried safely. Returns the product.stock_changed
+    event data (id, stock, updated_at) of every product the batch touched.
+    """
+    collection = await get_product_collection()
+    object_ids = [ObjectId(product_id) for product_id, delta in deltas.items() if delta and ObjectId.is_valid(product_id)]
+    if not object_ids:
+        return []
+    now = _utcnow()
+    requests = [
+        UpdateOne(
+            {"_id": object_id, "stock_flush": {"$ne": token}},
+            {"$inc": {"stock": deltas[str(object_id)]}, "$set": {"stock_flush": token, "updated_at": now}},
+        )
+        for object_id in object_ids
+    ]
+    with MONGO_UPDATE_SECONDS.time():
+        await collection.bulk_write(requests, ordered=False)
+    with MONGO_FIND_SECONDS.time():
+        product_docs = await collection.find(
+            {"_id": {"$in": object_ids}, "stock_flush": token}, {"stock": 1, "updated_at": 1}
+        ).to_list(length=len(object_ids))
+    events_data = [
+        {"id": str(doc["_id"]), "stock": doc["stock"], "updated_at": doc["updated_at"]} for doc in product_docs
+    ]
+    await add_events("product.stock_changed", events_data)
+    return events_data
 
 async def seed_initial_products():
     """Seeds the database with a few initial products if the collection is empty."""
     collection = await get_product_collection()
     count = await collection.count_documents({})
     if count == 0:
-        print("No products found, seeding initial data...")
+        logger.info("No products found, seeding initial data...")
         products_to_seed = [
             ProductCreate(name="Python Product 1", price=Decimal("10.99"), stock=100),
             ProductCreate(name="Python Product 2", price=Decimal("20.50"), stock=50),
@@ -94,6 +520,6 @@ async def seed_initial_products():
         ]
         for prod_create in products_to_seed:
             await create_product(prod_create)
-        print(f"Seeded {len(products_to_seed)} products.")
+        logger.info("Seeded %d products.", len(products_to_seed))
     else:
-        print(f"Found {count} products, no seeding needed.")
+        logger.info("Found %d products, no seeding needed.", count)
@@ -0,0 +1,118 @@
+"""
+Non-blocking structured logging.
+
+Log calls on the event loop only filter the record and put it on an in-memory queue;
+formatting (JSON) and the actual stdout write happen on a QueueListener thread.
+Per-request lines are sampled (LOG_SAMPLE_RATE) before they are even queued:
+
+    logger.info("Cache invalidated for product %s", product_id, extra={"sampled": True})
+
+Any other `extra` fields are emitted as top-level JSON keys.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from .config import LOG_LEVEL, LOG_SAMPLE_RATE, LOG_QUEUE_MAX_SIZE, ENV_PATH
+
+# Attributes every LogRecord has; anything else on a record came in through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sampled", "color_message"}
+
+# Loggers whose every line is per-request
+SAMPLED_LOGGERS = ("uvicorn.access",)
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line: ts, level, logger, message, extra fields and exc_info. """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """ Keeps `rate` of the per-request lines (extra={"sampled": True} or SAMPLED_LOGGERS); everything else passes. """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sampled", False) or record.name in SAMPLED_LOGGERS:
+            return self.rate >= 1 or random.random() < self.rate
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """ Hands records to the listener thread as-is; drops them when the queue is full instead of blocking. """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The base class formats here, i.e. on the event loop. The queue never leaves
+        # the process, so the record can be formatted later by the listener thread.
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging():
+    """ Routes the root logger (and uvicorn's loggers) through the background writer. Idempotent. """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_MAX_SIZE)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.handlers = [_queue_handler]
+    root.setLevel(LOG_LEVEL)
+
+    # uvicorn installs its own synchronous stream handlers; send its lines through the queue as well
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop) # Flushes whatever is still queued on interpreter exit
+
+    logging.getLogger(__name__).info(
+        "Logging configured (level=%s, sample_rate=%s, env file=%s)", LOG_LEVEL, LOG_SAMPLE_RATE, ENV_PATH
+    )
+
+
+def dropped_log_records() -> int:
+    """ Records discarded because the writer thread fell behind. """
+    return _queue_handler.dropped if _queue_handler is not None else 0
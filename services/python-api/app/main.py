@@ -1,23 +1,54 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Depends, Query, status, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, Response, StreamingResponse
 from contextlib import asynccontextmanager
 import asyncio # Import asyncio
-import json
+import logging
+import orjson
+import zlib
 import redis.asyncio as aioredis
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, List, Literal, Optional, Dict, Any, Tuple
 from datetime import datetime, timezone
 from decimal import Decimal
+from bson import ObjectId
 
 from . import crud, models
 from .config import (
     get_mongo_db, close_mongo_db,
-    get_redis_client, close_redis_client,
-    get_rabbitmq_channel, close_rabbitmq_connection,
+    get_redis_client, close_redis_client, run_redis_health_monitor, redis_breaker,
+    get_rabbitmq_channel, close_rabbitmq_connection, report_redis_error,
     API_TITLE, API_VERSION, API_DESCRIPTION, CONTACT_NAME, CONTACT_EMAIL,
-    CACHE_EXPIRATION_SECONDS, PRODUCT_CACHE_PREFIX, ALL_PRODUCTS_CACHE_KEY
+    PRODUCT_CACHE_PREFIX, LIST_CACHE_ENABLED, PRODUCT_LIST_GENERATION_KEY,
+    EXPORT_BATCH_SIZE, EXPORT_MAX_BATCH_SIZE, EXPORT_GZIP_LEVEL, BATCH_MAX_ITEMS, PRODUCT_MULTI_GET_MAX_IDS,
+    EVENT_PUBLISHER_DRAIN_SECONDS, CONSUMER_MODE, OUTBOX_ENABLED,
+    SEARCH_CACHE_ENABLED, SEARCH_MAX_LIMIT, AUTOCOMPLETE_MAX_LIMIT, SEARCH_PREFIX_INDEX_ENABLED,
 )
-from .rabbitmq_service import publish_product_event, start_product_event_consumer, default_message_processor
-from .models import ProductCreate, ProductUpdate, ProductResponse, ProductListResponse
+from .rabbitmq_service import publish_product_event, publish_product_events, start_product_event_consumer, default_message_processor
+from .rabbitmq_service import product_event_publisher, get_product_event_data, get_product_deleted_event_data
+from .rabbitmq_service import get_event_version
+from .cache import (
+    CacheEntry, ProductChange, get_or_load_entry, uncached_entry, make_etag, invalidate_keys, write_through,
+    run_invalidation_listener,
+    get_list_generation, get_product_list_cache_key, get_product_search_cache_key, written_recently
+)
+from .outbox import run_outbox_relay, relay_stats
+from .stock import (
+    StockProductNotFoundError, StockSeedConflictError, adjust_stock, stock_write_fence,
+    run_stock_flusher, flush_pending_stock, stock_stats,
+)
+from .search_index import run_prefix_index, prefix_index_ready, prefix_index_state, product_prefix_index
+from .warmup import run_cache_warmup, run_hot_product_tracker, record_product_hit, warmup_finished, warmup_state
+from .models import ProductCreate, ProductUpdate, ProductResponse, ProductListResponse, product_to_json, product_page_to_json
+from .models import product_page_from_payloads, ProductSuggestionResponse, StockAdjustment, StockAdjustmentResponse
+from .models import ProductBatchUpdate, ProductBatchDelete, ProductBatchItemResult, ProductBatchResponse
+from .logging_config import setup_logging, dropped_log_records
+from .batching import Batcher, group_indexes
+from .compression import CompressionMiddleware
+from .admission import AdmissionControlMiddleware, admission_stats
+from .metrics import MetricsMiddleware, SERIALIZATION_SECONDS, register_collector, register_routes, render_metrics
+
+# Before anything logs: records are written by a background thread, never on the event loop
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # Helper for cache key generation
 def get_product_cache_key(product_id: str) -> str:
@@ -26,23 +57,65 @@ def get_product_cache_key(product_id: str) -> str:
 # Context manager for application lifespan events (startup, shutdown)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Application startup...")
+    logger.info("Application startup...")
+    register_routes(app.routes) # Route templates and pre-registered latency series for /metrics
     # Initialize database connections
     await get_mongo_db()
-    await get_redis_client() # Initialize redis client
+    try:
+        await crud.ensure_indexes() # Indexes backing keyset pagination, list filters and search
+    except Exception as e:
+        logger.error("MongoDB index creation error: %s", e)
+    await get_redis_client() # Initialize the pooled redis client (connections open lazily)
+    redis_health_monitor = asyncio.create_task(run_redis_health_monitor())
     _conn, _channel = await get_rabbitmq_channel() # Initialize RabbitMQ connection and channel
+    product_event_publisher.start() # Drains the in-memory event outbox in the background
     
-    # Start RabbitMQ consumer in the background
-    # Ensure this doesn't block startup; it should run as a background task
-    asyncio.create_task(start_product_event_consumer(default_message_processor))
+    # Start RabbitMQ consumer in this process unless it runs separately (python -m app.consumer)
+    consumer = None
+    if CONSUMER_MODE == "embedded":
+        consumer = await start_product_event_consumer(default_message_processor)
+
+    # Relay outbox events to RabbitMQ (only the lease holder across all processes publishes)
+    outbox_relay = asyncio.create_task(run_outbox_relay())
+
+    # Listen for cache invalidations from other workers/replicas so local entries stay consistent
+    invalidation_listener = asyncio.create_task(run_invalidation_listener())
     
     # Seed data if needed (optional, can be run once manually or via a script)
     # await crud.seed_initial_products() 
+
+    # Preload hot products and the first list pages in the background; /health stays 503 until it ends
+    async def warm_product(product_id: str) -> Optional[bytes]:
+        # Not counted as a hit, or every deploy would re-rank the ids it just warmed
+        entry = await get_cached_product(await get_redis_client(), product_id, record_hit=False)
+        return entry.payload if entry is not None else None
+
+    async def warm_page(**query) -> bytes:
+        return (await get_cached_product_page(await get_redis_client(), **query)).payload
+
+    cache_warmup = asyncio.create_task(run_cache_warmup(warm_product, warm_page))
+    hot_product_tracker = asyncio.create_task(run_hot_product_tracker())
+    # Applies stock reservations to Mongo (only the lease holder across all processes flushes)
+    stock_flusher = asyncio.create_task(run_stock_flusher())
+    # Autocomplete index (SEARCH_PREFIX_INDEX_ENABLED); until it is built, suggestions come from Mongo
+    prefix_index = asyncio.create_task(run_prefix_index())
     
+    app.state.consumer = consumer
     yield # Application is now running
     
-    print("Application shutdown...")
+    logger.info("Application shutdown...")
+    prefix_index.cancel()
+    stock_flusher.cancel()
+    hot_product_tracker.cancel()
+    cache_warmup.cancel()
+    invalidation_listener.cancel()
+    outbox_relay.cancel()
+    redis_health_monitor.cancel()
+    await flush_pending_stock()
     # Clean up resources
+    if consumer is not None:
+        await consumer.stop()
+    await product_event_publisher.stop(EVENT_PUBLISHER_DRAIN_SECONDS)
     await close_rabbitmq_connection()
     await close_redis_client()
     await close_mongo_db()
@@ -53,16 +126,73 @@ app = FastAPI(
     version=API_VERSION,
     description=API_DESCRIPTION,
     contact={"name": CONTACT_NAME, "email": CONTACT_EMAIL},
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse, # orjson instead of stdlib json for model/dict responses
 )
+app.add_middleware(CompressionMiddleware)
+# Outside compression, so rejected requests cost nothing but the response itself
+app.add_middleware(AdmissionControlMiddleware)
+app.add_middleware(MetricsMiddleware) # Added last, so outermost: request latency includes compression and queueing
+
+def _component_metrics():
+    """ Scrape-time view of the publisher/consumer/relay stats and the Redis circuit breaker. """
+    consumer = getattr(app.state, "consumer", None)
+    sections = [("py_api_event_publisher", product_event_publisher.stats())]
+    if consumer is not None:
+        sections.append(("py_api_event_consumer", consumer.stats()))
+    if OUTBOX_ENABLED:
+        sections.append(("py_api_outbox_relay", relay_stats))
+    sections.append(("py_api_stock_flusher", stock_stats))
+    if SEARCH_PREFIX_INDEX_ENABLED:
+        sections.append(("py_api_search_prefix_index", prefix_index_state))
+    for prefix, stats in sections:
+        for name, value in stats.items():
+            if isinstance(value, (int, float)):
+                yield f"{prefix}_{name}", "untyped", f"{prefix} stat {name}.", [({}, value)]
+    admission = admission_stats()
+    for name, help_text in (
+        ("limit", "Current adaptive concurrency limit per route class."),
+        ("in_flight", "Admitted requests in progress per route class."),
+        ("queued", "Requests waiting for a slot per route class."),
+    ):
+        yield f"py_api_admission_{name}", "gauge", help_text, [
+            ({"route_class": route_class}, stats[name]) for route_class, stats in admission.items()
+        ]
+    yield "py_api_circuit_breaker_open", "gauge", "1 while the breaker skips the dependency.", [
+        ({"name": redis_breaker.name}, redis_breaker.is_open)
+    ]
+    yield "py_api_log_records_dropped_total", "counter", "Log records dropped because the writer fell behind.", [
+        ({}, dropped_log_records())
+    ]
 
-# Dependency for Redis client
+register_collector(_component_metrics)
+
+# Dependency for Redis client (None while the Redis circuit breaker is open)
 async def get_redis_dep() -> Optional[aioredis.Redis]:
     return await get_redis_client()
 
 @app.get("/health", tags=["General"])
-async def health_check():
-    return {"status": "Healthy"}
+async def health_check(request: Request):
+    consumer = getattr(request.app.state, "consumer", None)
+    content = {
+        "status": "Healthy" if warmup_finished() else "Warming up",
+        "cache_warmup": warmup_state,
+        "event_publisher": product_event_publisher.stats(),
+        "event_consumer": consumer.stats() if consumer is not None else None,
+        "outbox_relay": relay_stats if OUTBOX_ENABLED else None,
+        "stock_flusher": stock_stats,
+        "admission": admission_stats(),
+        "search_prefix_index": prefix_index_state if SEARCH_PREFIX_INDEX_ENABLED else None,
+    }
+    if not warmup_finished():
+        # Not ready yet: load balancers and readiness probes keep traffic away until warm-up ends
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=content)
+    return content
+
+@app.get("/metrics", tags=["General"], response_class=PlainTextResponse)
+async def metrics():
+    """ Prometheus text exposition format. """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get("/", tags=["General"], response_model=Dict[str, Any])
 async def root():
@@ -81,79 +211,287 @@ async def create_new_product(
         created_product = await crud.create_product(product)
         if redis:
             try:
-                await redis.delete(ALL_PRODUCTS_CACHE_KEY)
-                print(f"Cache invalidated for {ALL_PRODUCTS_CACHE_KEY} on product creation.")
+                await invalidate_keys(redis) # New product only affects the list pages
+                logger.debug("List cache generation bumped on product creation.", extra={"sampled": True})
             except Exception as e:
-                print(f"Redis DEL error on product creation: {e}")
+                logger.warning("Redis DEL error on product creation: %s", e)
         
-        # Publish event (convert Pydantic model to dict for publishing)
-        # Ensure 'id' is stringified if it's an ObjectId in the model for RabbitMQ
-        product_event_data = created_product.model_dump(mode='json') # Pydantic v2
-        if '_id' in product_event_data and not isinstance(product_event_data['_id'], str):
-             product_event_data['id'] = str(product_event_data.pop('_id')) # Use 'id' as key
-        elif 'id' in product_event_data and not isinstance(product_event_data['id'], str):
-             product_event_data['id'] = str(product_event_data['id'])
-
-        await publish_product_event("product.created", product_event_data)
+        if not OUTBOX_ENABLED: # Otherwise crud recorded the event in the outbox with the write
+            await publish_product_event("product.created", get_product_event_data(created_product))
         return created_product
     except Exception as e:
-        # Log the exception e
+        logger.exception("Failed to create product")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to create product: {str(e)}")
 
-@app.get("/products", response_model=List[ProductResponse], tags=["Products"])
-async def read_products(
-    skip: int = 0, 
-    limit: int = 100, 
-    redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
-):
-    if redis:
+async def _load_products(lookups: List[Tuple[str, bool]]) -> List[Optional[bytes]]:
+    """ Batch function for product cache misses: one $in query per read preference. """
+    payloads: List[Optional[bytes]] = [None] * len(lookups)
+    for allow_secondary, indexes in group_indexes(lookups, lambda lookup: lookup[1]):
+        products = await crud.get_products_by_ids([lookups[index][0] for index in indexes], allow_secondary)
+        with SERIALIZATION_SECONDS.time():
+            for index in indexes:
+                product = products.get(lookups[index][0])
+                payloads[index] = product_to_json(product) if product is not None else None
+    return payloads
+
+# Cache misses for different ids in the same tick share one Mongo query
+product_lookups = Batcher("mongo_product", _load_products)
+
+async def get_cached_product(
+    redis: Optional[aioredis.Redis], product_id: str, record_hit: bool = True
+) -> Optional[CacheEntry]:
+    """ Serialized product and its ETag (or None): local cache -> Redis -> batched Mongo lookup (see cache.get_or_load_entry). """
+    cache_key = get_product_cache_key(product_id)
+
+    async def load_product() -> Optional[bytes]:
+        # Cache misses read from a secondary, except right after this product was written
+        return await product_lookups.load((product_id, not written_recently(cache_key)))
+
+    entry = await get_or_load_entry(redis, cache_key, load_product)
+    if entry is not None and record_hit:
+        record_product_hit(product_id) # Feeds the hot set preloaded by the next warm-up
+    return entry
+
+async def get_cached_product_page(
+    redis: Optional[aioredis.Redis],
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    order: str = "asc",
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    in_stock: Optional[bool] = None,
+) -> CacheEntry:
+    """ Serialized product list page (and its ETag) for GET /products query parameters, through the list cache. """
+    query = dict(
+        limit=limit, cursor=cursor, sort=sort, order=order,
+        min_price=min_price, max_price=max_price, in_stock=in_stock,
+    )
+
+    async def load_page() -> bytes:
+        products, next_cursor = await crud.get_all_products(
+            **query,
+            # Secondary unless the catalog just changed (a lagging secondary would cache the old page)
+            allow_secondary=not written_recently(PRODUCT_LIST_GENERATION_KEY),
+        )
+        # Cache the whole page as the exact response body, so a hit is one round trip and no parsing
+        with SERIALIZATION_SECONDS.time():
+            return product_page_to_json(products, next_cursor)
+
+    cache_key = None
+    if redis and LIST_CACHE_ENABLED:
         try:
-            cached_products = await redis.get(ALL_PRODUCTS_CACHE_KEY)
-            if cached_products:
-                print(f"Cache hit for {ALL_PRODUCTS_CACHE_KEY}")
-                # Deserialize carefully, Pydantic List[ProductResponse] expects a list of dicts
-                product_list_dict = json.loads(cached_products)
-                return [ProductResponse.model_validate(p_dict) for p_dict in product_list_dict]
+            generation = await get_list_generation(redis)
+            cache_key = get_product_list_cache_key(generation, **query)
         except Exception as e:
-            print(f"Redis GET error for {ALL_PRODUCTS_CACHE_KEY}: {e}")
+            logger.warning("Redis GET error for product list generation: %s", e)
 
-    products = await crud.get_all_products(skip=skip, limit=limit)
-    if redis:
+    if cache_key is None:
+        return uncached_entry(await load_page())
+    # List pages live in Redis only; the generation in the key already makes them consistent
+    return await get_or_load_entry(redis, cache_key, load_page, use_local=False)
+
+async def get_cached_search_page(
+    redis: Optional[aioredis.Redis],
+    q: str,
+    match: str = "prefix",
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    in_stock: Optional[bool] = None,
+) -> CacheEntry:
+    """ Serialized search result page (and its ETag) for GET /products/search, cached for SEARCH_CACHE_TTL_SECONDS. """
+    query = dict(
+        q=q, match=match, limit=limit, cursor=cursor,
+        min_price=min_price, max_price=max_price, in_stock=in_stock,
+    )
+
+    async def load_page() -> bytes:
+        products, next_cursor = await crud.search_products(
+            **query, allow_secondary=not written_recently(PRODUCT_LIST_GENERATION_KEY),
+        )
+        with SERIALIZATION_SECONDS.time():
+            return product_page_to_json(products, next_cursor)
+
+    return await _get_cached_search_entry(redis, load_page, query)
+
+async def get_cached_suggestions(redis: Optional[aioredis.Redis], prefix: str, limit: int) -> CacheEntry:
+    """ Autocomplete suggestions from a Mongo prefix search, for when the in-process index is not available. """
+    query = dict(q=prefix, match="autocomplete", limit=limit)
+
+    async def load_suggestions() -> bytes:
+        products, _next_cursor = await crud.search_products(
+            prefix, "prefix", limit, allow_secondary=not written_recently(PRODUCT_LIST_GENERATION_KEY),
+        )
+        return orjson.dumps({"suggestions": [{"id": product.id, "name": product.name} for product in products]})
+
+    return await _get_cached_search_entry(redis, load_suggestions, query)
+
+async def _get_cached_search_entry(redis: Optional[aioredis.Redis], loader, query: Dict[str, Any]) -> CacheEntry:
+    cache_key = None
+    if redis and SEARCH_CACHE_ENABLED:
         try:
-            # Serialize for cache: list of dicts
-            products_for_cache = [p.model_dump(mode='json') for p in products]
-            await redis.setex(ALL_PRODUCTS_CACHE_KEY, CACHE_EXPIRATION_SECONDS, json.dumps(products_for_cache))
-            print(f"Cached data for {ALL_PRODUCTS_CACHE_KEY}")
+            # Under the list generation, so any catalog write retires every cached search at once
+            generation = await get_list_generation(redis)
+            cache_key = get_product_search_cache_key(generation, **query)
         except Exception as e:
-            print(f"Redis SETEX error for {ALL_PRODUCTS_CACHE_KEY}: {e}")
-    return products
+            logger.warning("Redis GET error for product list generation: %s", e)
+
+    if cache_key is None:
+        return uncached_entry(await loader())
+    # Redis only: there are too many distinct queries for the small local cache to help
+    return await get_or_load_entry(redis, cache_key, loader, use_local=False)
+
+def _etag_headers(etag: str) -> Dict[str, str]:
+    # no-cache: clients and proxies may store the body but must revalidate (cheap with If-None-Match)
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """ If-None-Match check (weak comparison, so W/ tags from a compressing proxy still match). """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag))
+
+def cached_json_response(request: Request, entry: CacheEntry) -> Response:
+    """ The cached bytes with their ETag, or an empty 304 when the client already has them; never decodes the payload. """
+    if etag_matches(request, entry.etag):
+        return not_modified_response(entry.etag)
+    # Already serialized the way response_model would; skip validation and re-serialization
+    return Response(content=entry.payload, media_type="application/json", headers=_etag_headers(entry.etag))
+
+def _parse_ids(ids: str) -> List[str]:
+    product_ids = list(dict.fromkeys(product_id.strip() for product_id in ids.split(",") if product_id.strip()))
+    if len(product_ids) > PRODUCT_MULTI_GET_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {PRODUCT_MULTI_GET_MAX_IDS} ids can be requested at once"
+        )
+    return product_ids
+
+@app.get("/products", response_model=ProductListResponse, tags=["Products"])
+async def read_products(
+    request: Request,
+    ids: Optional[str] = Query(
+        None, description="Comma-separated product ids to fetch in one call; the other parameters are ignored"
+    ),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    sort: Literal["id", "updated_at", "price"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    min_price: Optional[Decimal] = Query(None, ge=0),
+    max_price: Optional[Decimal] = Query(None, ge=0),
+    in_stock: Optional[bool] = None,
+    redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
+):
+    if ids is not None:
+        # Multi-get: every lookup goes through the same batched cache reads and Mongo query;
+        # unknown ids are left out and the order of the found ones is kept
+        entries = await asyncio.gather(*[get_cached_product(redis, product_id) for product_id in _parse_ids(ids)])
+        entries = [entry for entry in entries if entry is not None]
+        # ETag of the page from the products' ETags, so a 304 doesn't even assemble the page
+        etag = make_etag("".join(entry.etag for entry in entries).encode())
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        return Response(
+            content=product_page_from_payloads([entry.payload for entry in entries]),
+            media_type="application/json",
+            headers=_etag_headers(etag),
+        )
+
+    try:
+        page = await get_cached_product_page(
+            redis, limit=limit, cursor=cursor, sort=sort, order=order,
+            min_price=min_price, max_price=max_price, in_stock=in_stock,
+        )
+    except crud.InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return cached_json_response(request, page)
+
+async def _export_ndjson(batches: AsyncIterator[List[ProductResponse]], compress: bool) -> AsyncIterator[bytes]:
+    # One chunk per Mongo batch: the ASGI server only asks for the next one once the
+    # previous chunk has been sent, so a slow client slows the cursor instead of buffering.
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None # wbits=31: gzip container
+    async for batch in batches:
+        chunk = b"".join(product_to_json(product) + b"\n" for product in batch)
+        if compressor is not None:
+            chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield chunk
+    if compressor is not None:
+        yield compressor.flush()
+
+@app.get("/products/export", tags=["Products"], response_class=StreamingResponse, responses={
+    200: {"content": {"application/x-ndjson": {}}, "description": "One product JSON document per line"}
+})
+async def export_products(
+    request: Request,
+    batch_size: int = Query(EXPORT_BATCH_SIZE, ge=1, le=EXPORT_MAX_BATCH_SIZE),
+    gzip: Optional[bool] = Query(None, description="Gzip the stream; defaults to the request's Accept-Encoding"),
+    min_price: Optional[Decimal] = Query(None, ge=0),
+    max_price: Optional[Decimal] = Query(None, ge=0),
+    in_stock: Optional[bool] = None,
+):
+    """ Streams the full catalog as NDJSON straight from the Mongo cursor with bounded memory. """
+    if gzip is None:
+        gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    batches = crud.iter_product_batches(batch_size, min_price=min_price, max_price=max_price, in_stock=in_stock)
+    headers = {"Content-Disposition": 'attachment; filename="products.ndjson"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(_export_ndjson(batches, gzip), media_type="application/x-ndjson", headers=headers)
+
+@app.get("/products/search", response_model=ProductListResponse, tags=["Products"])
+async def search_catalog(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100, description="Name prefix, or words to look for with match=text"),
+    match: Literal["prefix", "text"] = Query(
+        "prefix", description="prefix: names starting with q, in name order; text: names containing q's words, by relevance"
+    ),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    min_price: Optional[Decimal] = Query(None, ge=0),
+    max_price: Optional[Decimal] = Query(None, ge=0),
+    in_stock: Optional[bool] = None,
+    redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
+):
+    try:
+        page = await get_cached_search_page(
+            redis, q, match=match, limit=limit, cursor=cursor,
+            min_price=min_price, max_price=max_price, in_stock=in_stock,
+        )
+    except crud.InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return cached_json_response(request, page)
+
+@app.get("/products/autocomplete", response_model=ProductSuggestionResponse, tags=["Products"])
+async def autocomplete_products(
+    request: Request,
+    prefix: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=AUTOCOMPLETE_MAX_LIMIT),
+    redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
+):
+    """ Product names starting with prefix (case-insensitive), from the in-process index when it is enabled and built. """
+    if prefix_index_ready():
+        return {"suggestions": product_prefix_index.suggest(prefix, limit)}
+    return cached_json_response(request, await get_cached_suggestions(redis, prefix, limit))
 
 @app.get("/products/{product_id}", response_model=ProductResponse, tags=["Products"])
 async def read_product_by_id(
     product_id: str, 
+    request: Request,
     redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
 ):
-    cache_key = get_product_cache_key(product_id)
-    if redis:
-        try:
-            cached_product = await redis.get(cache_key)
-            if cached_product:
-                print(f"Cache hit for product {product_id}")
-                return ProductResponse.model_validate(json.loads(cached_product))
-        except Exception as e:
-            print(f"Redis GET error for product {product_id}: {e}")
-
-    db_product = await crud.get_product_by_id(product_id)
-    if db_product is None:
+    cached_product = await get_cached_product(redis, product_id)
+    if cached_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-    
-    if redis:
-        try:
-            await redis.setex(cache_key, CACHE_EXPIRATION_SECONDS, db_product.model_dump_json()) # Pydantic v2
-            print(f"Cached data for product {product_id}")
-        except Exception as e:
-            print(f"Redis SETEX error for product {product_id}: {e}")
-    return db_product
+    return cached_json_response(request, cached_product)
 
 @app.put("/products/{product_id}", response_model=ProductResponse, tags=["Products"])
 async def update_existing_product(
@@ -161,26 +499,20 @@ async def update_existing_product(
     product_update: ProductUpdate, 
     redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
 ):
-    updated_product = await crud.update_product_by_id(product_id, product_update)
+    # The written stock replaces the reservation counter; reservations wait for the write
+    stock_ids = [product_id] if "stock" in product_update.model_fields_set and ObjectId.is_valid(product_id) else []
+    async with stock_write_fence(redis, stock_ids) as stock_flush:
+        updated_product, written = await crud.update_product_by_id(product_id, product_update, stock_flush=stock_flush)
     if updated_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    if not written: # Empty update: nothing changed, so no cache work and no event
+        return updated_product
     
-    if redis:
-        try:
-            # Invalidate specific product cache and all products list cache
-            await redis.delete(get_product_cache_key(product_id))
-            await redis.delete(ALL_PRODUCTS_CACHE_KEY)
-            print(f"Cache invalidated for product {product_id} and {ALL_PRODUCTS_CACHE_KEY} on update.")
-        except Exception as e:
-            print(f"Redis DEL error on product update for {product_id}: {e}")
-
-    product_event_data = updated_product.model_dump(mode='json')
-    if '_id' in product_event_data and not isinstance(product_event_data['_id'], str):
-         product_event_data['id'] = str(product_event_data.pop('_id'))
-    elif 'id' in product_event_data and not isinstance(product_event_data['id'], str):
-         product_event_data['id'] = str(product_event_data['id'])
-         
-    await publish_product_event("product.updated", product_event_data)
+    # Write the new version into the cache (every tier, every pod) and bump the list generation
+    await _write_through_products(redis, [updated_product])
+
+    if not OUTBOX_ENABLED:
+        await publish_product_event("product.updated", get_product_event_data(updated_product))
     return updated_product
 
 @app.delete("/products/{product_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Products"])
@@ -188,20 +520,214 @@ async def remove_product(
     product_id: str, 
     redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
 ):
-    deleted = await crud.delete_product_by_id(product_id)
+    async with stock_write_fence(redis, [product_id] if ObjectId.is_valid(product_id) else []):
+        deleted = await crud.delete_product_by_id(product_id)
     if not deleted:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
     
+    await _write_through_deletes(redis, [product_id])
+            
+    if not OUTBOX_ENABLED:
+        await publish_product_event("product.deleted", get_product_deleted_event_data(product_id))
+    return JSONResponse(status_code=status.HTTP_204_NO_CONTENT, content=None)
+
+async def _adjust_stock_or_raise(
+    redis: Optional[aioredis.Redis], product_id: str, delta: int
+) -> StockAdjustmentResponse:
+    if redis is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Stock service unavailable")
+    try:
+        applied, available = await adjust_stock(redis, product_id, delta)
+    except StockProductNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    except StockSeedConflictError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except aioredis.RedisError as e:
+        report_redis_error(e)
+        logger.warning("Redis stock error for %s: %s", product_id, e)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Stock service unavailable")
+    if not applied:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=f"Insufficient stock: {available} available"
+        )
+    return StockAdjustmentResponse(id=product_id, quantity=abs(delta), available=available)
+
+@app.post("/products/{product_id}/reserve", response_model=StockAdjustmentResponse, tags=["Stock"])
+async def reserve_stock(
+    product_id: str,
+    reservation: StockAdjustment,
+    redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
+):
+    """ Takes quantity units of stock atomically, or fails with 409 without taking any. """
+    return await _adjust_stock_or_raise(redis, product_id, -reservation.quantity)
+
+@app.post("/products/{product_id}/release", response_model=StockAdjustmentResponse, tags=["Stock"])
+async def release_stock(
+    product_id: str,
+    release: StockAdjustment,
+    redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
+):
+    """ Gives back quantity units of a reservation (e.g. an abandoned checkout). """
+    return await _adjust_stock_or_raise(redis, product_id, release.quantity)
+
+def _check_batch_size(items: list):
+    if not items:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Batch is empty")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds the maximum of {BATCH_MAX_ITEMS} items"
+        )
+
+# Server error codes of failed bulk-write items -> item status; anything else is a 500
+_WRITE_ERROR_STATUSES = {
+    11000: status.HTTP_409_CONFLICT, # Duplicate key
+    121: status.HTTP_422_UNPROCESSABLE_ENTITY, # Document failed collection validation
+}
+
+def _write_error_result(index: int, product_id: Optional[str], error: crud.ItemWriteError) -> ProductBatchItemResult:
+    item_status = _WRITE_ERROR_STATUSES.get(error.code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return ProductBatchItemResult(index=index, id=product_id, status=item_status, error=error.message)
+
+def _batch_response(results: List[ProductBatchItemResult]) -> ProductBatchResponse:
+    failed = sum(1 for result in results if result.error is not None)
+    return ProductBatchResponse(succeeded=len(results) - failed, failed=failed, results=results)
+
+async def _invalidate_batch(redis: Optional[aioredis.Redis], product_ids: List[str]):
     if redis:
         try:
-            await redis.delete(get_product_cache_key(product_id))
-            await redis.delete(ALL_PRODUCTS_CACHE_KEY)
-            print(f"Cache invalidated for product {product_id} and {ALL_PRODUCTS_CACHE_KEY} on delete.")
+            # One pipelined round trip for all product keys, the list generation and the pub/sub fan-out
+            await invalidate_keys(redis, *[get_product_cache_key(product_id) for product_id in product_ids])
         except Exception as e:
-            print(f"Redis DEL error on product delete for {product_id}: {e}")
-            
-    await publish_product_event("product.deleted", {"id": product_id}) # Only ID needed for delete event
-    return JSONResponse(status_code=status.HTTP_204_NO_CONTENT, content=None)
+            logger.warning("Redis DEL error on batch write: %s", e)
+
+async def _write_cache_changes(redis: Optional[aioredis.Redis], changes: List[ProductChange]):
+    try:
+        await write_through(redis, changes)
+        logger.info("Cache written through for %d products and list pages.", len(changes), extra={"sampled": True})
+    except Exception as e:
+        # Readers may see the old entry until the event consumer or the TTL replaces it
+        logger.warning("Redis write-through error for %d products: %s", len(changes), e)
+
+async def _write_through_products(redis: Optional[aioredis.Redis], products: List[ProductResponse]):
+    """ Puts written products into the cache, versioned by updated_at like their events. """
+    await _write_cache_changes(redis, [
+        ProductChange(get_product_cache_key(str(p.id)), get_event_version(p.updated_at), product_to_json(p))
+        for p in products
+    ])
+
+async def _write_through_deletes(redis: Optional[aioredis.Redis], product_ids: List[str]):
+    """ Leaves a tombstone for deleted products, so an older event or a lagging read can't bring them back. """
+    version = get_event_version(datetime.utcnow())
+    await _write_cache_changes(redis, [
+        ProductChange(get_product_cache_key(product_id), version, None) for product_id in product_ids
+    ])
+
+@app.post("/products:batch", response_model=ProductBatchResponse, tags=["Products"])
+async def create_products_batch(
+    products: List[ProductCreate],
+    redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
+):
+    _check_batch_size(products)
+    results = []
+    created_products = []
+    for index, (created_product, error) in enumerate(await crud.create_products(products)):
+        if error is not None:
+            results.append(_write_error_result(index, None, error))
+            continue
+        created_products.append(created_product)
+        results.append(ProductBatchItemResult(
+            index=index, id=str(created_product.id), status=status.HTTP_201_CREATED, product=created_product
+        ))
+
+    if created_products:
+        await _invalidate_batch(redis, []) # New products only affect the list pages
+        if not OUTBOX_ENABLED:
+            await publish_product_events("product.created", [get_product_event_data(p) for p in created_products])
+    return _batch_response(results)
+
+@app.patch("/products:batch", response_model=ProductBatchResponse, tags=["Products"])
+async def update_products_batch(
+    updates: List[ProductBatchUpdate],
+    redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
+):
+    _check_batch_size(updates)
+    product_updates = [ProductUpdate(**update.model_dump(exclude={"id"}, exclude_unset=True)) for update in updates]
+    stock_ids = list(dict.fromkeys(
+        update.id for update, product_update in zip(updates, product_updates)
+        if "stock" in product_update.model_fields_set and ObjectId.is_valid(update.id)
+    ))
+    async with stock_write_fence(redis, stock_ids) as stock_flush:
+        update_results = await crud.update_products([
+            (update.id, product_update) for update, product_update in zip(updates, product_updates)
+        ], stock_flush=stock_flush)
+
+    results = []
+    updated_products: Dict[str, ProductResponse] = {} # Products actually written, for the cache and events
+    for index, (updated_product, error) in enumerate(update_results):
+        update, product_update = updates[index], product_updates[index]
+        if error is not None:
+            results.append(_write_error_result(index, update.id, error))
+        elif updated_product is not None:
+            results.append(ProductBatchItemResult(
+                index=index, id=update.id, status=status.HTTP_200_OK, product=updated_product
+            ))
+            if product_update.model_fields_set: # Empty updates don't write anything
+                updated_products[update.id] = updated_product
+        elif not ObjectId.is_valid(update.id):
+            results.append(ProductBatchItemResult(
+                index=index, id=update.id, status=status.HTTP_400_BAD_REQUEST, error="Invalid product id"
+            ))
+        else:
+            results.append(ProductBatchItemResult(
+                index=index, id=update.id, status=status.HTTP_404_NOT_FOUND, error="Product not found"
+            ))
+
+    if updated_products:
+        await _write_through_products(redis, list(updated_products.values()))
+        if not OUTBOX_ENABLED:
+            await publish_product_events(
+                "product.updated", [get_product_event_data(p) for p in updated_products.values()]
+            )
+    return _batch_response(results)
+
+@app.delete("/products:batch", response_model=ProductBatchResponse, tags=["Products"])
+async def delete_products_batch(
+    batch: ProductBatchDelete,
+    redis: Optional[aioredis.Redis] = Depends(get_redis_dep)
+):
+    _check_batch_size(batch.ids)
+    async with stock_write_fence(redis, list(dict.fromkeys(pid for pid in batch.ids if ObjectId.is_valid(pid)))):
+        deleted_ids = set(await crud.delete_products(batch.ids))
+
+    results = []
+    seen_ids = set()
+    for index, product_id in enumerate(batch.ids):
+        if product_id in seen_ids:
+            results.append(ProductBatchItemResult(
+                index=index, id=product_id, status=status.HTTP_400_BAD_REQUEST, error="Duplicate product id in batch"
+            ))
+            continue
+        seen_ids.add(product_id)
+        if product_id in deleted_ids:
+            results.append(ProductBatchItemResult(index=index, id=product_id, status=status.HTTP_204_NO_CONTENT))
+        elif not ObjectId.is_valid(product_id):
+            results.append(ProductBatchItemResult(
+                index=index, id=product_id, status=status.HTTP_400_BAD_REQUEST, error="Invalid product id"
+            ))
+        else:
+            results.append(ProductBatchItemResult(
+                index=index, id=product_id, status=status.HTTP_404_NOT_FOUND, error="Product not found"
+            ))
+
+    if deleted_ids:
+        await _write_through_deletes(redis, list(deleted_ids))
+        if not OUTBOX_ENABLED:
+            await publish_product_events(
+                "product.deleted", [get_product_deleted_event_data(product_id) for product_id in deleted_ids]
+            )
+    return _batch_response(results)
 
 # To run this app (typically from the services/python-api directory):
 # uvicorn app.main:app --reload --port 8000
+# In production (one worker per core, graceful drain): gunicorn -c gunicorn.conf.py app.main:app
@@ -0,0 +1,257 @@
+"""
+Minimal in-process metrics rendered in the Prometheus text exposition format (GET /metrics).
+
+Label sets are bound once with `.labels(...)` (at import time for the fixed ones) and the
+returned child is reused, so recording a value is a list index and a couple of additions.
+Everything runs on the event loop, so no locking is needed.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Seconds; tuned for cache hits (sub-ms) up to slow Mongo queries
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        registry.append(self)
+
+    def labels(self, *values: str):
+        """ Returns the child for these label values, creating it on first use only. """
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for values, child in self._children.items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.label_names, values)} {child.value}"]
+
+
+class _Timer:
+    __slots__ = ("_child", "_started")
+
+    def __init__(self, child: "_HistogramChild"):
+        self._child = child
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        """ `with child.time(): ...` observes the block's duration. """
+        return _Timer(self)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, label_names)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            bucket_labels = _format_labels(self.label_names, values, f'le="{le}"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        labels = _format_labels(self.label_names, values)
+        lines.append(f"{self.name}_sum{labels} {child.sum}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+registry: List[_Metric] = []
+# Scrape-time collectors for values owned elsewhere (publisher/consumer/relay stats, breaker state).
+# Each returns (name, type, help, [(labels dict, value), ...]).
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+
+def register_collector(collector: Callable):
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, metric_type, documentation, samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                names = tuple(labels)
+                lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {float(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Request metrics (see MetricsMiddleware) ---
+REQUEST_SECONDS = Histogram(
+    "py_api_request_duration_seconds", "HTTP request latency by route template.",
+    ("method", "route", "status"),
+)
+
+# --- Internal stages ---
+STAGE_SECONDS = Histogram(
+    "py_api_stage_duration_seconds", "Latency of internal request stages.", ("stage",)
+)
+REDIS_GET_SECONDS = STAGE_SECONDS.labels("redis_get")
+REDIS_SET_SECONDS = STAGE_SECONDS.labels("redis_set")
+REDIS_LOCK_SECONDS = STAGE_SECONDS.labels("redis_lock")
+REDIS_INVALIDATE_SECONDS = STAGE_SECONDS.labels("redis_invalidate")
+REDIS_STOCK_SECONDS = STAGE_SECONDS.labels("redis_stock")
+MONGO_FIND_SECONDS = STAGE_SECONDS.labels("mongo_find")
+MONGO_INSERT_SECONDS = STAGE_SECONDS.labels("mongo_insert")
+MONGO_UPDATE_SECONDS = STAGE_SECONDS.labels("mongo_update")
+MONGO_DELETE_SECONDS = STAGE_SECONDS.labels("mongo_delete")
+VALIDATION_SECONDS = STAGE_SECONDS.labels("validation")
+SERIALIZATION_SECONDS = STAGE_SECONDS.labels("serialization")
+COMPRESSION_SECONDS = STAGE_SECONDS.labels("compression")
+OUTBOX_INSERT_SECONDS = STAGE_SECONDS.labels("outbox_insert")
+EVENT_PUBLISH_SECONDS = STAGE_SECONDS.labels("event_publish")
+
+BATCH_SIZE = Histogram(
+    "py_api_batch_size", "Items per coalesced batch (see batching.Batcher).", ("loader",),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+# --- Admission control (see admission.AdmissionControlMiddleware) ---
+ADMISSION_REJECTIONS = Counter(
+    "py_api_admission_rejections_total", "Requests refused by admission control, by route class and reason.",
+    ("route_class", "reason"),
+)
+ADMISSION_WAIT_SECONDS = STAGE_SECONDS.labels("admission_wait")
+
+# --- Cache ---
+CACHE_REQUESTS = Counter(
+    "py_api_cache_requests_total", "Cache lookups by key family and result.", ("family", "result")
+)
+CACHE_FAMILIES = ("product", "list", "search", "other")
+CACHE_RESULTS = ("local_hit", "hit", "stale_hit", "miss")
+# Indexed as _CACHE_RESULT_CHILDREN[family][result]
+_CACHE_RESULT_CHILDREN = {
+    family: {result: CACHE_REQUESTS.labels(family, result) for result in CACHE_RESULTS}
+    for family in CACHE_FAMILIES
+}
+
+
+def record_cache_result(family: str, result: str):
+    _CACHE_RESULT_CHILDREN[family][result].inc()
+
+
+_STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+# Any other method (clients can send arbitrary ones) is recorded as "other"
+_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+
+# endpoint function -> path template (e.g. /products/{product_id}), so ids don't explode the label set
+_route_templates: Dict[Callable, str] = {}
+
+
+def register_routes(routes) -> None:
+    """ Maps endpoints to their path templates and pre-registers their latency series. """
+    for route in routes:
+        endpoint = getattr(route, "endpoint", None)
+        if endpoint is None:
+            continue
+        _route_templates[endpoint] = route.path
+        for method in getattr(route, "methods", None) or ():
+            for status_class in _STATUS_CLASSES[1:]:
+                REQUEST_SECONDS.labels(method, route.path, status_class)
+
+
+class MetricsMiddleware:
+    """ Pure ASGI middleware recording REQUEST_SECONDS per route template and status class. """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched endpoint in the scope
+            route = _route_templates.get(scope.get("endpoint"), "unmatched")
+            status_class = _STATUS_CLASSES[min(max(status_code // 100, 1), 5) - 1]
+            method = scope["method"] if scope["method"] in _METHODS else "other"
+            REQUEST_SECONDS.labels(method, route, status_class).observe(
+                time.perf_counter() - started
+            )
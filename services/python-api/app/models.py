@@ -1,94 +1,152 @@
-from pydantic import BaseModel, Field, validator
-from typing import Optional, List
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, PlainSerializer, TypeAdapter, WithJsonSchema
+from typing import Annotated, Any, Optional, List
 from datetime import datetime
 from decimal import Decimal
-import uuid # For potential future use if _id is not from Mongo
-
-# For MongoDB _id field, which is an ObjectId, but often represented as str in Pydantic
-# We can create a custom type or use a Field alias if needed, but for simplicity,
-# we'll often use str and handle conversion if necessary.
-# Pydantic v2 handles ObjectId from MongoDB more gracefully with `model_dump(mode='json')`.
-
-class PyObjectId(str):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
-
-    @classmethod
-    def validate(cls, v, field_info): # field_info is for Pydantic v2
-        if not isinstance(v, (str, uuid.UUID)) and not hasattr(v, 'is_valid'): # Basic check for ObjectId-like
-             # A more robust check for ObjectId would be `if not ObjectId.is_valid(str(v)):`
-             # but that requires importing bson.ObjectId which we try to avoid in pure Pydantic models
-            if not isinstance(v, str) or not len(v) == 24: # Basic check for typical ObjectId string length
-                 # This is a simplified check. For true ObjectId validation, you'd use bson.objectid.ObjectId.is_valid
-                pass # Allow it for now, FastAPI/Motor might handle it. Or raise ValueError.
-        return str(v)
-
-    @classmethod
-    def __modify_schema__(cls, field_schema): # Pydantic v1 style
-        field_schema.update(type="string", example="60c72b2f9b1e8a5f68d672c3")
-    
-    # For Pydantic v2, you might use `json_schema_extra` in the Field or model config.
+from bson import ObjectId
+
+# Native Pydantic v2 types: validation and serialization run inside pydantic-core,
+# with no per-field Python hooks except the ObjectId -> str and float -> Decimal conversions below.
+
+def _object_id_to_str(value: Any) -> Any:
+    return str(value) if isinstance(value, ObjectId) else value
+
+# MongoDB _id, exposed as its 24-character hex string
+PyObjectId = Annotated[
+    str,
+    BeforeValidator(_object_id_to_str),
+    WithJsonSchema({"type": "string", "example": "60c72b2f9b1e8a5f68d672c3"}),
+]
+
+def _float_to_decimal(value: Any) -> Any:
+    # Through str, so 19.99 becomes Decimal("19.99") rather than the binary float's exact expansion
+    return Decimal(str(value)) if isinstance(value, float) else value
+
+# Prices are Decimal in Python and plain numbers in JSON (responses and events)
+Price = Annotated[
+    Decimal,
+    BeforeValidator(_float_to_decimal),
+    PlainSerializer(float, return_type=float, when_used="json"),
+]
 
 
 class ProductBase(BaseModel):
-    name: str = Field(..., min_length=1, example="Awesome Gadget")
-    price: Decimal = Field(..., gt=0, example=19.99)
-    stock: int = Field(default=0, ge=0, example=100)
-
-    @validator('price', pre=True, always=True)
-    def price_to_decimal(cls, v):
-        if isinstance(v, float):
-            return Decimal(str(v))
-        if isinstance(v, str):
-            try:
-                return Decimal(v)
-            except:
-                raise ValueError("Invalid price format")
-        if isinstance(v, Decimal):
-            return v
-        raise TypeError("Price must be a float, string, or Decimal")
+    name: str = Field(..., min_length=1, examples=["Awesome Gadget"])
+    price: Price = Field(..., gt=0, examples=[19.99])
+    stock: int = Field(default=0, ge=0, examples=[100])
 
 class ProductCreate(ProductBase):
     pass
 
 class ProductUpdate(ProductBase):
-    name: Optional[str] = Field(None, min_length=1, example="Updated Gadget")
-    price: Optional[Decimal] = Field(None, gt=0, example=29.99)
-    stock: Optional[int] = Field(None, ge=0, example=150)
+    name: Optional[str] = Field(None, min_length=1, examples=["Updated Gadget"])
+    price: Optional[Price] = Field(None, gt=0, examples=[29.99])
+    stock: Optional[int] = Field(None, ge=0, examples=[150])
 
 class ProductInDBBase(ProductBase):
-    id: PyObjectId = Field(alias="_id", default_factory=lambda: str(uuid.uuid4()), example="60c72b2f9b1e8a5f68d672c3") # Using str for _id
-    created_at: datetime = Field(default_factory=datetime.utcnow, example=datetime.utcnow().isoformat())
-    updated_at: datetime = Field(default_factory=datetime.utcnow, example=datetime.utcnow().isoformat())
-    
-    class Config:
-        from_attributes = True # Pydantic v2 (formerly orm_mode = True)
-        populate_by_name = True # Allows use of alias "_id" for "id"
-        json_encoders = {
-            Decimal: lambda v: float(v), # Serialize Decimal as float in JSON responses
-            datetime: lambda dt: dt.isoformat(),
-            PyObjectId: lambda oid: str(oid) # Ensure PyObjectId is str in JSON
-        }
+    model_config = ConfigDict(
+        from_attributes=True, # formerly orm_mode = True
+        populate_by_name=True, # Allows use of alias "_id" for "id"
+    )
+
+    id: PyObjectId = Field(alias="_id", default_factory=lambda: str(ObjectId()))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class ProductResponse(ProductInDBBase):
     pass
 
+# Serialize products exactly as FastAPI would for response_model=ProductResponse
+# (by alias, so "_id"), so cached bytes can be returned to clients untouched.
+def product_to_json(product: ProductResponse) -> bytes:
+    return product.model_dump_json(by_alias=True).encode()
+
+# Validates/serializes whole lists in one pydantic-core call instead of one call per item
+product_list_adapter = TypeAdapter(List[ProductResponse])
+
+def products_from_docs(product_docs: List[dict]) -> List[ProductResponse]:
+    return product_list_adapter.validate_python(product_docs)
+
+def products_to_json(products: List[ProductResponse]) -> bytes:
+    return product_list_adapter.dump_json(products, by_alias=True)
+
 class ProductListResponse(BaseModel):
     products: List[ProductResponse]
+    next_cursor: Optional[str] = None # Pass back as ?cursor= to fetch the next page; null on the last page
+
+def _page_json(products_json: bytes, next_cursor: Optional[str]) -> bytes:
+    # Same layout FastAPI produces for response_model=ProductListResponse
+    cursor_json = b"null" if next_cursor is None else b'"' + next_cursor.encode() + b'"'
+    return b'{"products":' + products_json + b',"next_cursor":' + cursor_json + b"}"
+
+def product_page_to_json(products: List[ProductResponse], next_cursor: Optional[str]) -> bytes:
+    return _page_json(products_to_json(products), next_cursor)
+
+def product_page_from_payloads(payloads: List[bytes], next_cursor: Optional[str] = None) -> bytes:
+    """ Page built from already-serialized products (e.g. cached entries), without re-parsing them. """
+    return _page_json(b"[" + b",".join(payloads) + b"]", next_cursor)
+
+# GET /products/autocomplete
+class ProductSuggestion(BaseModel):
+    id: str
+    name: str
+
+class ProductSuggestionResponse(BaseModel):
+    suggestions: List[ProductSuggestion]
+
+# Stock reservations (POST /products/{id}/reserve and /release)
+class StockAdjustment(BaseModel):
+    quantity: int = Field(..., ge=1, examples=[1])
+
+class StockAdjustmentResponse(BaseModel):
+    id: str
+    quantity: int
+    available: int # Stock left after this reservation/release
+
+# Batch endpoints (/products:batch)
+class ProductBatchUpdate(ProductUpdate):
+    id: str = Field(..., examples=["60c72b2f9b1e8a5f68d672c3"])
+
+class ProductBatchDelete(BaseModel):
+    ids: List[str] = Field(..., examples=[["60c72b2f9b1e8a5f68d672c3"]])
+
+class ProductBatchItemResult(BaseModel):
+    index: int # Position of the item in the request
+    id: Optional[str] = None
+    status: int # HTTP-style status for this item (201/200/204, 400, 404, 409, 422, 500)
+    error: Optional[str] = None
+    product: Optional[ProductResponse] = None
+
+class ProductBatchResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[ProductBatchItemResult]
 
 # For RabbitMQ messages
 class ProductEventData(BaseModel):
     id: Optional[PyObjectId] = None # For delete, only ID might be present
     name: Optional[str] = None
-    price: Optional[Decimal] = None
+    price: Optional[Price] = None # float in the JSON message
     stock: Optional[int] = None
-
-    class Config:
-        json_encoders = {
-            Decimal: lambda v: float(v) # Ensure Decimal is float for JSON message
-        }
+    created_at: Optional[datetime] = None
+    # Version of the product state; for product.deleted, the time of the delete
+    updated_at: Optional[datetime] = None
 
 class ProductEvent(BaseModel):
     event_type: str # e.g., "product.created", "product.updated", "product.deleted"
     data: ProductEventData
+
+
+def json_default(obj: Any) -> Any:
+    """
+    Fallback for types orjson (and the stdlib json module) can't encode natively.
+    Decimal and ObjectId come first since they are in every product payload.
+    """
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
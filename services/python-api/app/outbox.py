@@ -0,0 +1,201 @@
+"""
+Transactional outbox for product events: writes insert their events into OUTBOX_COLLECTION and
+one relay across all processes publishes them with confirms, then deletes what was confirmed.
+
+- Every entry carries its product's version (updated_at in microseconds). The relay publishes in
+  version order, at most one entry per product at a time, and stops relaying a product for the
+  rest of the pass once one of its entries fails, so a product's events are never reordered.
+- With OUTBOX_USE_TRANSACTIONS (needs a replica set) the product write and its entries commit
+  together. Without it the entries are inserted right after the write: a crash in between, or a
+  failed insert (logged and counted, the write still succeeds), loses those events, and
+  consumers only catch up on the next write of the product.
+"""
+import asyncio
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorCollection
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from . import config
+from .config import (
+    get_mongo_db, get_mongo_write_concern,
+    OUTBOX_ENABLED, OUTBOX_COLLECTION, OUTBOX_LEASE_COLLECTION, OUTBOX_USE_TRANSACTIONS,
+    OUTBOX_RELAY_BATCH_SIZE, OUTBOX_RELAY_POLL_SECONDS, OUTBOX_RELAY_LEASE_SECONDS,
+)
+from .rabbitmq_service import get_event_version, get_routing_key, serialize_product_event, product_event_publisher
+from .metrics import OUTBOX_INSERT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Counters for the relay running in this process
+relay_stats: Dict[str, Any] = {"leader": False, "relayed": 0, "failed": 0, "backlog": 0, "insert_failed": 0}
+
+
+async def get_outbox_collection() -> AsyncIOMotorCollection:
+    db = await get_mongo_db()
+    return db.get_collection(OUTBOX_COLLECTION, write_concern=get_mongo_write_concern())
+
+
+@asynccontextmanager
+async def write_session() -> AsyncIterator[Optional[AsyncIOMotorClientSession]]:
+    """
+    Session for a product write and its outbox entries.
+    With OUTBOX_USE_TRANSACTIONS both commit atomically; otherwise this yields None and
+    the outbox insert simply follows the product write.
+    """
+    if not OUTBOX_ENABLED or not OUTBOX_USE_TRANSACTIONS:
+        yield None
+        return
+    await get_mongo_db()
+    async with await config.mongo_client.start_session() as session:
+        async with session.start_transaction():
+            yield session
+
+
+async def add_events(
+    event_type: str,
+    products_data: List[Dict[str, Any]],
+    session: Optional[AsyncIOMotorClientSession] = None,
+):
+    """
+    Records product events in the outbox. No-op when the outbox is disabled.
+    Inside a transaction (session) a failure raises so the product write rolls back too.
+    Without one the product write has already committed, so a failure is logged and counted
+    instead: the write stands and only its events are lost.
+    """
+    if not OUTBOX_ENABLED or not products_data:
+        return
+    try:
+        await _insert_events(event_type, products_data, session)
+    except Exception:
+        if session is not None:
+            raise
+        relay_stats["insert_failed"] += len(products_data)
+        logger.exception("Failed to record %d %s events in the outbox", len(products_data), event_type)
+
+
+async def _insert_events(
+    event_type: str,
+    products_data: List[Dict[str, Any]],
+    session: Optional[AsyncIOMotorClientSession],
+):
+    collection = await get_outbox_collection()
+    now = datetime.utcnow()
+    routing_key = get_routing_key(event_type)
+    with OUTBOX_INSERT_SECONDS.time():
+        await collection.insert_many([
+            {
+                "_id": ObjectId(),
+                "routing_key": routing_key,
+                "product_id": product_data.get("id"),
+                # The relay's order: ObjectIds from different processes in the same second are not ordered
+                "version": get_event_version(product_data.get("updated_at") or now),
+                "body": serialize_product_event(event_type, product_data),
+                "created_at": now,
+            }
+            for product_data in products_data
+        ], ordered=True, session=session)
+
+
+async def _acquire_lease(owner: str) -> bool:
+    """ Only one relay across all workers/replicas drains the outbox at a time. """
+    db = await get_mongo_db()
+    now = datetime.utcnow()
+    try:
+        await db[OUTBOX_LEASE_COLLECTION].update_one(
+            {"_id": OUTBOX_COLLECTION, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=OUTBOX_RELAY_LEASE_SECONDS)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False # Someone else holds an unexpired lease
+
+
+async def ensure_outbox_indexes():
+    collection = await get_outbox_collection()
+    await collection.create_index([("version", ASCENDING), ("_id", ASCENDING)], name="version_id")
+
+
+def _next_wave(pending: List[Dict[str, Any]], blocked: Set[Any]) -> List[Dict[str, Any]]:
+    """ Takes the oldest pending event of each product that isn't blocked, keeping their order. """
+    wave = []
+    taken = set()
+    remaining = []
+    for event in pending:
+        product_id = event.get("product_id")
+        if product_id in blocked:
+            continue # Held back behind a failed earlier event; retried on the next pass
+        if product_id in taken:
+            remaining.append(event)
+            continue
+        taken.add(product_id)
+        wave.append(event)
+    pending[:] = remaining
+    return wave
+
+
+async def relay_once() -> int:
+    """
+    Publishes one batch of pending events with confirms and deletes the confirmed ones.
+    A product's next event is only published once its previous one is confirmed, so the
+    batch goes out in waves of at most one event per product (usually a single wave).
+    """
+    collection = await get_outbox_collection()
+    pending = await collection.find({}).sort([("version", ASCENDING), ("_id", ASCENDING)]).limit(
+        OUTBOX_RELAY_BATCH_SIZE
+    ).to_list(length=OUTBOX_RELAY_BATCH_SIZE)
+    if not pending:
+        return 0
+
+    relayed = 0
+    blocked: Set[Any] = set()
+    while pending:
+        wave = _next_wave(pending, blocked)
+        if not wave:
+            break
+        confirmed = await product_event_publisher.publish_confirmed(
+            [(event["routing_key"], event["body"]) for event in wave]
+        )
+        confirmed_ids = [event["_id"] for event, ok in zip(wave, confirmed) if ok]
+        blocked.update(event.get("product_id") for event, ok in zip(wave, confirmed) if not ok)
+        if confirmed_ids:
+            await collection.delete_many({"_id": {"$in": confirmed_ids}})
+        relayed += len(confirmed_ids)
+        relay_stats["failed"] += len(wave) - len(confirmed_ids)
+    relay_stats["relayed"] += relayed
+    return relayed
+
+
+async def run_outbox_relay():
+    """ Background task draining the outbox to PRODUCT_EXCHANGE while this process holds the lease. """
+    if not OUTBOX_ENABLED:
+        return
+    owner = uuid.uuid4().hex
+    try:
+        await ensure_outbox_indexes()
+    except Exception as e:
+        logger.warning("Could not create the outbox indexes: %s", e)
+    while True:
+        try:
+            relay_stats["leader"] = await _acquire_lease(owner)
+            if not relay_stats["leader"]:
+                await asyncio.sleep(OUTBOX_RELAY_LEASE_SECONDS / 3)
+                continue
+            relayed = await relay_once()
+            if relayed < OUTBOX_RELAY_BATCH_SIZE:
+                # Caught up (or the broker is refusing messages); wait before polling again
+                collection = await get_outbox_collection()
+                relay_stats["backlog"] = await collection.estimated_document_count()
+                await asyncio.sleep(OUTBOX_RELAY_POLL_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Outbox relay error: %s", e)
+            await asyncio.sleep(OUTBOX_RELAY_POLL_SECONDS)
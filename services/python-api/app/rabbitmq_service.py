@@ -1,121 +1,584 @@
 import asyncio
-import json
+import logging
+import orjson
+import time
+import uuid
 import aio_pika
-from typing import Optional, Callable, Awaitable
-from .config import get_rabbitmq_channel, PRODUCT_EXCHANGE, NOTIFICATION_QUEUE
-from .models import ProductEvent, ProductEventData # Pydantic models for event structure
-from decimal import Decimal
-
-# Custom JSON encoder to handle Decimal and other types if necessary
-class CustomEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        if isinstance(obj, ProductEventData): # Ensure nested Pydantic models are dicts
-             return obj.model_dump(mode='json')
-        if hasattr(obj, 'model_dump'): # General Pydantic model handling
-            return obj.model_dump(mode='json')
-        return super().default(obj)
+from typing import Optional, Callable, Awaitable, List, Dict, Any, Tuple
+from datetime import datetime, timezone
+from .config import (
+    get_rabbitmq_channel, PRODUCT_EXCHANGE, NOTIFICATION_QUEUE,
+    NOTIFICATION_DLX, NOTIFICATION_DLQ, NOTIFICATION_RETRY_QUEUE,
+    CONSUMER_PREFETCH_COUNT, CONSUMER_CONCURRENCY, CONSUMER_MAX_RETRIES, CONSUMER_RETRY_DELAY_MS,
+    CONSUMER_STATS_INTERVAL_SECONDS, get_redis_client, PRODUCT_CACHE_PREFIX, CACHE_EVENT_UPDATES_ENABLED,
+    EVENT_PUBLISHER_CHANNELS, EVENT_OUTBOX_MAX_SIZE, EVENT_PUBLISH_BATCH_SIZE,
+    EVENT_CONFIRM_TIMEOUT_SECONDS, EVENT_PUBLISH_MAX_ATTEMPTS, EVENT_PUBLISHER_RETRY_SECONDS,
+)
+from .cache import ProductChange, apply_product_change
+from .metrics import EVENT_PUBLISH_SECONDS
+from .models import ProductEventData, ProductResponse, json_default # Pydantic models for event structure
+from .models import product_to_json
+
+logger = logging.getLogger(__name__)
+
+# Helper to convert a product to the dict shape expected by publish_product_event
+def get_product_event_data(product: ProductResponse) -> Dict[str, Any]:
+    # Pydantic v2; ensure 'id' is stringified if it's an ObjectId in the model for RabbitMQ
+    product_event_data = product.model_dump(mode='json')
+    if '_id' in product_event_data:
+        product_event_data['id'] = product_event_data.pop('_id') # Use 'id' as key
+    product_event_data['id'] = str(product_event_data['id'])
+    return product_event_data
+
+# Payload of product.deleted; updated_at orders it after every earlier write to the product
+def get_product_deleted_event_data(product_id: str) -> Dict[str, Any]:
+    return {"id": product_id, "updated_at": datetime.utcnow()}
+
+# Fields carried in event payloads (the ProductEventData shape)
+EVENT_DATA_FIELDS = tuple(ProductEventData.model_fields)
+
+def serialize_product_event(event_type: str, product_data: dict) -> bytes:
+    """
+    Serializes an event in one pass. Produces the same JSON layout as
+    ProductEvent(event_type=..., data=ProductEventData(**product_data)) without building the models.
+    """
+    event_message = {
+        "event_type": event_type,
+        "data": {field: product_data.get(field) for field in EVENT_DATA_FIELDS},
+    }
+    return orjson.dumps(event_message, default=json_default)
+
+def get_routing_key(event_type: str) -> str:
+    return f"product.{event_type.split('.')[-1]}" # e.g. product.created
+
+
+class ProductEventPublisher:
+    """
+    Long-lived publisher for product events.
+
+    - Declares PRODUCT_EXCHANGE once per channel instead of on every publish.
+    - Publishes over a small pool of channels in publisher-confirm mode; each worker
+      publishes a batch concurrently and waits for all of its confirms together.
+    - Handlers only append to a bounded in-memory outbox, so HTTP responses never
+      wait on the broker. When the outbox is full new events are dropped (and counted).
+    """
+
+    def __init__(self, channel_count: int, outbox_size: int, batch_size: int,
+                 confirm_timeout: float, max_attempts: int):
+        self.channel_count = channel_count
+        self.batch_size = batch_size
+        self.confirm_timeout = confirm_timeout
+        self.max_attempts = max_attempts
+        self._outbox: "asyncio.Queue[Tuple[str, bytes, int]]" = asyncio.Queue(maxsize=outbox_size)
+        self._channels: List[Optional[aio_pika.abc.AbstractChannel]] = [None] * channel_count
+        self._exchanges: List[Optional[aio_pika.abc.AbstractExchange]] = [None] * channel_count
+        self._workers: List[asyncio.Task] = []
+        # Metrics
+        self.published = 0
+        self.failed = 0
+        self.dropped = 0
+        self.confirm_batches = 0
+        self.confirm_latency_total = 0.0
+        self.confirm_latency_max = 0.0
+        self.confirm_latency_last = 0.0
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._run(index)) for index in range(self.channel_count)]
+
+    async def stop(self, drain_timeout: float):
+        """ Gives the workers up to drain_timeout seconds to flush the outbox, then stops them. """
+        try:
+            await asyncio.wait_for(self._outbox.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Event publisher stopped with %d unsent events.", self._outbox.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        for channel in self._channels:
+            if channel is not None and not channel.is_closed:
+                try:
+                    await channel.close()
+                except Exception: # nosec
+                    pass # Ignore errors on close
+
+    def enqueue(self, routing_key: str, body: bytes, attempts: int = 0) -> bool:
+        try:
+            self._outbox.put_nowait((routing_key, body, attempts))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Event outbox full, dropping [%s] event.", routing_key)
+            return False
+
+    async def _get_exchange(self, index: int) -> Optional[aio_pika.abc.AbstractExchange]:
+        channel = self._channels[index]
+        if channel is not None and not channel.is_closed and self._exchanges[index] is not None:
+            return self._exchanges[index]
+        connection, _channel = await get_rabbitmq_channel() # Shared robust connection from config
+        if connection is None:
+            return None
+        try:
+            channel = await connection.channel(publisher_confirms=True)
+            exchange = await channel.declare_exchange(
+                PRODUCT_EXCHANGE, aio_pika.ExchangeType.TOPIC, durable=True
+            )
+        except Exception as e:
+            logger.warning("Event publisher channel error: %s", e)
+            return None
+        self._channels[index], self._exchanges[index] = channel, exchange
+        return exchange
+
+    async def _next_batch(self) -> List[Tuple[str, bytes, int]]:
+        batch = [await self._outbox.get()]
+        while len(batch) < self.batch_size and not self._outbox.empty():
+            batch.append(self._outbox.get_nowait())
+        return batch
+
+    async def _publish_batch(self, exchange: aio_pika.abc.AbstractExchange, batch: List[Tuple[str, bytes, int]]):
+        started = time.monotonic()
+        results = await asyncio.gather(*[
+            exchange.publish(
+                aio_pika.Message(
+                    body=body,
+                    content_type="application/json",
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                ),
+                routing_key=routing_key,
+                timeout=self.confirm_timeout,
+            )
+            for routing_key, body, _attempts in batch
+        ], return_exceptions=True)
+        self._record_confirm_latency(time.monotonic() - started)
+
+        for (routing_key, body, attempts), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                self._retry_or_fail(routing_key, body, attempts, result)
+            else:
+                self.published += 1
+
+    def _retry_or_fail(self, routing_key: str, body: bytes, attempts: int, error: BaseException):
+        if attempts + 1 < self.max_attempts:
+            self.enqueue(routing_key, body, attempts + 1)
+        else:
+            self.failed += 1
+            logger.error("Failed to publish [%s] event after %d attempts: %s", routing_key, attempts + 1, error)
+
+    async def _run(self, index: int):
+        while True:
+            batch = await self._next_batch()
+            try:
+                exchange = await self._get_exchange(index)
+                while exchange is None: # Broker unavailable; hold the batch until it's back
+                    await asyncio.sleep(EVENT_PUBLISHER_RETRY_SECONDS)
+                    exchange = await self._get_exchange(index)
+                await self._publish_batch(exchange, batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Event publisher error: %s", e)
+                self._exchanges[index] = None
+                for routing_key, body, attempts in batch:
+                    self._retry_or_fail(routing_key, body, attempts, e)
+            finally:
+                for _ in batch:
+                    self._outbox.task_done()
+
+    async def publish_confirmed(self, messages: List[Tuple[str, bytes]]) -> List[bool]:
+        """
+        Publishes messages in order on one confirm channel and waits for every confirm.
+        Returns, per message, whether the broker confirmed it. Used by the Mongo outbox relay,
+        which must know what was delivered before deleting it.
+        """
+        exchange = await self._get_exchange(0)
+        if exchange is None:
+            return [False] * len(messages)
+        started = time.monotonic()
+        results = await asyncio.gather(*[
+            exchange.publish(
+                aio_pika.Message(
+                    body=body,
+                    content_type="application/json",
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                ),
+                routing_key=routing_key,
+                timeout=self.confirm_timeout,
+            )
+            for routing_key, body in messages
+        ], return_exceptions=True)
+        self._record_confirm_latency(time.monotonic() - started)
+        confirmed = [not isinstance(result, BaseException) for result in results]
+        self.published += sum(confirmed)
+        if not all(confirmed):
+            self._exchanges[0] = None # Reopen the channel next time in case it was closed
+        return confirmed
+
+    def _record_confirm_latency(self, latency: float):
+        EVENT_PUBLISH_SECONDS.observe(latency)
+        self.confirm_batches += 1
+        self.confirm_latency_total += latency
+        self.confirm_latency_last = latency
+        self.confirm_latency_max = max(self.confirm_latency_max, latency)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "outbox_depth": self._outbox.qsize(),
+            "outbox_capacity": self._outbox.maxsize,
+            "published": self.published,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "confirm_latency_avg_seconds": (
+                self.confirm_latency_total / self.confirm_batches if self.confirm_batches else 0.0
+            ),
+            "confirm_latency_max_seconds": self.confirm_latency_max,
+            "confirm_latency_last_seconds": self.confirm_latency_last,
+        }
+
+
+product_event_publisher = ProductEventPublisher(
+    channel_count=EVENT_PUBLISHER_CHANNELS,
+    outbox_size=EVENT_OUTBOX_MAX_SIZE,
+    batch_size=EVENT_PUBLISH_BATCH_SIZE,
+    confirm_timeout=EVENT_CONFIRM_TIMEOUT_SECONDS,
+    max_attempts=EVENT_PUBLISH_MAX_ATTEMPTS,
+)
+
+async def publish_product_events(event_type: str, products_data: List[dict]):
+    """ Queues one event per product for background publishing. """
+    routing_key = get_routing_key(event_type)
+    for product_data in products_data:
+        product_event_publisher.enqueue(routing_key, serialize_product_event(event_type, product_data))
 
 async def publish_product_event(event_type: str, product_data: dict):
     """
-    Publishes a product event to RabbitMQ.
+    Queues a product event for publishing to RabbitMQ; returns without waiting on the broker.
     product_data should be a dictionary representation of the product.
     """
-    _conn, channel = await get_rabbitmq_channel() # Connection stored in config, channel is what we use
-    
-    if not channel or channel.is_closed:
-        print("RabbitMQ channel is not available or closed. Cannot publish event.")
-        return
+    product_event_publisher.enqueue(get_routing_key(event_type), serialize_product_event(event_type, product_data))
 
-    try:
-        # Ensure the exchange exists
-        exchange = await channel.declare_exchange(
-            PRODUCT_EXCHANGE, aio_pika.ExchangeType.TOPIC, durable=True
+class ProductEventConsumer:
+    """
+    Consumer engine for NOTIFICATION_QUEUE.
+
+    - The channel prefetch (set_qos) bounds how many unacked messages this process holds.
+    - Deliveries are handed to `concurrency` worker tasks, and each message is acked
+      only after its handler succeeds.
+    - A failed message is republished to a TTL'd retry queue that dead-letters back
+      into NOTIFICATION_QUEUE, up to `max_retries` times. After that (or if the body
+      can't be decoded) it is republished to NOTIFICATION_DLX, which feeds NOTIFICATION_DLQ,
+      and acked. NOTIFICATION_QUEUE itself keeps the arguments it was first declared with
+      (none), so brokers that already have it accept the declaration unchanged.
+    """
+
+    def __init__(self, message_handler: Callable[[dict], Awaitable[None]], prefetch_count: int,
+                 concurrency: int, max_retries: int, retry_delay_ms: int):
+        self.message_handler = message_handler
+        self.prefetch_count = prefetch_count
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_delay_ms = retry_delay_ms
+        self._channel: Optional[aio_pika.abc.AbstractChannel] = None
+        self._queue: Optional[aio_pika.abc.AbstractQueue] = None
+        self._dead_letter_exchange: Optional[aio_pika.abc.AbstractExchange] = None
+        self._consumer_tag: Optional[str] = None
+        self._deliveries: "asyncio.Queue[aio_pika.abc.AbstractIncomingMessage]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        # Metrics
+        self.received = 0
+        self.processed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.in_flight = 0
+        self.processing_time_total = 0.0
+        self.processed_per_second = 0.0
+        self.queue_lag = 0 # Ready messages waiting in NOTIFICATION_QUEUE
+
+    async def start(self) -> bool:
+        connection, _channel = await get_rabbitmq_channel()
+        if connection is None:
+            logger.error("RabbitMQ connection is not available. Cannot start consumer.")
+            return False
+        try:
+            self._channel = await connection.channel()
+            await self._channel.set_qos(prefetch_count=self.prefetch_count)
+
+            exchange = await self._channel.declare_exchange(
+                PRODUCT_EXCHANGE, aio_pika.ExchangeType.TOPIC, durable=True
+            )
+            self._dead_letter_exchange = await self._channel.declare_exchange(
+                NOTIFICATION_DLX, aio_pika.ExchangeType.FANOUT, durable=True
+            )
+            dead_letter_queue = await self._channel.declare_queue(NOTIFICATION_DLQ, durable=True)
+            await dead_letter_queue.bind(self._dead_letter_exchange)
+            # Messages sit here for retry_delay_ms, then expire back into the main queue
+            await self._channel.declare_queue(NOTIFICATION_RETRY_QUEUE, durable=True, arguments={
+                "x-message-ttl": self.retry_delay_ms,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": NOTIFICATION_QUEUE,
+            })
+            # Declared exactly as before dead-lettering existed: RabbitMQ refuses (PRECONDITION_FAILED)
+            # to redeclare an existing queue with different arguments, so dead letters are
+            # republished explicitly (_dead_letter) instead of relying on x-dead-letter-exchange
+            self._queue = await self._channel.declare_queue(NOTIFICATION_QUEUE, durable=True)
+            # Bind queue to the exchange to receive all product events
+            await self._queue.bind(exchange, routing_key="#")
+
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+            self._tasks.append(asyncio.create_task(self._poll_lag()))
+            self._consumer_tag = await self._queue.consume(self._on_message)
+            logger.info(
+                "Consumer started for queue %s bound to exchange %s (prefetch=%d, concurrency=%d)",
+                NOTIFICATION_QUEUE, PRODUCT_EXCHANGE, self.prefetch_count, self.concurrency,
+            )
+            return True
+        except Exception as e:
+            logger.error("Failed to start product event consumer: %s", e)
+            return False
+
+    async def stop(self, drain_timeout: float = 5):
+        """ Stops taking deliveries, lets in-flight messages finish, then shuts the workers down. """
+        if self._queue is not None and self._consumer_tag is not None:
+            try:
+                await self._queue.cancel(self._consumer_tag)
+            except Exception: # nosec
+                pass # Channel may already be gone
+        try:
+            await asyncio.wait_for(self._deliveries.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Consumer stopped with unprocessed deliveries; they will be redelivered.")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._channel is not None and not self._channel.is_closed:
+            await self._channel.close()
+
+    async def _on_message(self, message: aio_pika.abc.AbstractIncomingMessage):
+        self.received += 1
+        await self._deliveries.put(message)
+
+    async def _worker(self):
+        while True:
+            message = await self._deliveries.get()
+            self.in_flight += 1
+            started = time.monotonic()
+            try:
+                await self._handle(message)
+            except Exception as e:
+                logger.warning("Error acknowledging message: %s", e)
+            finally:
+                self.in_flight -= 1
+                self.processing_time_total += time.monotonic() - started
+                self._deliveries.task_done()
+
+    async def _handle(self, message: aio_pika.abc.AbstractIncomingMessage):
+        try:
+            # Deserialize the message content
+            content = orjson.loads(message.body)
+        except orjson.JSONDecodeError: # Also raised for invalid UTF-8
+            logger.warning("Error decoding JSON message body, dead-lettering it.")
+            await self._dead_letter(message, "undecodable body")
+            return
+
+        try:
+            await self.message_handler(content) # Pass the dict to the handler
+        except Exception as e:
+            await self._retry_or_dead_letter(message, e)
+            return
+        await message.ack()
+        self.processed += 1
+
+    async def _dead_letter(self, message: aio_pika.abc.AbstractIncomingMessage, reason: str):
+        """ Moves a message to NOTIFICATION_DLQ (through NOTIFICATION_DLX) and acks it. """
+        headers = dict(message.headers or {})
+        headers["x-dead-letter-reason"] = reason[:256]
+        await self._dead_letter_exchange.publish(
+            aio_pika.Message(
+                body=message.body,
+                headers=headers,
+                content_type=message.content_type,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            ),
+            routing_key=message.routing_key or "",
         )
-        
-        # Construct the message using Pydantic model for validation and structure
-        # Ensure product_data is compatible with ProductEventData
-        # If product_data comes directly from a Pydantic model (e.g. ProductResponse),
-        # use model_dump() before passing. If it's already a dict, ensure keys match.
-        
-        # We expect product_data to be a dict here, convert to ProductEventData
-        event_data_model = ProductEventData(**product_data)
-        
-        event_message = ProductEvent(event_type=event_type, data=event_data_model)
-        
-        message_body = json.dumps(event_message.model_dump(mode='json'), cls=CustomEncoder) # Pydantic v2
-        
-        message = aio_pika.Message(
-            body=message_body.encode(),
-            content_type="application/json",
-            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        await message.ack()
+        self.dead_lettered += 1
+
+    async def _retry_or_dead_letter(self, message: aio_pika.abc.AbstractIncomingMessage, error: Exception):
+        headers = dict(message.headers or {})
+        retries = int(headers.get("x-retry-count", 0))
+        if retries >= self.max_retries:
+            logger.error("Error processing message after %d retries, dead-lettering it: %s", retries, error)
+            await self._dead_letter(message, str(error))
+            return
+        logger.warning("Error processing message (retry %d/%d): %s", retries + 1, self.max_retries, error)
+        headers["x-retry-count"] = retries + 1
+        await self._channel.default_exchange.publish(
+            aio_pika.Message(
+                body=message.body,
+                headers=headers,
+                content_type=message.content_type,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            ),
+            routing_key=NOTIFICATION_RETRY_QUEUE,
         )
-        
-        routing_key = f"product.{event_type.split('.')[-1]}" # e.g. product.created
-        await exchange.publish(message, routing_key=routing_key)
-        print(f"Sent event [{routing_key}]: {message_body} to exchange {PRODUCT_EXCHANGE}")
+        await message.ack()
+        self.retried += 1
+
+    async def _poll_lag(self):
+        """ Periodically samples the queue backlog and the processing rate. """
+        last_processed = self.processed
+        while True:
+            await asyncio.sleep(CONSUMER_STATS_INTERVAL_SECONDS)
+            self.processed_per_second = (self.processed - last_processed) / CONSUMER_STATS_INTERVAL_SECONDS
+            last_processed = self.processed
+            try:
+                declared = await self._channel.declare_queue(NOTIFICATION_QUEUE, passive=True)
+                self.queue_lag = declared.declaration_result.message_count
+            except Exception as e:
+                logger.warning("Could not read consumer lag: %s", e)
 
-    except Exception as e:
-        print(f"Failed to publish product event: {e}")
-        # Consider more robust error handling/retry logic here
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "in_flight": self.in_flight,
+            "buffered": self._deliveries.qsize(),
+            "processed_per_second": self.processed_per_second,
+            "avg_processing_seconds": (
+                self.processing_time_total / (self.processed + self.retried + self.dead_lettered)
+                if self.processed + self.retried + self.dead_lettered else 0.0
+            ),
+            "queue_lag": self.queue_lag,
+        }
 
-async def start_product_event_consumer(message_handler: Callable[[dict], Awaitable[None]]):
+
+async def start_product_event_consumer(
+    message_handler: Callable[[dict], Awaitable[None]]
+) -> Optional[ProductEventConsumer]:
     """
     Starts a consumer for product events from RabbitMQ.
-    message_handler will be called with the deserialized message content (dict).
+    message_handler will be called with the deserialized message content (dict);
+    raising from it triggers a retry and, eventually, dead-lettering.
+    Returns the running consumer, or None if it could not be started.
     """
-    _conn, channel = await get_rabbitmq_channel()
+    consumer = ProductEventConsumer(
+        message_handler,
+        prefetch_count=CONSUMER_PREFETCH_COUNT,
+        concurrency=CONSUMER_CONCURRENCY,
+        max_retries=CONSUMER_MAX_RETRIES,
+        retry_delay_ms=CONSUMER_RETRY_DELAY_MS,
+    )
+    if not await consumer.start():
+        return None
+    return consumer
 
-    if not channel or channel.is_closed:
-        print("RabbitMQ channel is not available or closed. Cannot start consumer.")
-        return
+class ProductEventSubscription:
+    """
+    Broadcast subscription to product events, for state every process keeps in memory.
 
-    try:
-        exchange = await channel.declare_exchange(
-            PRODUCT_EXCHANGE, aio_pika.ExchangeType.TOPIC, durable=True
-        )
-        queue = await channel.declare_queue(NOTIFICATION_QUEUE, durable=True)
-        
-        # Bind queue to the exchange to receive all product events
-        await queue.bind(exchange, routing_key="#") # Listen to all routing keys under product_events
+    NOTIFICATION_QUEUE is a work queue (each event goes to one consumer); a subscription
+    instead gets its own exclusive auto-delete queue bound to PRODUCT_EXCHANGE, so every
+    subscribed process sees every event. Deliveries are not acked individually (no_ack) and
+    are not retried; subscribers must tolerate missed events, e.g. by rebuilding periodically.
+    """
 
-        print(f"[*] Waiting for messages in {NOTIFICATION_QUEUE}. To exit press CTRL+C")
+    def __init__(self, name: str, message_handler: Callable[[dict], Awaitable[None]]):
+        # Named rather than server-named ("amq.gen-..."), so the robust channel can redeclare it after a reconnect
+        self.queue_name = f"{PRODUCT_EXCHANGE}.{name}.{uuid.uuid4().hex[:12]}"
+        self.message_handler = message_handler
+        self._channel: Optional[aio_pika.abc.AbstractChannel] = None
+        self.received = 0
+        self.failed = 0
 
-        async def on_message(message: aio_pika.IncomingMessage):
-            async with message.process(): # Acknowledges message automatically on success
-                try:
-                    print(f"[Python Consumer] Received message from {message.exchange}/{message.routing_key}")
-                    # Deserialize the message content
-                    content = json.loads(message.body.decode())
-                    # Validate with Pydantic if needed, e.g. ProductEvent(**content)
-                    await message_handler(content) # Pass the dict to the handler
-                except json.JSONDecodeError:
-                    print("Error decoding JSON message body.")
-                except Exception as e:
-                    print(f"Error processing message: {e}")
-                    # Optionally, you could reject or nack the message if processing fails permanently
-
-        await queue.consume(on_message)
-        print(f"Consumer started for queue {NOTIFICATION_QUEUE} bound to exchange {PRODUCT_EXCHANGE}")
-        
-        # Keep the consumer running (FastAPI runs in its own asyncio loop)
-        # If this were a standalone script, you'd need something like:
-        # loop = asyncio.get_event_loop()
-        # await loop.create_future() 
-
-    except Exception as e:
-        print(f"Failed to start product event consumer: {e}")
+    async def start(self) -> bool:
+        connection, _channel = await get_rabbitmq_channel()
+        if connection is None:
+            logger.error("RabbitMQ connection is not available. Cannot subscribe %s.", self.queue_name)
+            return False
+        try:
+            self._channel = await connection.channel()
+            exchange = await self._channel.declare_exchange(
+                PRODUCT_EXCHANGE, aio_pika.ExchangeType.TOPIC, durable=True
+            )
+            queue = await self._channel.declare_queue(self.queue_name, exclusive=True, auto_delete=True)
+            await queue.bind(exchange, routing_key="product.*")
+            await queue.consume(self._on_message, no_ack=True)
+            logger.info("Subscribed %s to exchange %s", self.queue_name, PRODUCT_EXCHANGE)
+            return True
+        except Exception as e:
+            logger.error("Failed to subscribe %s to product events: %s", self.queue_name, e)
+            return False
+
+    async def stop(self):
+        if self._channel is not None and not self._channel.is_closed:
+            await self._channel.close() # The exclusive queue goes with it
+
+    async def _on_message(self, message: aio_pika.abc.AbstractIncomingMessage):
+        self.received += 1
+        try:
+            await self.message_handler(orjson.loads(message.body))
+        except Exception as e:
+            self.failed += 1
+            logger.warning("%s failed to handle an event: %s", self.queue_name, e)
+
+
+async def subscribe_product_events(
+    name: str, message_handler: Callable[[dict], Awaitable[None]]
+) -> Optional[ProductEventSubscription]:
+    """ Starts a per-process ProductEventSubscription; returns None if RabbitMQ is unavailable. """
+    subscription = ProductEventSubscription(name, message_handler)
+    if not await subscription.start():
+        return None
+    return subscription
+
+def get_event_version(updated_at: Any) -> Optional[int]:
+    """ updated_at from an event payload (ISO string, naive means UTC) as microseconds since the epoch. """
+    if not updated_at:
+        return None
+    value = datetime.fromisoformat(updated_at) if isinstance(updated_at, str) else updated_at
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return round(value.timestamp() * 1_000_000)
+
+async def update_cache_from_event(message_content: dict):
+    """
+    Writes the product state carried by a product event into its Redis cache entry, so readers
+    keep hitting the cache across writes. Older versions than the cached one are ignored.
+    """
+    event_type = message_content.get("event_type")
+    data = message_content.get("data") or {}
+    product_id = data.get("id")
+    if not product_id or event_type not in (
+        "product.created", "product.updated", "product.deleted", "product.stock_changed"
+    ):
+        return
+    redis = await get_redis_client()
+    if redis is None:
+        return # Breaker open; entries expire on their own
+    version = get_event_version(data.get("updated_at"))
+    # stock_changed carries only the stock, not a full product: evict (keeping the version) and
+    # let the next read reload it. Events without a version (published before updated_at was
+    # carried) only evict the entry too.
+    evict = event_type == "product.stock_changed" or version is None
+    payload = None
+    if not evict and event_type != "product.deleted":
+        # Same bytes the request path caches for GET /products/{id}
+        payload = product_to_json(ProductResponse.model_validate(data))
+    change = ProductChange(f"{PRODUCT_CACHE_PREFIX}{product_id}", version, payload, evict)
+    if not await apply_product_change(redis, change):
+        logger.debug("Skipped out-of-date [%s] event for product %s", event_type, product_id, extra={"sampled": True})
 
 async def default_message_processor(message_content: dict):
     """ Default handler for received messages if none is provided. """
-    print(f"Default processor received: {message_content}")
+    if CACHE_EVENT_UPDATES_ENABLED:
+        await update_cache_from_event(message_content)
+    # Log the event identity only; the payload stays out of the logs
+    logger.info(
+        "Processed [%s] event for product %s", message_content.get("event_type"),
+        (message_content.get("data") or {}).get("id"), extra={"sampled": True},
+    )
     # Implement actual processing logic here, e.g., logging, updating other systems
 
-# Example of how to start the consumer (typically called from main.py or on app startup)
-# async def main():
-#     await start_product_event_consumer(default_message_processor)
-#     # Keep alive if this is the main execution point
-#     # await asyncio.Event().wait() 
-# if __name__ == "__main__":
-# asyncio.run(main())
+# To run the consumer as its own process (separate from the HTTP workers): python -m app.consumer
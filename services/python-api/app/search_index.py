@@ -0,0 +1,161 @@
+"""
+In-process name prefix index behind GET /products/autocomplete (SEARCH_PREFIX_INDEX_ENABLED).
+
+Every process keeps a sorted list of (normalized name, id), so a suggestion lookup is one
+bisect plus a short forward scan with no network hop. The index is loaded from Mongo at
+startup, kept current from a per-process product event subscription, and rebuilt every
+SEARCH_PREFIX_INDEX_REBUILD_SECONDS to repair anything missed while RabbitMQ was away.
+Events carry updated_at, so a redelivered or reordered event never overwrites newer state.
+"""
+import asyncio
+import bisect
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import crud
+from .config import SEARCH_PREFIX_INDEX_ENABLED, SEARCH_PREFIX_INDEX_REBUILD_SECONDS
+from .rabbitmq_service import get_event_version, subscribe_product_events
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixIndex:
+    """
+    Sorted (name_lc, id) keys plus the display name per id.
+    Not thread-safe; it is only touched from the event loop.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[str, str]] = []
+        self._names: Dict[str, Tuple[str, str]] = {} # id -> (name_lc, name)
+        # Newest version applied per id, deletes included, so older events are ignored
+        self._versions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def load(self, products: List[Tuple[str, str, Optional[int]]]):
+        """ Replaces the contents with (id, name, version) tuples. """
+        names = {product_id: (crud.normalize_name(name), name) for product_id, name, _version in products}
+        self._keys = sorted((name_lc, product_id) for product_id, (name_lc, _name) in names.items())
+        self._names = names
+        self._versions = {product_id: version for product_id, _name, version in products if version is not None}
+
+    def _is_outdated(self, product_id: str, version: Optional[int]) -> bool:
+        if version is None:
+            return False # Events without a version are applied as they come
+        current = self._versions.get(product_id)
+        if current is not None and current > version:
+            return True
+        self._versions[product_id] = version
+        return False
+
+    def _discard(self, product_id: str):
+        existing = self._names.pop(product_id, None)
+        if existing is None:
+            return
+        key = (existing[0], product_id)
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            del self._keys[position]
+
+    def upsert(self, product_id: str, name: str, version: Optional[int] = None) -> bool:
+        if self._is_outdated(product_id, version):
+            return False
+        self._discard(product_id)
+        name_lc = crud.normalize_name(name)
+        self._names[product_id] = (name_lc, name)
+        bisect.insort(self._keys, (name_lc, product_id))
+        return True
+
+    def remove(self, product_id: str, version: Optional[int] = None) -> bool:
+        if self._is_outdated(product_id, version):
+            return False
+        self._discard(product_id)
+        return True
+
+    def suggest(self, prefix: str, limit: int) -> List[Dict[str, str]]:
+        """ Up to `limit` products whose normalized name starts with prefix, in name order. """
+        prefix = crud.normalize_name(prefix)
+        suggestions = []
+        position = bisect.bisect_left(self._keys, (prefix, ""))
+        while position < len(self._keys) and len(suggestions) < limit:
+            name_lc, product_id = self._keys[position]
+            if not name_lc.startswith(prefix):
+                break
+            suggestions.append({"id": product_id, "name": self._names[product_id][1]})
+            position += 1
+        return suggestions
+
+
+product_prefix_index = PrefixIndex()
+prefix_index_state: Dict[str, Any] = {"ready": False, "products": 0, "rebuilt_at": None, "subscribed": False}
+
+# Events received while a rebuild is reading Mongo; replayed on top of the new snapshot
+_pending_events: Optional[List[dict]] = None
+
+
+def prefix_index_ready() -> bool:
+    return SEARCH_PREFIX_INDEX_ENABLED and prefix_index_state["ready"]
+
+
+def _apply_event(message_content: dict):
+    event_type = message_content.get("event_type")
+    data = message_content.get("data") or {}
+    product_id = data.get("id")
+    if not product_id:
+        return
+    version = get_event_version(data.get("updated_at"))
+    if event_type == "product.deleted":
+        product_prefix_index.remove(product_id, version)
+    elif event_type in ("product.created", "product.updated") and data.get("name"):
+        product_prefix_index.upsert(product_id, data["name"], version)
+
+
+async def handle_product_event(message_content: dict):
+    """ Subscription handler: applies the event now, and again after a rebuild in progress. """
+    if _pending_events is not None:
+        _pending_events.append(message_content)
+    _apply_event(message_content)
+
+
+async def rebuild_prefix_index():
+    """ Reloads the index from Mongo, then replays the events that arrived meanwhile. """
+    global _pending_events
+    started = time.monotonic()
+    _pending_events = []
+    try:
+        products = [
+            (str(product_doc["_id"]), product_doc["name"], get_event_version(product_doc.get("updated_at")))
+            async for product_doc in crud.iter_product_names()
+            if isinstance(product_doc.get("name"), str)
+        ]
+        product_prefix_index.load(products)
+        for message_content in _pending_events:
+            _apply_event(message_content)
+    finally:
+        _pending_events = None
+    prefix_index_state.update(ready=True, products=len(product_prefix_index), rebuilt_at=time.time())
+    logger.info("Prefix index built with %d products in %.2fs", len(product_prefix_index), time.monotonic() - started)
+
+
+async def run_prefix_index():
+    """ Long-running task: subscribe, build, then rebuild on an interval. """
+    if not SEARCH_PREFIX_INDEX_ENABLED:
+        return
+    subscription = None
+    try:
+        while True:
+            if subscription is None:
+                # Before each build, so nothing written during it is missed
+                subscription = await subscribe_product_events("search-index", handle_product_event)
+                prefix_index_state["subscribed"] = subscription is not None
+            try:
+                await rebuild_prefix_index()
+            except Exception as e:
+                logger.warning("Prefix index rebuild failed: %s", e)
+            await asyncio.sleep(SEARCH_PREFIX_INDEX_REBUILD_SECONDS)
+    finally:
+        if subscription is not None:
+            await subscription.stop()
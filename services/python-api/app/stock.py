@@ -0,0 +1,336 @@
+"""
+Stock reservations (POST /products/{id}/reserve and /release) on Redis counters.
+
+- A product's available stock lives in STOCK_COUNTER_PREFIX<id>, seeded from Mongo on first
+  use. One Lua script checks and applies each change, so concurrent reservations of one SKU
+  never take it below zero, and the reservations of one tick share a pipelined round trip.
+- The same script adds the change to STOCK_PENDING_KEY (id -> net change not yet in Mongo).
+  One flusher across all processes (STOCK_FLUSH_LEASE_KEY) moves that hash aside every
+  STOCK_FLUSH_INTERVAL_SECONDS, applies it with one bulk $inc and emits one
+  product.stock_changed event per product, however many reservations it covered.
+- Each flush batch has a token that is stamped on the documents it updates, so a batch retried
+  after a crash is never applied twice. STOCK_FLUSH_SEQUENCE_KEY changes whenever Mongo and
+  the pending hashes move relative to each other; a seed that raced with that starts over.
+- Product reads show the Mongo stock, which trails the counter by about one flush interval.
+- Setting stock through a product update or deleting the product fences the product for the
+  duration of the write (stock_write_fence): its counter and its pending and in-flight changes
+  are dropped before the write, and reservations wait until the write is done and seed from the
+  written value. The write stamps the in-flight batch's token, so that batch skips the product.
+- Shutdown flushes once more only under the lease, so two flushers never run at once.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+
+from . import crud
+from .batching import Batcher
+from .cache import run_pipelined
+from .config import (
+    get_redis_client, report_redis_error, OUTBOX_ENABLED,
+    STOCK_COUNTER_PREFIX, STOCK_PENDING_KEY, STOCK_FLUSHING_KEY, STOCK_FLUSH_SEQUENCE_KEY, STOCK_FLUSH_LEASE_KEY,
+    STOCK_FLUSH_INTERVAL_SECONDS, STOCK_FLUSH_LEASE_SECONDS, STOCK_FENCE_PREFIX, STOCK_FENCE_SECONDS,
+)
+from .metrics import REDIS_STOCK_SECONDS
+from .rabbitmq_service import publish_product_events
+
+logger = logging.getLogger(__name__)
+
+# Seeding only loses a race with a concurrent flush or reset; a few attempts are plenty
+SEED_ATTEMPTS = 3
+# Field of STOCK_FLUSHING_KEY holding the batch token (product ids are 24 hex characters)
+TOKEN_FIELD = "_token"
+# How often a reservation checks whether a fenced product's write is done
+FENCE_POLL_SECONDS = 0.01
+
+# Lease owner of this process, shared by the flusher task and the flush at shutdown
+_lease_owner = uuid.uuid4().hex
+
+# Flusher counters for this process
+stock_stats: Dict[str, Any] = {"leader": False, "flushes": 0, "products_flushed": 0, "failed": 0}
+
+
+class StockProductNotFoundError(LookupError):
+    pass
+
+
+class StockSeedConflictError(RuntimeError):
+    pass
+
+
+def get_stock_counter_key(product_id: str) -> str:
+    return f"{STOCK_COUNTER_PREFIX}{product_id}"
+
+
+def get_stock_fence_key(product_id: str) -> str:
+    return f"{STOCK_FENCE_PREFIX}{product_id}"
+
+
+# KEYS: counter, pending. ARGV: delta (negative to reserve), product id.
+# Returns {1, available} when applied, {0, available} when there is not enough stock,
+# {-1, 0} when the counter has not been seeded yet.
+_ADJUST_SCRIPT = """
+local available = redis.call('get', KEYS[1])
+if not available then
+    return {-1, 0}
+end
+local delta = tonumber(ARGV[1])
+if delta < 0 and tonumber(available) + delta < 0 then
+    return {0, tonumber(available)}
+end
+redis.call('hincrby', KEYS[2], ARGV[2], delta)
+return {1, redis.call('incrby', KEYS[1], delta)}
+"""
+
+# KEYS: counter, pending, flushing, sequence, fence. ARGV: Mongo stock, sequence read before it,
+# stock_flush of the document, product id. The counter starts at the Mongo stock plus the
+# changes Mongo has not seen yet: the pending ones, and the flushing ones unless the document
+# already carries that batch's token. Returns 0 if a flush or fence ran since the Mongo read,
+# or the product is fenced now.
+_SEED_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 1
+end
+if (redis.call('get', KEYS[4]) or '0') ~= ARGV[2] or redis.call('exists', KEYS[5]) == 1 then
+    return 0
+end
+local available = tonumber(ARGV[1]) + tonumber(redis.call('hget', KEYS[2], ARGV[4]) or 0)
+if redis.call('hget', KEYS[3], '_token') ~= ARGV[3] then
+    available = available + tonumber(redis.call('hget', KEYS[3], ARGV[4]) or 0)
+end
+redis.call('set', KEYS[1], available)
+return 1
+"""
+
+# KEYS: pending, flushing, sequence. ARGV: token for a new batch.
+# Returns the batch to flush as HGETALL output: an unfinished earlier batch first, else the
+# pending changes moved aside under the new token; empty when there is nothing to flush.
+_TAKE_BATCH_SCRIPT = """
+if redis.call('exists', KEYS[2]) == 0 then
+    if redis.call('exists', KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call('rename', KEYS[1], KEYS[2])
+    redis.call('hset', KEYS[2], '_token', ARGV[1])
+    redis.call('incr', KEYS[3])
+end
+return redis.call('hgetall', KEYS[2])
+"""
+
+# KEYS: flushing, sequence. ARGV: token. Drops the batch once Mongo has it.
+_FINISH_BATCH_SCRIPT = """
+if redis.call('hget', KEYS[1], '_token') == ARGV[1] then
+    redis.call('del', KEYS[1])
+    redis.call('incr', KEYS[2])
+end
+return 1
+"""
+
+# KEYS: pending, flushing, sequence, then counter and fence of each product. ARGV: fence ms,
+# product ids. Fences the products and drops their counters and unflushed changes. Returns the
+# token of the batch being flushed ('' if none), which the write stamps as stock_flush.
+_FENCE_SCRIPT = """
+for i = 2, #ARGV do
+    redis.call('del', KEYS[2 * i])
+    redis.call('set', KEYS[2 * i + 1], 1, 'PX', ARGV[1])
+    redis.call('hdel', KEYS[1], ARGV[i])
+    redis.call('hdel', KEYS[2], ARGV[i])
+end
+redis.call('incr', KEYS[3])
+return redis.call('hget', KEYS[2], '_token') or ''
+"""
+
+# KEYS: sequence, then counter and fence of each product. Lifts the fences once the write is done;
+# a counter seeded after a fence expired early may hold the old stock, so it goes too.
+_LIFT_FENCE_SCRIPT = """
+for i = 2, #KEYS do
+    redis.call('del', KEYS[i])
+end
+redis.call('incr', KEYS[1])
+return 1
+"""
+
+# KEYS: lease. ARGV: owner, lease ms. Takes the lease if free, renews it if already ours.
+_HOLD_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('pexpire', KEYS[1], ARGV[2])
+    return 1
+end
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+# KEYS: lease. ARGV: owner.
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+async def _adjust_counters(items: List[Tuple[aioredis.Redis, str, int]]) -> List[Tuple[int, int]]:
+    def queue(pipe, item):
+        _redis, product_id, delta = item
+        pipe.eval(_ADJUST_SCRIPT, 2, get_stock_counter_key(product_id), STOCK_PENDING_KEY, delta, product_id)
+
+    return [
+        (int(reply[0]), int(reply[1]))
+        for (reply,) in await run_pipelined(items, queue, 1, REDIS_STOCK_SECONDS)
+    ]
+
+
+# Reservations and releases issued in the same tick share one pipeline
+_adjustments = Batcher("redis_stock", _adjust_counters)
+
+
+async def _wait_for_fence(redis: aioredis.Redis, product_id: str):
+    """ Returns once no write is replacing the product's stock. """
+    deadline = time.monotonic() + STOCK_FENCE_SECONDS
+    while await redis.exists(get_stock_fence_key(product_id)):
+        if time.monotonic() >= deadline:
+            raise StockSeedConflictError(f"The stock of product {product_id} is being written")
+        await asyncio.sleep(FENCE_POLL_SECONDS)
+
+
+async def _seed_counter(redis: aioredis.Redis, product_id: str) -> bool:
+    """ Creates the product's counter from Mongo. False if the product does not exist. """
+    for _ in range(SEED_ATTEMPTS):
+        await _wait_for_fence(redis, product_id)
+        sequence = await redis.get(STOCK_FLUSH_SEQUENCE_KEY)
+        product_doc = await crud.get_stock_snapshot(product_id)
+        if product_doc is None:
+            return False
+        seeded = await redis.eval(
+            _SEED_SCRIPT, 5,
+            get_stock_counter_key(product_id), STOCK_PENDING_KEY, STOCK_FLUSHING_KEY, STOCK_FLUSH_SEQUENCE_KEY,
+            get_stock_fence_key(product_id),
+            product_doc.get("stock", 0), sequence or b"0", product_doc.get("stock_flush", ""), product_id,
+        )
+        if seeded:
+            return True
+    raise StockSeedConflictError(f"Could not seed the stock counter of product {product_id}")
+
+
+async def adjust_stock(redis: aioredis.Redis, product_id: str, delta: int) -> Tuple[bool, int]:
+    """
+    Reserves (delta < 0) or releases (delta > 0) stock for a product.
+    Returns (applied, available); a reservation larger than the available stock is not applied.
+    Raises StockProductNotFoundError for unknown products.
+    """
+    for _ in range(SEED_ATTEMPTS):
+        status, available = await _adjustments.load((redis, product_id, delta))
+        if status >= 0:
+            return status == 1, available
+        if not await _seed_counter(redis, product_id):
+            raise StockProductNotFoundError(product_id)
+    # The counter kept disappearing between seeding and the adjustment (concurrent resets)
+    raise StockSeedConflictError(f"Could not seed the stock counter of product {product_id}")
+
+
+def _decode(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _product_keys(product_ids: List[str]) -> List[str]:
+    keys = []
+    for product_id in product_ids:
+        keys += [get_stock_counter_key(product_id), get_stock_fence_key(product_id)]
+    return keys
+
+
+@asynccontextmanager
+async def stock_write_fence(redis: Optional[aioredis.Redis], product_ids: List[str]) -> AsyncIterator[Optional[str]]:
+    """
+    Wraps a write that sets the stock of products directly, or deletes them. Before it, their
+    counters and unflushed changes are dropped and reservations are held back; after it,
+    the next reservation seeds from the written value. Yields the token of the flush batch in
+    flight (or None), which the write must store as stock_flush so that batch skips it.
+    """
+    if redis is None or not product_ids:
+        yield None
+        return
+    token = None
+    try:
+        keys = [STOCK_PENDING_KEY, STOCK_FLUSHING_KEY, STOCK_FLUSH_SEQUENCE_KEY] + _product_keys(product_ids)
+        with REDIS_STOCK_SECONDS.time():
+            token = _decode(await redis.eval(
+                _FENCE_SCRIPT, len(keys), *keys, int(STOCK_FENCE_SECONDS * 1000), *product_ids
+            )) or None
+    except Exception as e:
+        report_redis_error(e)
+        logger.warning("Redis stock fence error for %d products: %s", len(product_ids), e)
+    try:
+        yield token
+    finally:
+        try:
+            keys = [STOCK_FLUSH_SEQUENCE_KEY] + _product_keys(product_ids)
+            with REDIS_STOCK_SECONDS.time():
+                await redis.eval(_LIFT_FENCE_SCRIPT, len(keys), *keys)
+        except Exception as e:
+            report_redis_error(e)
+            logger.warning("Redis stock fence release error for %d products: %s", len(product_ids), e)
+
+
+async def flush_stock_once(redis: aioredis.Redis) -> int:
+    """ Applies one batch of pending stock changes to Mongo. Returns the number of products in it. """
+    reply = await redis.eval(
+        _TAKE_BATCH_SCRIPT, 3, STOCK_PENDING_KEY, STOCK_FLUSHING_KEY, STOCK_FLUSH_SEQUENCE_KEY, uuid.uuid4().hex
+    )
+    if not reply:
+        return 0
+    batch = {_decode(field): _decode(value) for field, value in zip(reply[::2], reply[1::2])}
+    token = batch.pop(TOKEN_FIELD)
+    deltas = {product_id: int(delta) for product_id, delta in batch.items()}
+    events_data = await crud.apply_stock_deltas(deltas, token)
+    if not OUTBOX_ENABLED: # Otherwise crud recorded the events in the outbox
+        await publish_product_events("product.stock_changed", events_data)
+    await redis.eval(_FINISH_BATCH_SCRIPT, 2, STOCK_FLUSHING_KEY, STOCK_FLUSH_SEQUENCE_KEY, token)
+    stock_stats["flushes"] += 1
+    stock_stats["products_flushed"] += len(deltas)
+    return len(deltas)
+
+
+async def _hold_lease(redis: aioredis.Redis) -> bool:
+    return bool(await redis.eval(
+        _HOLD_LEASE_SCRIPT, 1, STOCK_FLUSH_LEASE_KEY, _lease_owner, int(STOCK_FLUSH_LEASE_SECONDS * 1000)
+    ))
+
+
+async def flush_pending_stock():
+    """
+    One last flush at shutdown, so the latest reservations don't wait for the next leader.
+    Only when this process holds (or can take) the lease; the lease is then released for the next flusher.
+    """
+    redis = await get_redis_client()
+    if redis is None:
+        return
+    try:
+        if not await _hold_lease(redis):
+            return # Another process flushes
+        await flush_stock_once(redis)
+        await redis.eval(_RELEASE_LEASE_SCRIPT, 1, STOCK_FLUSH_LEASE_KEY, _lease_owner)
+    except Exception as e:
+        logger.warning("Final stock flush failed: %s", e)
+
+
+async def run_stock_flusher():
+    """ Background task flushing pending stock changes to Mongo while this process holds the lease. """
+    while True:
+        try:
+            redis = await get_redis_client()
+            stock_stats["leader"] = redis is not None and await _hold_lease(redis)
+            if stock_stats["leader"]:
+                await flush_stock_once(redis)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stock_stats["failed"] += 1
+            logger.warning("Stock flush error: %s", e)
+        await asyncio.sleep(STOCK_FLUSH_INTERVAL_SECONDS)
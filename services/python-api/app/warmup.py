@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import orjson
+
+from . import cache
+from .config import (
+    get_redis_client,
+    CACHE_WARMUP_ENABLED, CACHE_WARMUP_TOP_PRODUCTS, CACHE_WARMUP_LIST_PAGES,
+    CACHE_WARMUP_CONCURRENCY, CACHE_WARMUP_TIMEOUT_SECONDS,
+    HOT_PRODUCTS_KEY, HOT_PRODUCTS_MAX_TRACKED, HOT_PRODUCTS_FLUSH_SECONDS, HOT_PRODUCTS_TTL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# How long warm-up waits for the invalidation subscription, without which nothing is kept locally
+SUBSCRIPTION_WAIT_SECONDS = 2.0
+SUBSCRIPTION_POLL_SECONDS = 0.05
+# Page size of the warmed list pages (the GET /products default)
+LIST_PAGE_LIMIT = 100
+
+# Progress of the warm-up in this process; /health is ready once the status is final
+warmup_state: Dict[str, Any] = {
+    "status": "pending" if CACHE_WARMUP_ENABLED else "disabled",
+    "products": 0,
+    "pages": 0,
+    "seconds": None,
+}
+_FINAL_STATUSES = ("done", "timed_out", "failed", "skipped", "disabled")
+
+# Product hits since the last flush to HOT_PRODUCTS_KEY
+_hits: Counter = Counter()
+
+
+def warmup_finished() -> bool:
+    return warmup_state["status"] in _FINAL_STATUSES
+
+
+def record_product_hit(product_id: str):
+    """ Counts a served product; run_hot_product_tracker adds the counts to the shared ranking. """
+    if CACHE_WARMUP_ENABLED:
+        _hits[product_id] += 1
+
+
+async def _flush_hits():
+    global _hits
+    hits, _hits = _hits, Counter()
+    if not hits:
+        return
+    redis = await get_redis_client()
+    if redis is None:
+        return # Breaker open; this interval's counts are dropped
+    pipe = redis.pipeline(transaction=False)
+    for product_id, count in hits.items():
+        pipe.zincrby(HOT_PRODUCTS_KEY, count, product_id)
+    # Keep only the top HOT_PRODUCTS_MAX_TRACKED ids
+    pipe.zremrangebyrank(HOT_PRODUCTS_KEY, 0, -HOT_PRODUCTS_MAX_TRACKED - 1)
+    pipe.expire(HOT_PRODUCTS_KEY, HOT_PRODUCTS_TTL_SECONDS)
+    await pipe.execute()
+
+
+async def run_hot_product_tracker():
+    """ Long-running task that periodically adds this process' product hits to HOT_PRODUCTS_KEY. """
+    if not CACHE_WARMUP_ENABLED:
+        return
+    try:
+        while True:
+            await asyncio.sleep(HOT_PRODUCTS_FLUSH_SECONDS)
+            try:
+                await _flush_hits()
+            except Exception as e:
+                logger.warning("Hot product tracking error: %s", e)
+    finally:
+        _hits.clear()
+
+
+async def _wait_for_local_cache():
+    deadline = time.monotonic() + SUBSCRIPTION_WAIT_SECONDS
+    while not cache.local_cache_active() and time.monotonic() < deadline:
+        await asyncio.sleep(SUBSCRIPTION_POLL_SECONDS)
+
+
+async def _warm_products(product_ids: List[str], load_product: Callable[[str], Awaitable[Optional[bytes]]]):
+    # Each chunk is gathered in one tick, so the batch loaders turn it into one pipeline / one $in query
+    for start in range(0, len(product_ids), CACHE_WARMUP_CONCURRENCY):
+        chunk = product_ids[start:start + CACHE_WARMUP_CONCURRENCY]
+        results = await asyncio.gather(*(load_product(product_id) for product_id in chunk), return_exceptions=True)
+        warmup_state["products"] += sum(1 for result in results if isinstance(result, bytes))
+
+
+async def _warm_list_pages(load_page: Callable[..., Awaitable[bytes]]):
+    cursor = None
+    for _ in range(CACHE_WARMUP_LIST_PAGES):
+        page = await load_page(limit=LIST_PAGE_LIMIT, cursor=cursor)
+        warmup_state["pages"] += 1
+        cursor = orjson.loads(page).get("next_cursor")
+        if not cursor:
+            break
+
+
+async def _warm(load_product, load_page):
+    await _wait_for_local_cache()
+    redis = await get_redis_client()
+    if redis is None:
+        warmup_state["status"] = "skipped" # Nothing to warm without Redis
+        return
+    product_ids = [
+        product_id.decode() if isinstance(product_id, bytes) else product_id
+        for product_id in await redis.zrevrange(HOT_PRODUCTS_KEY, 0, CACHE_WARMUP_TOP_PRODUCTS - 1)
+    ]
+    await asyncio.gather(_warm_products(product_ids, load_product), _warm_list_pages(load_page))
+
+
+async def run_cache_warmup(
+    load_product: Callable[[str], Awaitable[Optional[bytes]]],
+    load_page: Callable[..., Awaitable[bytes]],
+):
+    """
+    Preloads the hottest product ids and the first list pages into Redis and the local cache.
+    load_product(product_id) and load_page(limit=..., cursor=...) are the request-path cache
+    loaders, so warm-up takes the same locks and batching as real traffic.
+    Always ends in a final status, which is what /health waits for.
+    """
+    if not CACHE_WARMUP_ENABLED:
+        return
+    warmup_state["status"] = "running"
+    started = time.monotonic()
+    try:
+        await asyncio.wait_for(_warm(load_product, load_page), CACHE_WARMUP_TIMEOUT_SECONDS)
+        if warmup_state["status"] == "running":
+            warmup_state["status"] = "done"
+    except asyncio.TimeoutError:
+        warmup_state["status"] = "timed_out"
+    except asyncio.CancelledError:
+        warmup_state["status"] = "failed"
+        raise
+    except Exception as e:
+        warmup_state["status"] = "failed"
+        logger.warning("Cache warm-up failed: %s", e)
+    warmup_state["seconds"] = round(time.monotonic() - started, 3)
+    logger.info(
+        "Cache warm-up %s: %d products, %d list pages in %.2fs",
+        warmup_state["status"], warmup_state["products"], warmup_state["pages"], warmup_state["seconds"],
+    )
@@ -0,0 +1,13 @@
+"""
+Gunicorn worker class for the production entry point (see gunicorn.conf.py).
+
+Each worker is a separate process that imports the app after the fork and opens its own
+Mongo/Redis/RabbitMQ clients in the lifespan, so nothing is shared across processes.
+"""
+from uvicorn.workers import UvicornWorker
+
+
+class ProductApiWorker(UvicornWorker):
+    # Pinned instead of "auto" so a missing uvloop/httptools fails at boot rather than
+    # silently falling back to the slower asyncio loop and h11 parser
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
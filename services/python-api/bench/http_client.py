@@ -0,0 +1,68 @@
+"""
+Minimal keep-alive HTTP/1.1 client on asyncio streams.
+
+Just enough for the benchmark (JSON bodies, Content-Length responses), so the
+harness needs no extra dependency and adds as little client overhead as possible.
+"""
+import asyncio
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+
+class HttpConnection:
+    def __init__(self, base_url: str):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, bytes]:
+        if self._writer is None:
+            await self._connect()
+        head = f"{method} {self.prefix}{path} HTTP/1.1\r\nHost: {self.host}\r\n"
+        if body is not None:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        self._writer.write(head.encode() + b"\r\n" + (body or b""))
+        try:
+            return await self._read_response()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close() # Server closed the keep-alive connection; next request reconnects
+            raise
+
+    async def _read_response(self) -> Tuple[int, bytes]:
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        content_length = 0
+        keep_alive = True
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                content_length = int(value.strip())
+            elif name == "connection" and value.strip().lower() == "close":
+                keep_alive = False
+            elif name == "transfer-encoding":
+                raise ValueError("Chunked responses are not supported by the benchmark client")
+        payload = await self._reader.readexactly(content_length) if content_length else b""
+        if not keep_alive:
+            await self.close()
+        return status, payload
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception: # nosec
+                pass
+        self._reader = self._writer = None
@@ -0,0 +1,322 @@
+"""
+Benchmark harness for the Python product API.
+
+    pip install -r bench/requirements.txt      # only needed for the in-process target
+    python -m bench.run --scenario read_warm --concurrency 32 --duration 20
+    python -m bench.run --scenario mixed --rate 500 --target http://localhost:8000
+    python -m bench.run --scenario read_warm --compare bench/baselines/read_warm.json
+
+Run from services/python-api. Prints one JSON report (throughput, p50/p95/p99 overall and
+per operation). With --rate the load is open-loop: latency is measured from each request's
+scheduled start, so a slow server shows up as queueing instead of a lower offered load.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from .targets import HttpTarget, InProcessTarget
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+SEED_BATCH_SIZE = 500
+LIST_PAGE_SIZE = 50
+
+# Result of one operation: (name, status)
+OpResult = Tuple[str, int]
+
+
+class Scenario:
+    """ A request mix. prepare() runs before the clock starts; run_one() is one timed operation. """
+    name = ""
+    description = ""
+
+    def __init__(self, product_ids: List[str], rng: random.Random):
+        self.product_ids = product_ids
+        self.rng = rng
+
+    async def prepare(self, target):
+        pass
+
+    async def run_one(self, target) -> OpResult:
+        raise NotImplementedError
+
+
+class ReadWarm(Scenario):
+    name = "read_warm"
+    description = "GET /products/{id} over ids that are all cached"
+
+    async def prepare(self, target):
+        for product_id in self.product_ids:
+            await target.request("GET", f"/products/{product_id}")
+
+    async def run_one(self, target) -> OpResult:
+        status, _ = await target.request("GET", f"/products/{self.rng.choice(self.product_ids)}")
+        return "get_product", status
+
+
+class ReadCold(Scenario):
+    name = "read_cold"
+    description = "GET /products/{id} walking ids in order after a cache flush (misses until ids wrap around)"
+
+    async def prepare(self, target):
+        await target.flush_cache()
+        self._next = 0
+
+    async def run_one(self, target) -> OpResult:
+        product_id = self.product_ids[self._next % len(self.product_ids)]
+        self._next += 1
+        status, _ = await target.request("GET", f"/products/{product_id}")
+        return "get_product", status
+
+
+class ListPages(Scenario):
+    name = "list_pages"
+    description = f"GET /products?limit={LIST_PAGE_SIZE} at random page depths (keyset cursors)"
+
+    async def prepare(self, target):
+        # Walk the catalog once to collect every page's cursor (this also warms the list cache)
+        self.cursors: List[Optional[str]] = [None]
+        while True:
+            status, body = await target.request("GET", self._page_path(self.cursors[-1]))
+            next_cursor = json.loads(body).get("next_cursor") if status == 200 else None
+            if not next_cursor:
+                break
+            self.cursors.append(next_cursor)
+
+    @staticmethod
+    def _page_path(cursor: Optional[str]) -> str:
+        return f"/products?limit={LIST_PAGE_SIZE}" + (f"&cursor={cursor}" if cursor else "")
+
+    async def run_one(self, target) -> OpResult:
+        status, _ = await target.request("GET", self._page_path(self.rng.choice(self.cursors)))
+        return "list_products", status
+
+
+class WriteBurst(Scenario):
+    name = "write_burst"
+    description = "70% PUT /products/{id}, 30% POST /products (cache invalidation + event path)"
+
+    async def run_one(self, target) -> OpResult:
+        if self.rng.random() < 0.7:
+            body = json.dumps({"stock": self.rng.randint(0, 1000)}).encode()
+            status, _ = await target.request("PUT", f"/products/{self.rng.choice(self.product_ids)}", body)
+            return "update_product", status
+        status, _ = await target.request("POST", "/products", json.dumps(_new_product(self.rng)).encode())
+        return "create_product", status
+
+
+class Mixed(Scenario):
+    name = "mixed"
+    description = "80% warm reads by id, 15% list pages, 5% writes"
+
+    def __init__(self, product_ids: List[str], rng: random.Random):
+        super().__init__(product_ids, rng)
+        self.reads = ReadWarm(product_ids, rng)
+        self.lists = ListPages(product_ids, rng)
+        self.writes = WriteBurst(product_ids, rng)
+
+    async def prepare(self, target):
+        await self.reads.prepare(target)
+        await self.lists.prepare(target)
+
+    async def run_one(self, target) -> OpResult:
+        roll = self.rng.random()
+        if roll < 0.80:
+            return await self.reads.run_one(target)
+        if roll < 0.95:
+            return await self.lists.run_one(target)
+        return await self.writes.run_one(target)
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (ReadWarm, ReadCold, ListPages, WriteBurst, Mixed)}
+
+
+def _new_product(rng: random.Random) -> Dict:
+    return {
+        "name": f"Bench Product {rng.randrange(10**9)}",
+        "price": round(rng.uniform(1, 500), 2),
+        "stock": rng.randint(0, 1000),
+    }
+
+
+async def seed_products(target, count: int, rng: random.Random) -> List[str]:
+    product_ids: List[str] = []
+    while len(product_ids) < count:
+        batch = [_new_product(rng) for _ in range(min(SEED_BATCH_SIZE, count - len(product_ids)))]
+        status, body = await target.request("POST", "/products:batch", json.dumps(batch).encode())
+        if status != 200:
+            raise RuntimeError(f"Seeding failed with HTTP {status}: {body[:200]!r}")
+        product_ids.extend(result["id"] for result in json.loads(body)["results"] if result.get("id"))
+    return product_ids
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """ Nearest-rank percentile of an already sorted list. """
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values), max(1, math.ceil(pct / 100 * len(sorted_values)))) - 1
+    return sorted_values[rank]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+    }
+
+
+async def drive(target, scenario: Scenario, concurrency: int, rate: float, duration: float, max_requests: int):
+    """
+    Runs the scenario for `duration` seconds or `max_requests` operations, whichever comes first.
+    rate <= 0: closed loop, `concurrency` workers issue requests back to back.
+    rate > 0: open loop, requests are scheduled every 1/rate seconds and picked up by the workers.
+    """
+    latencies: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    issued = 0
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + duration
+    schedule: "asyncio.Queue[Optional[float]]" = asyncio.Queue()
+
+    def budget_left() -> bool:
+        return loop.time() < deadline and (not max_requests or issued < max_requests)
+
+    async def one(scheduled_at: float):
+        try:
+            op, status = await scenario.run_one(target)
+        except Exception as e:
+            op, status = type(e).__name__, 0
+        latencies.setdefault(op, []).append(loop.time() - scheduled_at)
+        if status == 0 or status >= 400:
+            errors[op] = errors.get(op, 0) + 1
+
+    async def closed_worker():
+        nonlocal issued
+        while budget_left():
+            issued += 1
+            await one(loop.time())
+
+    async def open_worker():
+        while True:
+            scheduled_at = await schedule.get()
+            if scheduled_at is None:
+                return
+            await one(scheduled_at)
+
+    async def scheduler():
+        nonlocal issued
+        interval = 1.0 / rate
+        next_at = started
+        while budget_left():
+            schedule.put_nowait(next_at)
+            issued += 1
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+        for _ in range(concurrency):
+            schedule.put_nowait(None)
+
+    if rate > 0:
+        await asyncio.gather(scheduler(), *[open_worker() for _ in range(concurrency)])
+    else:
+        await asyncio.gather(*[closed_worker() for _ in range(concurrency)])
+    return latencies, errors, loop.time() - started
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """ Regressions beyond `tolerance` (fraction) in throughput or tail latency. """
+    regressions = []
+    if report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput {report['throughput_rps']} < baseline {baseline['throughput_rps']}")
+    for key in ("p95_ms", "p99_ms"):
+        current, previous = report["latency"][key], baseline["latency"][key]
+        if current > previous * (1 + tolerance):
+            regressions.append(f"{key} {current} > baseline {previous}")
+    return regressions
+
+
+async def main_async(args) -> int:
+    rng = random.Random(args.seed)
+    target = InProcessTarget() if args.target == "inprocess" else HttpTarget(args.target, args.concurrency)
+    await target.setup()
+    try:
+        product_ids = await seed_products(target, args.products, rng)
+        scenario = SCENARIOS[args.scenario](product_ids, rng)
+        await scenario.prepare(target)
+        latencies, errors, elapsed = await drive(
+            target, scenario, args.concurrency, args.rate, args.duration, args.requests
+        )
+    finally:
+        await target.close()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    report = {
+        "scenario": scenario.name,
+        "description": scenario.description,
+        "target": target.name,
+        "concurrency": args.concurrency,
+        "rate": args.rate or None,
+        "products": len(product_ids),
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": len(all_latencies),
+        "errors": sum(errors.values()),
+        "throughput_rps": round(len(all_latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency": summarize(all_latencies),
+        "operations": {
+            op: dict(summarize(values), errors=errors.get(op, 0)) for op, values in sorted(latencies.items())
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, f"{scenario.name}.json"), "w") as f:
+            f.write(output + "\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Python product API.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--target", default="inprocess", help="'inprocess' (fakes) or a base URL, e.g. http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rate", type=float, default=0, help="Requests per second (open loop); 0 = closed loop")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0 = no limit)")
+    parser.add_argument("--products", type=int, default=1000, help="Products to seed before the run")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for a reproducible request mix")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Write the report to {BASELINE_DIR}/<scenario>.json")
+    parser.add_argument("--compare", help="Baseline report to compare against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed regression as a fraction (default 0.25)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main_async(parse_args())))
@@ -0,0 +1,101 @@
+"""
+Where benchmark requests go.
+
+- InProcessTarget calls the FastAPI app directly over ASGI, with Redis and Mongo
+  replaced by fakeredis and mongomock-motor (see bench/requirements.txt).
+  No containers and no network, so it isolates the app's own CPU cost on the hot paths.
+- HttpTarget talks to a running API (e.g. the docker-compose stack) over keep-alive HTTP.
+"""
+import asyncio
+import os
+from typing import Dict, List, Tuple
+
+from .http_client import HttpConnection
+
+
+class InProcessTarget:
+    name = "inprocess"
+
+    async def setup(self):
+        # Keep app logs from interleaving with the JSON report (config reads this at import)
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        # Imported here so HTTP runs don't need the app's dependencies installed
+        import fakeredis.aioredis
+        from mongomock_motor import AsyncMongoMockClient
+        from app import cache, config
+        from app.main import app
+
+        config.mongo_client = AsyncMongoMockClient()
+        config.db = config.mongo_client[config.MONGO_DB_NAME]
+        config.redis_client = fakeredis.aioredis.FakeRedis()
+        # A single process needs no pub/sub fan-out; invalidate_keys drops local entries directly
+        cache._invalidation_subscribed = True
+        self.app = app
+        self._cache = cache
+        self._config = config
+
+    async def flush_cache(self):
+        await self._config.redis_client.flushall()
+        self._cache.local_product_cache.clear()
+
+    async def request(self, method: str, path: str, body: bytes = None) -> Tuple[int, bytes]:
+        raw_path, _, query = path.partition("?")
+        headers = [(b"host", b"bench")]
+        if body is not None:
+            headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": method, "scheme": "http", "path": raw_path, "raw_path": raw_path.encode(),
+            "query_string": query.encode(), "root_path": "", "headers": headers,
+            "client": ("127.0.0.1", 50000), "server": ("bench", 80), "app": self.app,
+        }
+        messages = [{"type": "http.request", "body": body or b"", "more_body": False}]
+        status = 500
+        chunks: List[bytes] = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait() # No disconnect during a benchmark request
+
+        async def send(message: Dict):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return status, b"".join(chunks)
+
+    async def close(self):
+        # Let fire-and-forget work (cache refreshes) settle before the loop goes away
+        await asyncio.sleep(0)
+
+
+class HttpTarget:
+    name = "http"
+
+    def __init__(self, base_url: str, concurrency: int):
+        self.base_url = base_url
+        self._idle: "asyncio.Queue[HttpConnection]" = asyncio.Queue()
+        for _ in range(concurrency + 1):
+            self._idle.put_nowait(HttpConnection(base_url))
+
+    async def setup(self):
+        pass
+
+    async def flush_cache(self):
+        # Cannot reach the remote Redis; cold scenarios rely on never-read ids instead
+        pass
+
+    async def request(self, method: str, path: str, body: bytes = None) -> Tuple[int, bytes]:
+        connection = await self._idle.get()
+        try:
+            return await connection.request(method, path, body)
+        finally:
+            self._idle.put_nowait(connection)
+
+    async def close(self):
+        while not self._idle.empty():
+            await self._idle.get_nowait().close()
@@ -0,0 +1,111 @@
+"""
+Production entry point: gunicorn managing one uvicorn worker per available core.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+- Workers import the app after the fork (no preload), so each one builds its own
+  Mongo/Redis/RabbitMQ clients and its own logging thread in the lifespan.
+- Workers never consume events. With CONSUMER_MODE=embedded the master runs exactly one
+  `python -m app.consumer` process next to them (restarted if it dies); with
+  CONSUMER_MODE=external a sidecar/separate deployment does it (docker-compose python-consumer).
+- SIGTERM: workers stop accepting, finish in-flight requests and run the lifespan shutdown
+  (event publisher drain) within GUNICORN_GRACEFUL_TIMEOUT, then the consumer is stopped.
+"""
+import math
+import os
+import subprocess
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+# Same .env the app reads (app/config.py), so both agree on CONSUMER_MODE
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+
+
+def _cgroup_cpu_limit():
+    """ CPUs allowed by the container's CFS quota (cgroup v2, then v1), or None when unlimited. """
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def _default_workers() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0)) # CPUs this container may be scheduled on (the node's, under k8s)
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit() # e.g. 200m -> 0.2: one worker, not one per node core
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, cpus)
+
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", 0)) or _default_workers()
+worker_class = "app.workers.ProductApiWorker"
+preload_app = False
+# Seconds a worker gets after SIGTERM to finish in-flight requests and its lifespan shutdown
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Recycle workers after this many requests (0 = never); jitter keeps them from restarting together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+# Heartbeat files on tmpfs; a slow overlay filesystem can make healthy workers look stuck
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+accesslog = None # Access lines come from uvicorn.access through the app's JSON logging
+
+_run_consumer = os.getenv("CONSUMER_MODE", "embedded") == "embedded"
+# Inherited by the workers; load_dotenv in app/config.py never overrides it
+os.environ["CONSUMER_MODE"] = "external"
+
+CONSUMER_RESTART_SECONDS = 5
+_consumer_stopping = threading.Event()
+_consumer_process = None
+
+
+def _supervise_consumer(server):
+    global _consumer_process
+    while not _consumer_stopping.is_set():
+        # Own session: a Ctrl-C or group-wide SIGTERM reaches only the master, which stops
+        # the consumer itself once the workers have drained (on_exit)
+        _consumer_process = subprocess.Popen([sys.executable, "-m", "app.consumer"], start_new_session=True)
+        server.log.info("Started event consumer (pid %s)", _consumer_process.pid)
+        returncode = _consumer_process.wait()
+        if _consumer_stopping.is_set():
+            return
+        server.log.warning(
+            "Event consumer exited with %s, restarting in %ss", returncode, CONSUMER_RESTART_SECONDS
+        )
+        _consumer_stopping.wait(CONSUMER_RESTART_SECONDS)
+
+
+def when_ready(server):
+    if _run_consumer:
+        threading.Thread(target=_supervise_consumer, args=(server,), name="consumer-supervisor", daemon=True).start()
+
+
+def on_exit(server):
+    # Runs after the workers have drained
+    _consumer_stopping.set()
+    process = _consumer_process
+    if process is None or process.poll() is not None:
+        return
+    process.terminate() # app.consumer stops consuming and closes its connections on SIGTERM
+    try:
+        process.wait(timeout=graceful_timeout)
+    except subprocess.TimeoutExpired:
+        server.log.warning("Event consumer did not stop in %ss, killing it", graceful_timeout)
+        process.kill()
@@ -0,0 +1,91 @@
+"""
+Shared fixtures: the app served in-process (bench.targets.InProcessTarget), with Redis and
+Mongo replaced by fakeredis and mongomock-motor. Needs bench/requirements.txt and pytest.
+
+Run from services/python-api:  python -m pytest tests
+"""
+import asyncio
+import json
+from typing import Any, Dict, Optional, Tuple
+
+import pytest
+
+from app import cache, config
+from bench.targets import InProcessTarget
+
+
+class ApiClient:
+    """ Synchronous wrapper over InProcessTarget: tests stay plain functions. """
+
+    def __init__(self, target: InProcessTarget, loop: asyncio.AbstractEventLoop):
+        self.target = target
+        self.loop = loop
+
+    def run(self, coroutine) -> Any:
+        return self.loop.run_until_complete(coroutine)
+
+    def request(self, method: str, path: str, body: Any = None) -> Tuple[int, Optional[Any]]:
+        """ Returns (status, decoded JSON body or None when the body is empty). """
+        raw_body = json.dumps(body).encode() if body is not None else None
+        status, payload = self.run(self.target.request(method, path, raw_body))
+        return status, json.loads(payload) if payload and payload != b"null" else None
+
+    def exchange(
+        self, method: str, path: str, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """ One bodiless request with headers through the full middleware stack; returns (status, headers, body). """
+        raw_path, _, query = path.partition("?")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": method, "scheme": "http", "path": raw_path, "raw_path": raw_path.encode(),
+            "query_string": query.encode(), "root_path": "",
+            "headers": [(b"host", b"test")] + [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+            "client": ("127.0.0.1", 50000), "server": ("test", 80), "app": self.target.app,
+        }
+        response: Dict[str, Any] = {"headers": {}, "body": b""}
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = {k.decode().lower(): v.decode() for k, v in message["headers"]}
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+
+        self.run(self.target.app(scope, receive, send))
+        return response["status"], response["headers"], response["body"]
+
+    @property
+    def redis(self):
+        """ The (fake) Redis client the app uses. """
+        return config.redis_client
+
+    def drop_local_cache(self):
+        """ Forgets this process' copies, so the next read goes to Redis like another pod's would. """
+        cache.local_product_cache.clear()
+
+
+@pytest.fixture(scope="session")
+def loop():
+    # One loop for the session: the app's batchers and clients are module-level
+    event_loop = asyncio.new_event_loop()
+    yield event_loop
+    event_loop.close()
+
+
+@pytest.fixture(scope="session")
+def target(loop) -> InProcessTarget:
+    in_process_target = InProcessTarget()
+    loop.run_until_complete(in_process_target.setup())
+    yield in_process_target
+    loop.run_until_complete(in_process_target.close())
+
+
+@pytest.fixture
+def api(target, loop) -> ApiClient:
+    """ The app with an empty database and empty caches. """
+    loop.run_until_complete(config.mongo_client.drop_database(config.MONGO_DB_NAME))
+    loop.run_until_complete(target.flush_cache())
+    return ApiClient(target, loop)
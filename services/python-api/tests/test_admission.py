@@ -0,0 +1,72 @@
+""" Admission control: bounded queues per route class, and shed_first classes refused first under load. """
+import asyncio
+
+import pytest
+
+from app import admission
+from app.admission import AdaptiveLimiter
+
+
+def limiter(**overrides) -> AdaptiveLimiter:
+    settings = dict(
+        initial_limit=1, min_limit=1, max_limit=4, target_latency_seconds=0.1,
+        max_queue=1, queue_timeout_seconds=0.05, shed_first=False,
+    )
+    settings.update(overrides)
+    return AdaptiveLimiter("test", **settings)
+
+
+def test_queue_full_and_queue_timeout(loop):
+    test_limiter = limiter()
+
+    async def scenario():
+        assert await test_limiter.acquire() is None
+        waiter = asyncio.ensure_future(test_limiter.acquire())
+        await asyncio.sleep(0)
+        assert await test_limiter.acquire() == "queue_full"
+        return await waiter
+
+    assert loop.run_until_complete(scenario()) == "queue_timeout"
+    assert test_limiter.queued == 0
+
+
+def test_release_hands_the_slot_to_the_oldest_waiter(loop):
+    test_limiter = limiter(queue_timeout_seconds=1)
+
+    async def scenario():
+        await test_limiter.acquire()
+        waiter = asyncio.ensure_future(test_limiter.acquire())
+        await asyncio.sleep(0)
+        test_limiter.release(0.01)
+        return await waiter
+
+    assert loop.run_until_complete(scenario()) is None
+    assert test_limiter.in_flight == 1
+
+
+def test_slow_completions_shrink_the_limit():
+    test_limiter = limiter(initial_limit=10, max_limit=10)
+    test_limiter.in_flight = 2
+
+    test_limiter.release(0.5)
+    test_limiter.release(0.5) # Same interval: one decrease, not two
+
+    assert test_limiter.limit == pytest.approx(10 * admission.ADMISSION_BACKOFF_RATIO)
+
+
+@pytest.fixture
+def busy(api, monkeypatch):
+    """ 8 of at most 10 in-flight requests taken by reads: past the shed_first share. """
+    monkeypatch.setattr(admission, "ADMISSION_MAX_IN_FLIGHT", 10)
+    monkeypatch.setattr(admission, "ADMISSION_SHED_FIRST_SHARE", 0.7)
+    monkeypatch.setattr(admission.limiters["read"], "in_flight", 8)
+
+
+def test_busy_process_sheds_list_scans_but_serves_reads(api, busy):
+    assert api.request("POST", "/products:batch", [{"name": "bulk", "price": 1}])[0] == 503
+
+    status, headers, _body = api.exchange("GET", "/products")
+    assert status == 503
+    assert headers["retry-after"] == str(admission.ADMISSION_RETRY_AFTER_SECONDS)
+    assert api.exchange("GET", "/products/60c72b2f9b1e8a5f68d672c3")[0] == 404 # Admitted
+    assert api.exchange("GET", "/metrics")[0] == 200 # Never limited
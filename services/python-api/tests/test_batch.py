@@ -0,0 +1,106 @@
+""" Per-item results of the /products:batch endpoints. """
+from app import crud
+from app.config import OUTBOX_COLLECTION, OUTBOX_ENABLED, get_mongo_db
+
+MISSING_ID = "60c72b2f9b1e8a5f68d672c3"
+
+
+def statuses(body):
+    return [result["status"] for result in body["results"]]
+
+
+def create(api, *names):
+    status, body = api.request("POST", "/products:batch", [{"name": name, "price": 1.5, "stock": 10} for name in names])
+    assert status == 200
+    return [result["id"] for result in body["results"]]
+
+
+def unique_names(api):
+    """ A unique index on name, so single items of a batch can fail with a duplicate key. """
+    collection = api.run(crud.get_product_collection())
+    api.run(collection.create_index("name", unique=True))
+
+
+def outbox_events(api, routing_key):
+    outbox = api.run(get_mongo_db()).get_collection(OUTBOX_COLLECTION)
+    return [doc["product_id"] for doc in api.run(outbox.find({"routing_key": routing_key}).to_list(length=None))]
+
+
+def test_create_reports_each_item(api):
+    unique_names(api)
+    status, body = api.request("POST", "/products:batch", [
+        {"name": "a", "price": 1, "stock": 1},
+        {"name": "a", "price": 2, "stock": 1},
+        {"name": "b", "price": 3, "stock": 1},
+    ])
+
+    assert status == 200
+    assert statuses(body) == [201, 409, 201]
+    assert (body["succeeded"], body["failed"]) == (2, 1)
+    assert body["results"][1]["error"] and body["results"][1]["id"] is None
+    assert [result["product"]["name"] for result in body["results"] if result["product"]] == ["a", "b"]
+
+
+def test_create_maps_other_write_errors_to_500(api, monkeypatch):
+    async def failing_create(products):
+        return [(None, crud.ItemWriteError(2, "Bad value"))] * len(products)
+
+    monkeypatch.setattr(crud, "create_products", failing_create)
+    status, body = api.request("POST", "/products:batch", [{"name": "a", "price": 1, "stock": 1}])
+
+    assert status == 200
+    assert statuses(body) == [500]
+
+
+def test_update_reports_each_item(api):
+    unique_names(api)
+    first, second = create(api, "first", "second")
+
+    status, body = api.request("PATCH", "/products:batch", [
+        {"id": first, "name": "renamed"},
+        {"id": second, "name": "renamed"}, # Duplicate key: must not be reported as updated
+        {"id": second}, # Nothing to update
+        {"id": "not-an-id", "name": "x"},
+        {"id": MISSING_ID, "name": "x"},
+    ])
+
+    assert status == 200
+    assert statuses(body) == [200, 409, 200, 400, 404]
+    assert body["results"][0]["product"]["name"] == "renamed"
+    assert body["results"][2]["product"]["name"] == "second"
+    assert api.request("GET", f"/products/{second}")[1]["name"] == "second"
+
+
+def test_update_records_events_for_written_products_only(api):
+    unique_names(api)
+    first, second, third = create(api, "first", "second", "third")
+
+    api.request("PATCH", "/products:batch", [
+        {"id": first, "price": 2},
+        {"id": second, "name": "first"}, # Fails
+        {"id": third}, # No-op
+    ])
+
+    if OUTBOX_ENABLED:
+        assert outbox_events(api, "product.updated") == [first]
+
+
+def test_delete_reports_each_item_once(api):
+    first, second = create(api, "first", "second")
+
+    status, body = api.request("DELETE", "/products:batch", {"ids": [first, first, second, MISSING_ID, "bad"]})
+
+    assert status == 200
+    assert statuses(body) == [204, 400, 204, 404, 400]
+    assert (body["succeeded"], body["failed"]) == (2, 3)
+    assert api.request("GET", f"/products/{first}")[0] == 404
+    if OUTBOX_ENABLED:
+        assert sorted(outbox_events(api, "product.deleted")) == sorted([first, second])
+
+
+def test_batch_size_limit(api):
+    from app.config import BATCH_MAX_ITEMS
+
+    status, _body = api.request("DELETE", "/products:batch", {"ids": [MISSING_ID] * (BATCH_MAX_ITEMS + 1)})
+
+    assert status == 413
@@ -0,0 +1,34 @@
+from bench.run import compare, percentile
+
+
+def make_report(throughput, p95, p99):
+    return {"throughput_rps": throughput, "latency": {"p95_ms": p95, "p99_ms": p99}}
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile(values, 100) == 100.0
+
+
+def test_percentile_small_and_empty_lists():
+    assert percentile([], 99) == 0.0
+    assert percentile([7.0], 50) == 7.0
+    assert percentile([1.0, 2.0, 3.0], 0) == 1.0
+    assert percentile([1.0, 2.0, 3.0], 50) == 2.0
+
+
+def test_compare_within_tolerance():
+    baseline = make_report(1000, 10.0, 20.0)
+    assert compare(make_report(800, 12.0, 24.0), baseline, 0.25) == []
+
+
+def test_compare_reports_each_regression():
+    baseline = make_report(1000, 10.0, 20.0)
+    regressions = compare(make_report(700, 13.0, 20.0), baseline, 0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("throughput")
+    assert regressions[1].startswith("p95_ms")
+    assert compare(make_report(1000, 10.0, 26.0), baseline, 0.25) == ["p99_ms 26.0 > baseline 20.0"]
@@ -0,0 +1,146 @@
+""" Read-after-write through the product cache: a write is visible to the next read in every process. """
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import config, crud
+from app.rabbitmq_service import update_cache_from_event
+
+from app.cache import write_entry
+from app.main import get_product_cache_key
+
+
+@pytest.fixture
+def product(api):
+    status, body = api.request("POST", "/products", {"name": "cached", "price": 2.5, "stock": 5})
+    assert status == 201
+    assert api.request("GET", f"/products/{body['_id']}")[0] == 200 # Now cached in Redis and locally
+    return body
+
+
+@pytest.mark.parametrize("drop_local", [False, True], ids=["same-process", "other-process"])
+def test_get_after_update(api, product, drop_local):
+    status, _body = api.request("PUT", f"/products/{product['_id']}", {"name": "updated"})
+    assert status == 200
+    if drop_local:
+        api.drop_local_cache()
+
+    status, body = api.request("GET", f"/products/{product['_id']}")
+
+    assert status == 200
+    assert body["name"] == "updated"
+
+
+@pytest.mark.parametrize("drop_local", [False, True], ids=["same-process", "other-process"])
+def test_get_after_delete(api, product, drop_local):
+    assert api.request("DELETE", f"/products/{product['_id']}")[0] == 204
+    if drop_local:
+        api.drop_local_cache()
+
+    assert api.request("GET", f"/products/{product['_id']}")[0] == 404
+
+
+def test_get_after_batch_writes(api, product):
+    api.request("PATCH", "/products:batch", [{"id": product["_id"], "price": 9}])
+    api.drop_local_cache()
+    assert api.request("GET", f"/products/{product['_id']}")[1]["price"] == 9
+
+    api.request("DELETE", "/products:batch", {"ids": [product["_id"]]})
+    api.drop_local_cache()
+    assert api.request("GET", f"/products/{product['_id']}")[0] == 404
+
+
+def test_update_reaches_redis(api, product):
+    api.request("PUT", f"/products/{product['_id']}", {"name": "updated"})
+
+    entry = api.run(api.redis.hgetall(get_product_cache_key(product["_id"])))
+
+    assert b'"name":"updated"' in entry[b"v"]
+    assert b"ver" in entry
+
+
+def test_stale_fill_does_not_overwrite_a_write(api, product):
+    """ A miss that loaded the product before the write must not put the old state back. """
+    stale_payload = api.run(api.redis.hget(get_product_cache_key(product["_id"]), "v"))
+    api.request("PUT", f"/products/{product['_id']}", {"name": "updated"})
+
+    api.run(write_entry(api.redis, get_product_cache_key(product["_id"]), stale_payload, 0.0))
+    api.drop_local_cache()
+
+    assert api.request("GET", f"/products/{product['_id']}")[1]["name"] == "updated"
+
+
+def test_list_after_create(api, product):
+    status, body = api.request("GET", "/products")
+    assert status == 200
+    assert [item["name"] for item in body["products"]] == ["cached"]
+
+    api.request("POST", "/products", {"name": "second", "price": 1, "stock": 1})
+
+    assert len(api.request("GET", "/products")[1]["products"]) == 2
+
+
+def test_empty_update_changes_nothing(api, product):
+    generation = api.run(config.redis_client.get(config.PRODUCT_LIST_GENERATION_KEY))
+    outbox = api.run(config.get_mongo_db()).get_collection(config.OUTBOX_COLLECTION)
+    events = api.run(outbox.count_documents({"routing_key": "product.updated"}))
+
+    status, body = api.request("PUT", f"/products/{product['_id']}", {})
+
+    assert status == 200
+    assert body["updated_at"] == product["updated_at"]
+    assert api.run(config.redis_client.get(config.PRODUCT_LIST_GENERATION_KEY)) == generation
+    assert api.run(outbox.count_documents({"routing_key": "product.updated"})) == events
+
+
+def test_slow_fill_that_lost_to_a_write_is_not_kept_locally(api, product, monkeypatch):
+    """ A miss that read the product before a PUT and finishes after it serves its copy once, and no more. """
+    api.drop_local_cache()
+    api.run(config.redis_client.flushall())
+    get_products_by_ids = crud.get_products_by_ids
+
+    async def slow_lookup(*args, **kwargs):
+        products = await get_products_by_ids(*args, **kwargs)
+        await asyncio.sleep(0.05) # The PUT lands while this read is on its way back
+        return products
+
+    monkeypatch.setattr(crud, "get_products_by_ids", slow_lookup)
+
+    async def scenario():
+        read = asyncio.ensure_future(api.target.request("GET", f"/products/{product['_id']}"))
+        await asyncio.sleep(0.01)
+        await api.target.request("PUT", f"/products/{product['_id']}", b'{"name": "updated"}')
+        await read
+
+    api.run(scenario())
+    monkeypatch.undo()
+
+    assert api.request("GET", f"/products/{product['_id']}")[1]["name"] == "updated"
+
+
+def event(event_type, product, **changes):
+    return {"event_type": event_type, "data": {**product, "id": product["_id"], **changes}}
+
+
+def test_stock_event_keeps_the_version(api, product):
+    api.request("PUT", f"/products/{product['_id']}", {"name": "updated"})
+    stock_changed_at = datetime.utcnow() + timedelta(seconds=1)
+
+    api.run(update_cache_from_event(event("product.stock_changed", product, stock=1, updated_at=stock_changed_at.isoformat())))
+    # Redelivered event from before the PUT
+    api.run(update_cache_from_event(event("product.updated", product)))
+    api.drop_local_cache()
+
+    status, body = api.request("GET", f"/products/{product['_id']}")
+    assert (status, body["name"]) == (200, "updated")
+
+
+def test_stock_event_keeps_a_tombstone(api, product):
+    api.request("DELETE", f"/products/{product['_id']}")
+
+    api.run(update_cache_from_event(event("product.stock_changed", product, stock=1)))
+    api.run(update_cache_from_event(event("product.updated", product))) # Older than the delete
+    api.drop_local_cache()
+
+    assert api.request("GET", f"/products/{product['_id']}")[0] == 404
@@ -0,0 +1,84 @@
+""" The Redis circuit breaker: trips on consecutive failures, half-opens after the timeout, resets on success. """
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app import circuit_breaker, config
+from app.circuit_breaker import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(circuit_breaker, "time", fake)
+    return fake
+
+
+def test_trips_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout_seconds=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success() # Resets the count
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+
+    assert breaker.is_open
+    assert not breaker.allow_request()
+
+
+def test_half_opens_after_the_timeout_and_resets_on_success(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout_seconds=10)
+    breaker.record_failure()
+
+    clock.now += 9.9
+    assert not breaker.allow_request()
+    clock.now += 0.1
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failure_while_half_open_reopens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout_seconds=10)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow_request()
+
+    breaker.record_failure() # A single failure is enough
+
+    assert breaker.is_open
+    assert not breaker.allow_request()
+
+
+@pytest.fixture
+def redis_down(api):
+    for _ in range(config.redis_breaker.failure_threshold):
+        config.report_redis_error(RedisConnectionError("connection refused"))
+    yield
+    config.redis_breaker.record_success()
+
+
+def test_reads_and_writes_skip_redis_while_open(api, redis_down):
+    assert api.run(config.get_redis_client()) is None
+
+    status, product = api.request("POST", "/products", {"name": "no cache", "price": 1, "stock": 1})
+    assert status == 201
+    api.drop_local_cache()
+    assert api.request("GET", f"/products/{product['_id']}") == (200, product)
+    assert api.run(api.redis.keys("*")) == [] # Nothing reached Redis
+
+    config.redis_breaker.record_success()
+    assert api.run(config.get_redis_client()) is api.redis
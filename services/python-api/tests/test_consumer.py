@@ -0,0 +1,164 @@
+""" ProductEventConsumer against an in-memory stand-in for the broker: retries, then the DLQ. """
+import asyncio
+
+import orjson
+import pytest
+
+from app import rabbitmq_service
+from app.config import NOTIFICATION_DLX, NOTIFICATION_QUEUE, NOTIFICATION_RETRY_QUEUE
+from app.rabbitmq_service import ProductEventConsumer
+
+
+class PreconditionFailed(Exception):
+    pass
+
+
+class FakeMessage:
+    def __init__(self, body, headers=None, routing_key="product.updated"):
+        self.body = body
+        self.headers = headers or {}
+        self.content_type = "application/json"
+        self.routing_key = routing_key
+        self.acked = False
+
+    async def ack(self):
+        self.acked = True
+
+    async def nack(self, requeue=True):
+        raise AssertionError("Messages are dead-lettered explicitly, never nacked")
+
+
+class FakeBroker:
+    """ Queues keep the arguments of their first declaration, like RabbitMQ. """
+
+    def __init__(self):
+        self.queue_arguments = {NOTIFICATION_QUEUE: {}} # Declared by an older version
+        self.consumers = {}
+        self.dead_letters = []
+
+    async def deliver(self, queue_name, message):
+        await self.consumers[queue_name](message)
+
+
+class FakeExchange:
+    def __init__(self, broker, name):
+        self.broker = broker
+        self.name = name
+
+    async def publish(self, message, routing_key):
+        if self.name == NOTIFICATION_DLX:
+            self.broker.dead_letters.append(message)
+        elif routing_key == NOTIFICATION_RETRY_QUEUE:
+            # The retry delay expires right away: back into the main queue
+            await self.broker.deliver(NOTIFICATION_QUEUE, FakeMessage(message.body, message.headers))
+
+
+class FakeQueue:
+    def __init__(self, broker, name):
+        self.broker = broker
+        self.name = name
+
+    async def bind(self, exchange, routing_key=None):
+        pass
+
+    async def consume(self, callback):
+        self.broker.consumers[self.name] = callback
+        return "consumer-tag"
+
+    async def cancel(self, tag):
+        pass
+
+
+class FakeChannel:
+    is_closed = False
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.default_exchange = FakeExchange(broker, "")
+
+    async def set_qos(self, prefetch_count):
+        pass
+
+    async def declare_exchange(self, name, exchange_type, durable=False):
+        return FakeExchange(self.broker, name)
+
+    async def declare_queue(self, name, durable=False, arguments=None, passive=False):
+        arguments = arguments or {}
+        existing = self.broker.queue_arguments.setdefault(name, arguments)
+        if existing != arguments:
+            raise PreconditionFailed(f"inequivalent arg for queue '{name}'")
+        return FakeQueue(self.broker, name)
+
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def channel(self):
+        return FakeChannel(self.broker)
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    fake = FakeBroker()
+
+    async def get_rabbitmq_channel():
+        return FakeConnection(fake), None
+
+    monkeypatch.setattr(rabbitmq_service, "get_rabbitmq_channel", get_rabbitmq_channel)
+    return fake
+
+
+def run_consumer(loop, broker, handler, *bodies, max_retries=2):
+    async def scenario():
+        consumer = ProductEventConsumer(handler, prefetch_count=10, concurrency=2, max_retries=max_retries, retry_delay_ms=10)
+        assert await consumer.start()
+        messages = [FakeMessage(body) for body in bodies]
+        for message in messages:
+            await broker.deliver(NOTIFICATION_QUEUE, message)
+        await asyncio.sleep(0.05)
+        await consumer.stop()
+        return consumer, messages
+
+    return loop.run_until_complete(scenario())
+
+
+def test_starts_against_the_existing_queue(loop, broker):
+    async def handler(content):
+        pass
+
+    consumer, messages = run_consumer(loop, broker, handler, orjson.dumps({"event_type": "product.updated"}))
+
+    assert consumer.stats()["processed"] == 1
+    assert messages[0].acked
+    assert broker.queue_arguments[NOTIFICATION_QUEUE] == {}
+
+
+def test_failing_message_is_retried_then_dead_lettered(loop, broker):
+    attempts = []
+
+    async def handler(content):
+        attempts.append(content)
+        raise RuntimeError("handler failed")
+
+    consumer, messages = run_consumer(loop, broker, handler, orjson.dumps({"event_type": "product.updated"}))
+
+    assert len(attempts) == 3 # First delivery plus max_retries
+    assert consumer.stats()["retried"] == 2
+    assert consumer.stats()["dead_lettered"] == 1
+    assert [message.headers["x-retry-count"] for message in broker.dead_letters] == [2]
+    assert broker.dead_letters[0].headers["x-dead-letter-reason"] == "handler failed"
+    assert messages[0].acked
+
+
+def test_undecodable_message_is_dead_lettered_without_retries(loop, broker):
+    async def handler(content):
+        raise AssertionError("never called")
+
+    consumer, _messages = run_consumer(loop, broker, handler, b"{not json")
+
+    assert consumer.stats()["retried"] == 0
+    assert [message.body for message in broker.dead_letters] == [b"{not json"]
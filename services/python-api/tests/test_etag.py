@@ -0,0 +1,60 @@
+""" ETag revalidation: a 304 carries the same validators as the 200 it stands for. """
+import gzip
+import json
+
+import pytest
+
+GZIP = {"Accept-Encoding": "gzip"}
+
+
+@pytest.fixture
+def product(api):
+    return api.request("POST", "/products", {"name": "tagged", "price": 1, "stock": 1})[1]
+
+
+def revalidate(api, path, headers):
+    status, first, body = api.exchange("GET", path, headers)
+    assert status == 200
+    status, second, empty = api.exchange("GET", path, {**headers, "If-None-Match": first["etag"]})
+    assert status == 304
+    assert empty == b""
+    return first, second, body
+
+
+def test_compressed_page_and_its_304_agree(api):
+    for index in range(40):
+        api.request("POST", "/products", {"name": f"product {index}", "price": 1, "stock": 1})
+
+    first, second, body = revalidate(api, "/products", GZIP)
+
+    assert first["content-encoding"] == "gzip"
+    assert len(json.loads(gzip.decompress(body))["products"]) == 40
+    assert first["etag"].startswith('W/"')
+    assert second["etag"] == first["etag"]
+    assert second["vary"] == first["vary"] == "Accept-Encoding"
+
+
+def test_small_product_and_its_304_agree(api, product):
+    first, second, _body = revalidate(api, f"/products/{product['_id']}", GZIP)
+
+    assert "content-encoding" not in first
+    assert second["etag"] == first["etag"]
+    assert second["vary"] == first["vary"] == "Accept-Encoding"
+
+
+def test_identity_client_gets_a_strong_etag(api, product):
+    first, second, _body = revalidate(api, f"/products/{product['_id']}", {})
+
+    assert not first["etag"].startswith("W/")
+    assert second["etag"] == first["etag"]
+
+
+def test_changed_product_is_sent_again(api, product):
+    _status, first, _body = api.exchange("GET", f"/products/{product['_id']}", GZIP)
+    api.request("PUT", f"/products/{product['_id']}", {"name": "retagged"})
+
+    status, second, body = api.exchange("GET", f"/products/{product['_id']}", {**GZIP, "If-None-Match": first["etag"]})
+
+    assert status == 200
+    assert second["etag"] != first["etag"]
+    assert json.loads(body)["name"] == "retagged"
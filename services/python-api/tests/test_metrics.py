@@ -0,0 +1,9 @@
+def test_unknown_methods_share_one_label(api):
+    for method in ("FOO", "BAR-1", "PROPFIND"):
+        assert api.exchange(method, f"/nothing-{method}")[0] == 404
+
+    _status, _headers, body = api.exchange("GET", "/metrics")
+    text = body.decode()
+
+    assert 'method="other",route="unmatched",status="4xx"' in text
+    assert 'method="FOO"' not in text and 'method="PROPFIND"' not in text
@@ -0,0 +1,16 @@
+from decimal import Decimal
+
+import pytest
+from pydantic import ValidationError
+
+from app.models import ProductCreate
+
+
+@pytest.mark.parametrize("price", [19.99, "19.99", Decimal("19.99")])
+def test_price_is_an_exact_decimal(price):
+    assert ProductCreate(name="a", price=price).price == Decimal("19.99")
+
+
+def test_price_must_be_positive():
+    with pytest.raises(ValidationError):
+        ProductCreate(name="a", price=0.0)
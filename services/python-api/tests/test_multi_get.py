@@ -0,0 +1,64 @@
+""" GET /products?ids=: several products in one call, through the same cache tiers as single reads. """
+import pytest
+
+from app.config import PRODUCT_MULTI_GET_MAX_IDS
+
+MISSING_ID = "60c72b2f9b1e8a5f68d672c3"
+
+
+@pytest.fixture
+def products(api):
+    created = []
+    for name in ("first", "second", "third"):
+        status, body = api.request("POST", "/products", {"name": name, "price": 1, "stock": 1})
+        assert status == 201
+        created.append(body)
+    return created
+
+
+def names(body):
+    return [product["name"] for product in body["products"]]
+
+
+def test_keeps_the_requested_order_and_skips_unknown_ids(api, products):
+    ids = [products[2]["_id"], MISSING_ID, "not-an-id", products[0]["_id"]]
+
+    status, body = api.request("GET", f"/products?ids={','.join(ids)}")
+
+    assert status == 200
+    assert names(body) == ["third", "first"]
+    assert body["next_cursor"] is None
+
+
+def test_duplicates_are_returned_once(api, products):
+    product_id = products[1]["_id"]
+    status, body = api.request("GET", f"/products?ids={product_id},{product_id}, {product_id}")
+    assert status == 200
+    assert names(body) == ["second"]
+
+
+@pytest.mark.parametrize("cache", ["same-process", "other-process"])
+def test_sees_updates_and_deletes(api, products, cache):
+    ids = ",".join(product["_id"] for product in products)
+    api.request("GET", f"/products?ids={ids}") # Cached
+    api.request("PUT", f"/products/{products[0]['_id']}", {"name": "renamed"})
+    api.request("DELETE", f"/products/{products[1]['_id']}")
+    if cache == "other-process":
+        api.drop_local_cache()
+
+    assert names(api.request("GET", f"/products?ids={ids}")[1]) == ["renamed", "third"]
+
+
+def test_etag_changes_with_any_product(api, products):
+    path = f"/products?ids={products[0]['_id']},{products[1]['_id']}"
+    _status, headers, _body = api.exchange("GET", path)
+    assert api.exchange("GET", path, {"If-None-Match": headers["etag"]})[0] == 304
+
+    api.request("PUT", f"/products/{products[1]['_id']}", {"price": 2})
+
+    assert api.exchange("GET", path, {"If-None-Match": headers["etag"]})[0] == 200
+
+
+def test_too_many_ids(api):
+    ids = ",".join(f"{index:024x}" for index in range(PRODUCT_MULTI_GET_MAX_IDS + 1))
+    assert api.request("GET", f"/products?ids={ids}")[0] == 400
@@ -0,0 +1,82 @@
+""" Outbox relay ordering: a product's events go out in version order, never overtaking a failed one. """
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+
+from app import outbox
+from app.main import get_product_cache_key
+
+PRODUCT = "60c72b2f9b1e8a5f68d672c3"
+OTHER_PRODUCT = "60c72b2f9b1e8a5f68d672c4"
+
+
+class FakePublisher:
+    def __init__(self):
+        self.published = []
+        self.failing = set() # (product id, name) pairs refused by the "broker"
+
+    async def publish_confirmed(self, messages):
+        confirmed = []
+        for _routing_key, body in messages:
+            data = orjson.loads(body)["data"]
+            ok = (data["id"], data["name"]) not in self.failing
+            if ok:
+                self.published.append((data["id"], data["name"]))
+            confirmed.append(ok)
+        return confirmed
+
+
+@pytest.fixture
+def publisher(api, monkeypatch):
+    fake = FakePublisher()
+    monkeypatch.setattr(outbox, "product_event_publisher", fake)
+    return fake
+
+
+def record(api, product_id, name, updated_at):
+    api.run(outbox.add_events("product.updated", [{"id": product_id, "name": name, "updated_at": updated_at}]))
+
+
+def test_relays_in_version_order(api, publisher):
+    now = datetime.utcnow()
+    # Inserted out of order, as two processes can do within one second
+    record(api, PRODUCT, "second", now + timedelta(milliseconds=5))
+    record(api, PRODUCT, "first", now)
+
+    assert api.run(outbox.relay_once()) == 2
+    assert publisher.published == [(PRODUCT, "first"), (PRODUCT, "second")]
+
+
+def test_failed_event_holds_back_later_events_of_its_product(api, publisher):
+    now = datetime.utcnow()
+    record(api, PRODUCT, "v1", now)
+    record(api, OTHER_PRODUCT, "other", now)
+    record(api, PRODUCT, "v2", now + timedelta(milliseconds=5))
+    publisher.failing.add((PRODUCT, "v1"))
+
+    assert api.run(outbox.relay_once()) == 1
+    assert publisher.published == [(OTHER_PRODUCT, "other")]
+
+    publisher.failing.clear()
+    assert api.run(outbox.relay_once()) == 2
+    assert publisher.published[1:] == [(PRODUCT, "v1"), (PRODUCT, "v2")]
+    assert api.run(outbox.relay_once()) == 0
+
+
+def test_outbox_failure_after_a_committed_write_is_not_an_error(api, monkeypatch):
+    """ Without transactions the write has committed: it succeeds and is written through. """
+    async def broken_collection():
+        raise RuntimeError("outbox unavailable")
+    monkeypatch.setattr(outbox, "get_outbox_collection", broken_collection)
+    failed_before = outbox.relay_stats["insert_failed"]
+
+    status, product = api.request("POST", "/products", {"name": "kept", "price": 1, "stock": 1})
+    assert status == 201
+    status, _ = api.request("PUT", f"/products/{product['_id']}", {"name": "renamed"})
+    assert status == 200
+
+    entry = api.run(api.redis.hget(get_product_cache_key(product["_id"]), "v"))
+    assert b'"name":"renamed"' in entry
+    assert api.request("DELETE", f"/products/{product['_id']}")[0] == 204
+    assert outbox.relay_stats["insert_failed"] == failed_before + 3
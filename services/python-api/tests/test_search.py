@@ -0,0 +1,57 @@
+from app.search_index import PrefixIndex
+
+
+def create(api, *names):
+    for name in names:
+        status, _ = api.request("POST", "/products", {"name": name, "price": 1.0, "stock": 1})
+        assert status == 201
+
+
+def test_search_matches_name_prefix_case_insensitively(api):
+    create(api, "Blue Lamp", "blue mug", "Bluetooth speaker", "Green lamp")
+
+    status, body = api.request("GET", "/products/search?q=BLUE")
+
+    assert status == 200
+    assert [p["name"] for p in body["products"]] == ["Blue Lamp", "blue mug", "Bluetooth speaker"]
+    assert body["next_cursor"] is None
+
+
+def test_search_pages_by_limit(api):
+    create(api, "lamp a", "lamp b", "lamp c")
+
+    status, first = api.request("GET", "/products/search?q=lamp&limit=2")
+    assert status == 200
+    assert [p["name"] for p in first["products"]] == ["lamp a", "lamp b"]
+
+    status, second = api.request("GET", f"/products/search?q=lamp&limit=2&cursor={first['next_cursor']}")
+    assert status == 200
+    assert [p["name"] for p in second["products"]] == ["lamp c"]
+    assert second["next_cursor"] is None
+
+
+def test_search_and_autocomplete_reject_an_empty_query(api):
+    assert api.request("GET", "/products/search?q=")[0] == 422
+    assert api.request("GET", "/products/autocomplete?prefix=")[0] == 422
+
+
+def test_autocomplete_suggests_prefix_matches_up_to_the_limit(api):
+    create(api, "Desk", "desk lamp", "Deskmat", "Chair")
+
+    status, body = api.request("GET", "/products/autocomplete?prefix=desk&limit=2")
+
+    assert status == 200
+    assert [s["name"] for s in body["suggestions"]] == ["Desk", "desk lamp"]
+
+
+def test_prefix_index_suggest():
+    index = PrefixIndex()
+    index.load([("1", "Desk", 1), ("2", "desk lamp", 1), ("3", "Chair", 1)])
+
+    assert index.suggest("DESK", 10) == [{"id": "1", "name": "Desk"}, {"id": "2", "name": "desk lamp"}]
+    assert index.suggest("desk", 1) == [{"id": "1", "name": "Desk"}]
+    assert index.suggest("sofa", 10) == []
+
+    assert index.remove("1", version=0) is False # Older than the loaded version
+    assert index.upsert("1", "Sofa", version=2) is True
+    assert index.suggest("desk", 10) == [{"id": "2", "name": "desk lamp"}]
@@ -0,0 +1,93 @@
+""" Stock counters against direct stock writes and the flusher. """
+import asyncio
+
+import pytest
+
+from app import crud, stock
+from app.config import STOCK_FLUSH_LEASE_KEY
+
+
+@pytest.fixture
+def product_id(api):
+    status, body = api.request("POST", "/products", {"name": "stocked", "price": 1, "stock": 10})
+    assert status == 201
+    return body["_id"]
+
+
+def reserve(api, product_id, quantity):
+    return api.request("POST", f"/products/{product_id}/reserve", {"quantity": quantity})
+
+
+def mongo_stock(api, product_id):
+    return api.run(crud.get_stock_snapshot(product_id))["stock"]
+
+
+def test_reservations_are_flushed(api, product_id):
+    assert reserve(api, product_id, 3) == (200, {"id": product_id, "quantity": 3, "available": 7})
+    assert reserve(api, product_id, 8)[0] == 409
+
+    api.run(stock.flush_stock_once(api.redis))
+
+    assert mongo_stock(api, product_id) == 7
+
+
+def test_reservation_during_stock_write_applies_to_the_new_stock(api, product_id, monkeypatch):
+    update_product_by_id = crud.update_product_by_id
+
+    async def slow_update(*args, **kwargs):
+        await asyncio.sleep(0.05) # A reservation arrives while the write is in progress
+        return await update_product_by_id(*args, **kwargs)
+
+    monkeypatch.setattr(crud, "update_product_by_id", slow_update)
+
+    async def scenario():
+        write = asyncio.ensure_future(api.target.request("PUT", f"/products/{product_id}", b'{"stock": 50}'))
+        await asyncio.sleep(0.01)
+        reservation = await api.target.request("POST", f"/products/{product_id}/reserve", b'{"quantity": 5}')
+        return (await write)[0], reservation[0]
+
+    assert api.run(scenario()) == (200, 200)
+    assert reserve(api, product_id, 1)[1]["available"] == 44
+    api.run(stock.flush_stock_once(api.redis))
+    assert mongo_stock(api, product_id) == 44
+
+
+def test_stock_write_skips_the_batch_in_flight(api, product_id, monkeypatch):
+    reserve(api, product_id, 3)
+    # The flusher took the batch (-3) and failed to apply it before the stock is overwritten
+    apply_stock_deltas = crud.apply_stock_deltas
+
+    async def failing_apply(*args, **kwargs):
+        raise RuntimeError("Mongo unavailable")
+
+    monkeypatch.setattr(crud, "apply_stock_deltas", failing_apply)
+    with pytest.raises(RuntimeError):
+        api.run(stock.flush_stock_once(api.redis))
+    monkeypatch.setattr(crud, "apply_stock_deltas", apply_stock_deltas)
+
+    assert api.request("PUT", f"/products/{product_id}", {"stock": 50})[0] == 200
+    api.run(stock.flush_stock_once(api.redis)) # Retries the unfinished batch
+
+    assert mongo_stock(api, product_id) == 50
+    assert reserve(api, product_id, 1)[1]["available"] == 49
+
+
+def test_delete_drops_the_counter(api, product_id):
+    reserve(api, product_id, 1)
+    assert api.request("DELETE", f"/products/{product_id}")[0] == 204
+
+    assert reserve(api, product_id, 1)[0] == 404
+
+
+def test_shutdown_flush_needs_the_lease(api, product_id):
+    redis = api.redis
+    reserve(api, product_id, 2)
+    api.run(redis.set(STOCK_FLUSH_LEASE_KEY, "another-process"))
+
+    api.run(stock.flush_pending_stock())
+    assert mongo_stock(api, product_id) == 10
+
+    api.run(redis.delete(STOCK_FLUSH_LEASE_KEY))
+    api.run(stock.flush_pending_stock())
+    assert mongo_stock(api, product_id) == 8
+    assert api.run(redis.get(STOCK_FLUSH_LEASE_KEY)) is None # Released for the next flusher